@@ -2,6 +2,10 @@ import streamlit as st
 import topic_keywords
 import topic_sentence
 import json
+from concurrent.futures import FIRST_COMPLETED, wait
+from utils import metrics
+from utils.definitions import TOPIC_DEFINITIONS
+from utils.lazy import IMPORT_TIMES, preload_done, preload_in_background
 
 def load_json(uploaded_file):
     return json.load(uploaded_file)
@@ -15,6 +19,11 @@ st.set_page_config(
     layout="wide",
 )
 
+# Warm up BERTopic / scikit-learn / datamapplot while the sidebar is served
+preload_in_background()
+# Metrics log file / scrape endpoint, if configured (TOPIC_METRICS_LOG / TOPIC_METRICS_PORT)
+metrics.setup()
+
 # Tout le contenu dans la sidebar
 import streamlit as st
 
@@ -65,13 +74,8 @@ with st.sidebar:
     ⚠️ 5 thèmes sont déjà définis – vous devez **compléter leurs définitions**.  
     ⚠️ Chaque définition doit être **aussi précise que possible**.
     """)
-    topics = {
-        "Chambre": "Qualité, taille, propreté, confort et équipements de la chambre.",
-        "Emplacement": "Localisation de l’hôtel dans la ville, proximité des attractions et accessibilité.",
-        "Ambiance": "Atmosphère générale, décoration, style, charme ou modernité ressentie.",
-        "Rapport qualité-prix": "Adéquation entre le prix payé et l’expérience vécue.",
-        "Personnel": "Accueil, amabilité, professionnalisme et disponibilité du personnel."
-    }
+    # Shared with the batch classifier (python -m utils.classify)
+    topics = dict(TOPIC_DEFINITIONS)
 
     for topic, definition in topics.items():
         st.markdown(f"- **{topic}**")
@@ -95,15 +99,46 @@ with st.sidebar:
     Pour contribuer à l’étude, merci de renseigner vos réponses dans le formulaire suivant :  
     👉 [Remplir le Google Form](https://docs.google.com/forms/d/e/1FAIpQLScC-BQ7IFnl71rBlxpLRrOE7qD6coHpMl6kc3kjCeOgiMZB-Q/viewform?usp=header)
     """)
+
+def show_when_ready(panels):
+    """
+    Draw each (placeholder, job, show) panel as soon as its job finishes,
+    with the progress of its stages until then.
+    """
+    pending = list(panels)
+    while pending:
+        for panel in list(pending):
+            slot, job, show = panel
+            if job.done():
+                pending.remove(panel)
+                with slot.container():
+                    try:
+                        result = job.result()
+                    except Exception as e:
+                        st.error(f"Erreur lors de la préparation de la carte : {e}")
+                    else:
+                        with metrics.stage(f"{job.name}.show"):
+                            show(result)
+            else:
+                fraction, stage = job.progress()
+                slot.progress(fraction, text=f"⏳ {stage or 'En attente'}...")
+        if pending:
+            wait([job.future for _, job, _ in pending], timeout=0.5, return_when=FIRST_COMPLETED)
+
+
+# Both pipelines (load -> fit -> render) start in the background right away
+keywords_job, show_keywords = topic_keywords.app()  # votre fonction de visualisation
+sentences_job, show_sentences = topic_sentence.app()  # votre fonction de visualisation
+
 # Mise en page en deux colonnes
 col1, col2 = st.columns([3, 1])  # gauche large, droite étroite
 
 with col1:
     st.subheader("Regroupement des mots par thématique")
-    topic_keywords.app()  # votre fonction de visualisation
+    keywords_slot = st.empty()
 
     st.subheader("Regroupement des avis par thématique")
-    topic_sentence.app()  # votre fonction de visualisation
+    sentences_slot = st.empty()
 
 with col2:
     with st.expander("ℹ️ Mode d'emploi", expanded=True):
@@ -136,4 +171,30 @@ Liste des commentaires
 ### 💡 Conseil
 - Identifiez les **mots les plus fréquents** dans la visualisation *par mots*  
 - Observez le **contexte** d'un mot en utilisant le filtre de la visualisation *par avis*  
-""")
\ No newline at end of file
+""")
+
+show_when_ready([
+    (keywords_slot, keywords_job, show_keywords),
+    (sentences_slot, sentences_job, show_sentences),
+])
+
+# -------------------------
+# Performance panel (hidden, open the page with ?debug=1)
+# -------------------------
+if st.query_params.get("debug") == "1":
+    import pandas as pd
+
+    with st.expander("🛠️ Performances", expanded=True):
+        stages, caches, counters = metrics.snapshot()
+        st.markdown(f"**Mémoire résidente** : {metrics.rss_mb():.0f} Mo")
+        st.dataframe(pd.DataFrame(stages), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame(caches), hide_index=True, use_container_width=True)
+        st.json(counters)
+        st.markdown(f"**Imports en arrière-plan** : {'terminés' if preload_done() else 'en cours'}")
+        st.dataframe(
+            pd.DataFrame(
+                [{"module": name, "seconds": round(seconds, 3)} for name, seconds in IMPORT_TIMES.items()],
+                columns=["module", "seconds"],
+            ),
+            hide_index=True, use_container_width=True,
+        )
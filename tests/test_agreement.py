@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from sklearn.metrics import adjusted_rand_score, cohen_kappa_score, normalized_mutual_info_score
+
+from utils import agreement
+
+# Fleiss (1971) worked example: 10 items, 14 raters, 5 categories, kappa = 0.210
+FLEISS_TABLE = np.array([
+    [0, 0, 0, 0, 14], [0, 2, 6, 4, 2], [0, 0, 3, 5, 6], [0, 3, 9, 2, 0], [2, 2, 8, 1, 1],
+    [7, 7, 0, 0, 0], [3, 2, 6, 3, 0], [2, 5, 3, 2, 2], [6, 5, 2, 1, 0], [0, 2, 2, 3, 7],
+])
+
+
+@pytest.fixture
+def labels():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 6, (5, 500))
+    labels[1] = labels[0]                   # identical annotators
+    labels[2, :250] = labels[0, :250]       # half identical
+    return labels
+
+
+def test_ari_and_nmi_match_sklearn(labels):
+    reference = np.random.default_rng(1).integers(0, 9, labels.shape[1])
+    reference[:100] = labels[0, :100] * 2
+    tables = agreement.contingencies(labels, reference, 6, 18)
+    assert np.allclose(agreement.adjusted_rand_index(tables), [adjusted_rand_score(l, reference) for l in labels])
+    assert np.allclose(agreement.normalized_mutual_info(tables),
+                       [normalized_mutual_info_score(l, reference) for l in labels])
+
+
+def test_identical_partitions():
+    a = np.array([[0, 0, 1, 1, 2]])
+    tables = agreement.contingencies(a, np.array([3, 3, 0, 0, 1]), 3, 4)
+    assert np.allclose(agreement.adjusted_rand_index(tables), 1.0)
+    assert np.allclose(agreement.normalized_mutual_info(tables), 1.0)
+
+
+def test_pairwise_cohen_kappa_matches_sklearn(labels):
+    kappa = agreement.pairwise_cohen_kappa(labels, 6)
+    expected = [[cohen_kappa_score(a, b) for b in labels] for a in labels]
+    assert np.allclose(kappa, expected)
+
+
+def test_fleiss_kappa_known_table():
+    assert agreement.fleiss_kappa(FLEISS_TABLE) == pytest.approx(0.2099, abs=1e-4)
+
+
+def test_fleiss_sums_are_additive_over_chunks():
+    head, tail = agreement.fleiss_sums(FLEISS_TABLE[:4]), agreement.fleiss_sums(FLEISS_TABLE[4:])
+    summed = (head[0] + tail[0], head[1] + tail[1], head[2] + tail[2])
+    assert agreement.fleiss_kappa(sums=summed) == pytest.approx(agreement.fleiss_kappa(FLEISS_TABLE))
+
+
+def test_fleiss_kappa_from_pair_agreements(labels):
+    counts = np.stack([np.bincount(column, minlength=6) for column in labels.T])
+    marginals = np.stack([np.bincount(row, minlength=6) for row in labels])
+    sums = agreement.pair_fleiss_sums(agreement._pair_agreements(labels, 6), marginals)
+    assert agreement.fleiss_kappa(sums=sums) == pytest.approx(agreement.fleiss_kappa(counts))
+
+
+def test_label_chunk_slots():
+    # annotator 0 has two themes, annotator 1 one (padded)
+    vectors = np.zeros((2, 2, 2), dtype=np.float32)
+    vectors[0] = np.eye(2)
+    vectors[1, 0] = [0, 1]
+    limits = np.array([[0.5, 0.5], [0.5, np.inf]], dtype=np.float32)
+    labels = agreement.label_chunk(np.array([[1.0, 0.1], [0.1, 1.0], [-1.0, -1.0]]), vectors, limits)
+    assert labels.tolist() == [[1, 2, 0], [0, 1, 0]]
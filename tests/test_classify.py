@@ -0,0 +1,32 @@
+import numpy as np
+
+from utils.classify import score
+
+
+def test_score_best_matching_theme():
+    definitions = np.eye(3, dtype=np.float32)
+    embeddings = np.array([[1.0, 0.2, 0.0], [0.0, 0.1, 1.0]])
+    best, best_score, matches = score(embeddings, definitions, np.full(3, 0.5, dtype=np.float32))
+    assert best.tolist() == [0, 2]
+    assert np.allclose(best_score, [1 / np.sqrt(1.04), 1 / np.sqrt(1.01)])
+    assert matches.tolist() == [[True, False, False], [False, False, True]]
+
+
+def test_score_unmatched_row_has_no_score():
+    definitions = np.eye(3, dtype=np.float32)
+    # similar to every theme, but below every threshold
+    embeddings = np.array([[1.0, 1.0, 1.0], [1.0, 0.0, 0.0]])
+    thresholds = np.array([0.9, 0.9, 0.9], dtype=np.float32)
+    best, best_score, matches = score(embeddings, definitions, thresholds)
+    assert best.tolist() == [-1, 0]
+    assert np.isnan(best_score[0])
+    assert best_score[1] == 1.0
+    assert not matches[0].any()
+
+
+def test_score_per_theme_thresholds():
+    definitions = np.eye(2, dtype=np.float32)
+    embeddings = np.array([[0.8, 0.6]])
+    best, _, matches = score(embeddings, definitions, np.array([0.9, 0.5], dtype=np.float32))
+    assert best.tolist() == [1]
+    assert matches.tolist() == [[False, True]]
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+
+from utils import embeddings
+
+
+def _matrix(tmp_path, n=300, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(5, dim)) * 5
+    path = tmp_path / "emb.npy"
+    np.save(path, (centers[rng.integers(0, 5, n)] + rng.normal(size=(n, dim))).astype(np.float32))
+    return path
+
+
+def test_auto_prefers_checked_compact_format(tmp_path):
+    path = _matrix(tmp_path)
+    embeddings.convert(path, "int8")
+    # converted but not checked: the original stays in use
+    assert embeddings.resolve_format(path) == "float32"
+    assert embeddings.main(["check", str(path), "--format", "int8"]) == 0
+    assert embeddings.resolve_format(path) == "int8"
+    store = embeddings.get_store(path)
+    assert store.format == "int8"
+    np.testing.assert_allclose(store[:], np.load(path), atol=0.1)
+
+
+def test_check_record_goes_stale(tmp_path):
+    path = _matrix(tmp_path)
+    embeddings.convert(path, "float16")
+    assert embeddings.main(["check", str(path), "--format", "float16"]) == 0
+    assert embeddings.resolve_format(path) == "float16"
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert embeddings.resolve_format(path) == "float32"
+    assert embeddings.resolve_format(path, "float16") == "float16"
+
+
+def test_failed_check_is_not_recorded(tmp_path):
+    path = _matrix(tmp_path)
+    embeddings.convert(path, "int8")
+    assert embeddings.main(["check", str(path), "--format", "int8", "--min-agreement", "1.01"]) == 1
+    assert not embeddings.check_path(path, "int8").exists()
+    assert embeddings.resolve_format(path) == "float32"
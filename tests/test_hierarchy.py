@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from utils.hierarchy import MIN_K, TopicTree, build_tree
+
+
+def _tree(n=300, n_terms=12, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(6, 5)) * 10
+    cluster_space = centers[rng.integers(0, 6, n)] + rng.normal(size=(n, 5))
+    doc_terms = sparse.csr_matrix(rng.poisson(1.0, (n, n_terms)).astype(np.float64))
+    vocabulary = np.array([f"w{i}" for i in range(n_terms)], dtype=object)
+    coords = rng.normal(size=(n, 2)).astype(np.float32)
+    return build_tree(cluster_space, doc_terms, vocabulary, "ctfidf", coords, n_fine=20, max_k=10)
+
+
+def test_cut_is_nested_and_aligned():
+    tree = _tree()
+    assert tree.max_k == 10
+    for k in range(MIN_K, tree.max_k + 1):
+        view = tree.cut(k)
+        assert len(view.topics) == 300
+        assert set(np.unique(view.topics)) <= set(range(k))
+        assert sorted(view.labels) == list(range(k))
+    # every topic of the K cut lies inside a single topic of the K-1 cut
+    upper, lower = tree.cut(6).topics, tree.cut(5).topics
+    for t in np.unique(upper):
+        assert len(np.unique(lower[upper == t])) == 1
+
+
+def test_merged_at():
+    tree = _tree()
+    assert tree.merged_at(MIN_K) is None
+    merged = tree.merged_at(5)
+    assert len(merged) >= 2
+    lower = tree.coarse_map(4)
+    assert len({int(lower[np.flatnonzero(tree.coarse_map(5) == t)[0]]) for t in merged}) == 1
+
+
+def test_merged_at_identical_cuts():
+    # ties in the linkage: maxclust gives the same partition for K and K-1
+    cuts = np.array([[0, 0, 1, 1], [0, 0, 1, 1], [0, 1, 2, 2]])
+    tree = TopicTree(np.arange(4), np.zeros((3, 4)), cuts, sparse.csr_matrix(np.eye(4)),
+                     ["a", "b", "c", "d"], "frequency", np.zeros((4, 2)))
+    assert tree.merged_at(3) is None
+    assert tree.merged_at(4) == (0, 1)
+
+
+def test_build_tree_small_inputs():
+    rng = np.random.default_rng(0)
+    tree = build_tree(rng.normal(size=(6, 5)), sparse.csr_matrix(np.ones((6, 2))),
+                      np.array(["a", "b"], dtype=object), "frequency", np.zeros((6, 2)))
+    assert tree.max_k == MIN_K
+    assert len(tree.cut(MIN_K).topics) == 6
+    with pytest.raises(ValueError):
+        build_tree(np.zeros((1, 5)), sparse.csr_matrix(np.ones((1, 2))),
+                   np.array(["a", "b"], dtype=object), "frequency", np.zeros((1, 2)))
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from utils import ingest
+
+SENTENCES = [
+    ("positive", "Chambre propre"),
+    ("negative", "Petit déjeuner froid"),
+    ("positive", "Chambre propre"),        # duplicate of row 0
+    ("negative", "Chambre propre"),        # same text, other sentiment: kept
+    ("positive", "Personnel accueillant"),
+    ("negative", "Petit déjeuner froid"),  # duplicate of row 1, in a later chunk
+]
+
+
+def _write_sentences(path, rows):
+    path.write_text("sentiment\ttext\n" + "".join(f"{s}\t{t}\n" for s, t in rows), encoding="utf-8")
+    return path
+
+
+def test_dedup_keeps_first_rows_aligned_with_embeddings(tmp_path):
+    source = _write_sentences(tmp_path / "sentences.tsv", SENTENCES)
+    report = ingest.ingest("sentences", root=tmp_path / "columnar", chunk_size=2, source=source)
+    assert (report["rows"], report["kept"]) == (6, 4)
+
+    df = ingest.load_table("sentences", root=tmp_path / "columnar", source=source)
+    assert df.index.tolist() == [0, 1, 3, 4]
+    # row i of the embedding matrix belongs to line i of the raw file
+    embeddings = np.arange(len(SENTENCES), dtype=np.float32)[:, None] * np.ones((1, 3), dtype=np.float32)
+    for row, vector in zip(df.index, embeddings[df.index.to_numpy()]):
+        assert vector[0] == row
+        assert (df.at[row, "sentiment"], df.at[row, "text"]) == SENTENCES[row]
+    assert list(df["sentiment"].cat.categories) == ["positive", "negative"]
+
+
+def test_appended_rows_are_ingested_with_their_line_numbers(tmp_path):
+    source = _write_sentences(tmp_path / "sentences.tsv", SENTENCES)
+    root = tmp_path / "columnar"
+    first = ingest.table_metadata("sentences", root=root, source=source)
+    _write_sentences(source, SENTENCES + [("positive", "Vue sur la mer"), ("positive", "Chambre propre")])
+    assert not ingest.is_current("sentences", root=root, source=source)
+
+    df = ingest.load_table("sentences", ["text"], root=root, source=source)
+    assert df.index.tolist() == [0, 1, 3, 4, 6]
+    assert df.at[6, "text"] == "Vue sur la mer"
+    assert ingest.table_metadata("sentences", root=root, source=source)["digest"] != first["digest"]
+
+
+@pytest.mark.parametrize("content, message", [
+    ("sentiment\ttext\npositive\tok\nnegative\t\n", r"valeurs manquantes lignes \[3\]"),
+    ("sentiment\tbody\npositive\tok\n", "manquantes : text"),
+])
+def test_invalid_rows_are_rejected_not_dropped(tmp_path, content, message):
+    # dropping a row would shift every later row off its embedding
+    source = tmp_path / "sentences.tsv"
+    source.write_text(content, encoding="utf-8")
+    with pytest.raises(ingest.SchemaError, match=message):
+        ingest.load_table("sentences", root=tmp_path / "columnar", source=source)
+    assert not ingest.columnar_path("sentences", tmp_path / "columnar").exists()
+
+
+def test_keyword_counts_must_be_integers(tmp_path):
+    source = tmp_path / "keywords.csv"
+    source.write_text("item,count\nchambre,630\nvue,beaucoup\n", encoding="utf-8")
+    with pytest.raises(ingest.SchemaError, match="'count' doit être entier"):
+        ingest.ingest("keywords", root=tmp_path / "columnar", source=source)
+    source.write_text("item,count\nchambre,630\nvue,12\nchambre,3\n", encoding="utf-8")
+    df = ingest.load_table("keywords", root=tmp_path / "columnar", source=source)
+    assert df.index.tolist() == [0, 1]
+    assert df["count"].tolist() == [630, 12]
@@ -0,0 +1,111 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from utils import artifacts, ingest, online
+from utils.embeddings import get_store
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _model(seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.eye(4, 8, dtype=np.float32) * 5
+    topics = np.repeat(np.arange(4), 50)
+    embeddings = centers[topics] + rng.normal(scale=0.3, size=(len(topics), 8)).astype(np.float32)
+    texts = [f"chambre{t} vue{t} lit" for t in topics]
+    return online.OnlineTopicModel.from_fit(embeddings, topics, texts), centers
+
+
+def test_partial_fit_moves_centroids_towards_new_rows():
+    model, centers = _model()
+    before = model.centroids.copy()
+    counts = model.counts.copy()
+    # rows near topic 0 that also lean towards the 5th axis
+    new = centers[[0, 0, 0]] + np.array([0, 0, 0, 0, 3, 0, 0, 0], dtype=np.float32)
+    topics = model.partial_fit(new, ["chambre0 piscine"] * 3)
+    assert topics.tolist() == [0, 0, 0]
+    assert model.counts.tolist() == (counts + [3, 0, 0, 0]).tolist()
+    assert model.centroids[0, 4] > before[0, 4]
+    np.testing.assert_allclose(np.linalg.norm(model.centroids[0]), 1, rtol=1e-5)
+    np.testing.assert_array_equal(model.centroids[1:], before[1:])
+
+
+def test_needs_refit_on_drift():
+    model, centers = _model()
+    model.partial_fit(centers[[1, 2]], ["vue1", "vue2"])
+    assert model.drift() < 1.0
+    assert not model.needs_refit()
+    # rows far from every centroid
+    rng = np.random.default_rng(1)
+    model.partial_fit(-np.abs(rng.normal(size=(20, 8))).astype(np.float32), ["lit"] * 20)
+    assert model.drift() > online.DRIFT_THRESHOLD
+    assert model.needs_refit()
+
+
+def test_needs_refit_on_online_fraction():
+    model, centers = _model()
+    model.partial_fit(centers[np.repeat(np.arange(4), 60)], ["lit"] * 240)
+    assert model.drift() < online.DRIFT_THRESHOLD
+    assert model.online_fraction() > online.MAX_ONLINE_FRACTION
+    assert model.needs_refit()
+
+
+def test_state_round_trip(tmp_path):
+    model, centers = _model()
+    model.partial_fit(centers[[2]], ["vue2"])
+    model.save(tmp_path / "online.npz")
+    loaded = online.OnlineTopicModel.load(tmp_path / "online.npz")
+    np.testing.assert_allclose(loaded.centroids, model.centroids)
+    assert (loaded.n_online, loaded.drift()) == (1, pytest.approx(model.drift()))
+    assert loaded.labels() == model.labels()
+
+
+@pytest.fixture
+def data_copy(tmp_path, monkeypatch):
+    """
+    Working copy of the review data: every data path is relative to the current directory.
+    """
+    public = tmp_path / "public"
+    public.mkdir()
+    for name in ("sentences.tsv", "sentences_embeddings.npy", "sentences_embeddings.json"):
+        if not (ROOT / "public" / name).exists():
+            pytest.skip(f"public/{name} missing (run `python -m utils.encode`)")
+        shutil.copy(ROOT / "public" / name, public / name)
+    if (ROOT / "public" / ".embed_cache").exists():
+        shutil.copytree(ROOT / "public" / ".embed_cache", public / ".embed_cache")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_update_sentences_appends_aligned_rows(data_copy):
+    from sklearn.cluster import KMeans
+
+    root = data_copy / "artifacts"
+    df = ingest.load_table("sentences")
+    embeddings = get_store("public/sentences_embeddings.npy")[df.index.to_numpy()]
+    topics = KMeans(n_clusters=8, n_init=1, random_state=0).fit_predict(embeddings)
+    coords = np.random.default_rng(0).normal(size=(len(df), 2)).astype(np.float32)
+    labels = {t: f"topic {t}" for t in range(8)}
+    first = artifacts.save_artifacts("sentences", artifacts.ViewArtifacts(topics, labels, coords), root=root)
+    assert artifacts.load_artifacts("sentences", root=root).version == first.name
+
+    new = data_copy / "new.tsv"
+    new.write_text("sentiment\ttext\npositive\tLa piscine chauffée était parfaite\n"
+                   "negative\tLe parking est beaucoup trop cher\n"
+                   # already in the table: not appended again
+                   f"{df['sentiment'].iloc[0]}\t{df['text'].iloc[0]}\n", encoding="utf-8")
+    report = online.update_sentences(new, refit=False, root=root)
+    assert report["n_new"] == 2 and report["refit"] is False
+
+    table = ingest.load_table("sentences", ["text"])
+    assert len(table) == len(df) + 2
+    assert table["text"].iloc[-2:].tolist() == ["La piscine chauffée était parfaite", "Le parking est beaucoup trop cher"]
+    assert len(get_store("public/sentences_embeddings.npy")) == table.index[-1] + 1
+    built = artifacts.load_artifacts("sentences", root=root)
+    assert built.version != first.name
+    assert len(built.topics) == len(built.coords) == len(table)
+    np.testing.assert_array_equal(built.topics[:len(df)], topics)
+    assert (root / "sentences" / built.version / "online.npz").exists()
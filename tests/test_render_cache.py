@@ -0,0 +1,71 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from utils.render_cache import RenderCache, render_key
+
+
+def test_concurrent_callers_render_once(tmp_path):
+    cache = RenderCache(tmp_path)
+    calls = []
+    start = threading.Barrier(8)
+
+    def render():
+        calls.append(1)
+        time.sleep(0.2)
+        return "<html>map</html>"
+
+    results = []
+
+    def worker():
+        start.wait()
+        results.append(cache.get_or_render("k", render))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == ["<html>map</html>"] * 8
+    assert cache._key_locks == {}
+
+
+def test_failed_render_releases_key_lock(tmp_path):
+    cache = RenderCache(tmp_path)
+
+    def render():
+        raise RuntimeError("render failed")
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_render("k", render)
+    assert cache._key_locks == {}
+    assert cache.get("k") is None
+    # the next caller renders again instead of waiting on a stale lock
+    assert cache.get_or_render("k", lambda: "<html>ok</html>") == "<html>ok</html>"
+
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    RenderCache(tmp_path).get_or_render("k", lambda: "<html>map</html>")
+    fresh = RenderCache(tmp_path)
+    assert fresh.get_or_render("k", lambda: pytest.fail("rendered again")) == "<html>map</html>"
+    # without a disk tier nothing outlives the instance
+    RenderCache(None).put("other", "<html></html>")
+    assert RenderCache(None).get("other") is None
+
+
+def test_memory_tier_is_bounded(tmp_path):
+    cache = RenderCache(None, max_bytes=10)
+    cache.put("a", "x" * 6)
+    cache.put("b", "y" * 6)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 6
+
+
+def test_render_key_depends_on_content():
+    topics = np.array([0, 1, 1])
+    assert render_key("v1", topics, {"a": 1}) == render_key("v1", topics.copy(), {"a": 1})
+    assert render_key("v1", topics, {"a": 1}) != render_key("v1", np.array([0, 1, 0]), {"a": 1})
+    assert render_key("v1", topics) != render_key("v2", topics)
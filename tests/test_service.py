@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import numpy as np
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from utils import artifacts, metrics
+from utils.encode import TfidfSvdEncoder
+from utils.service import ServiceView, make_app
+
+DOCS = [
+    "chambre propre et lit confortable", "lit confortable chambre calme", "chambre calme et propre",
+    "petit déjeuner copieux", "déjeuner copieux et varié", "buffet du petit déjeuner varié",
+]
+
+
+def _view(name, encoder):
+    fitted = TfidfSvdEncoder(n_components=4).fit(DOCS * 3)
+    built = artifacts.ViewArtifacts(np.array([0, 0, 0, 1, 1, 1]), {0: "chambre", 1: "déjeuner"},
+                                    np.zeros((6, 2), dtype=np.float32), version=f"{name}-test")
+    # embedding rows 10, 12, ... as left by de-duplication
+    return ServiceView(name, np.arange(10, 22, 2), DOCS, fitted.encode(DOCS), built,
+                       fitted if encoder else None)
+
+
+class ServiceTest(AsyncHTTPTestCase):
+    def get_app(self):
+        return make_app({"reviews": _view("reviews", True), "keywords": _view("keywords", False)},
+                        max_batch=64, max_wait_ms=200)
+
+    def request(self, path, body=None):
+        response = self.fetch(path, method="GET" if body is None else "POST",
+                              body=None if body is None else json.dumps(body))
+        return response.code, json.loads(response.body)
+
+    def test_topics_and_documents(self):
+        code, payload = self.request("/views/reviews/topics")
+        assert code == 200
+        assert payload["topics"] == [{"topic": 0, "label": "chambre", "size": 3},
+                                     {"topic": 1, "label": "déjeuner", "size": 3}]
+        assert self.request("/views/reviews/documents/14")[1]["text"] == DOCS[2]
+        assert self.request("/views/reviews/documents/11")[0] == 404
+        assert self.request("/views/nope/topics")[0] == 404
+
+    def test_bad_integers_are_rejected(self):
+        for body in ({"row": 10, "k": 0}, {"row": 10, "k": "ten"}, {"row": 10, "k": 2.5},
+                     {"row": 10, "k": True}, {"row": -10}, {"row": "x"}):
+            code, payload = self.request("/views/reviews/search", body)
+            assert code == 400, body
+            assert "must be an integer" in payload["error"]
+        for limit in ("0", "-1", "abc"):
+            assert self.request(f"/views/reviews/topics/0?limit={limit}")[0] == 400
+        assert self.request("/views/reviews/search", [1, 2])[0] == 400
+        assert self.request("/views/reviews/search", {"k": 3})[0] == 400
+        assert self.request("/views/reviews/assign", {"texts": "lit"})[0] == 400
+
+    def test_row_search(self):
+        code, payload = self.request("/views/reviews/search", {"row": 10, "k": 2})
+        assert code == 200
+        results = payload["results"]
+        assert len(results) == 2
+        assert all(r["row"] != 10 and r["topic"] == 0 for r in results)
+        assert results[0]["score"] >= results[1]["score"]
+        assert self.request("/views/reviews/search", {"row": 11})[0] == 404
+        # views without an encoder still answer row searches
+        assert self.request("/views/keywords/search", {"row": 10, "k": 2})[0] == 200
+
+    def test_text_queries_need_an_encoder(self):
+        code, payload = self.request("/views/keywords/search", {"text": "lit"})
+        assert code == 503
+        assert "no encoder" in payload["error"]
+        assert self.request("/views/keywords/assign", {"texts": ["lit"]})[0] == 503
+        code, payload = self.request("/views/reviews/search", {"text": "petit déjeuner", "k": 3})
+        assert code == 200
+        assert [r["topic"] for r in payload["results"]] == [1, 1, 1]
+
+    @gen_test
+    async def test_concurrent_assigns_share_a_batch(self):
+        before = metrics.snapshot()[2]
+        requests = [["chambre propre", "déjeuner copieux"]] * 5
+        responses = await asyncio.gather(*(
+            self.http_client.fetch(self.get_url("/views/reviews/assign"), method="POST",
+                                   body=json.dumps({"texts": texts}))
+            for texts in requests
+        ))
+        after = metrics.snapshot()[2]
+        for response in responses:
+            results = json.loads(response.body)["results"]
+            assert [r["label"] for r in results] == ["chambre", "déjeuner"]
+        batches = after.get("service.reviews.assign.batches", 0) - before.get("service.reviews.assign.batches", 0)
+        items = after.get("service.reviews.assign.items", 0) - before.get("service.reviews.assign.items", 0)
+        assert (batches, items) == (1, 10)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from utils.similarity import SimilarityIndex
+
+
+def _clustered(n_clusters=4, per_cluster=3, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    return np.concatenate([c + 0.01 * rng.normal(size=(per_cluster, dim)) for c in centers])
+
+
+def test_flat_most_similar_excludes_row():
+    embeddings = _clustered()
+    index = SimilarityIndex(embeddings)
+    idx, scores = index.most_similar(0, k=5)
+    assert len(idx) == 5
+    assert 0 not in idx
+    assert np.all(np.diff(scores) <= 0)
+
+
+def test_ivf_most_similar_drops_padding():
+    # one probed list holds 3 rows: fewer than k + 1, so the search pads with -1
+    embeddings = _clustered()
+    index = SimilarityIndex(embeddings, n_lists=4)
+    idx, scores = index.search(embeddings[0], k=6, n_probe=1)
+    assert (idx == -1).any()
+
+    idx, scores = index.most_similar(0, k=5, n_probe=1)
+    assert len(idx) > 0
+    assert np.all(idx >= 0)
+    assert 0 not in idx
+    assert np.all(np.isfinite(scores))
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_sweep_cli_exits(tmp_path):
+    # fresh reduction cache: UMAP runs in the parent before the process pool starts
+    env = dict(os.environ, TOPIC_ARTIFACTS_DIR=str(tmp_path / "artifacts"),
+               TOPIC_REDUCTIONS_DIR=str(tmp_path / "reductions"))
+    result = subprocess.run(
+        [sys.executable, "-m", "utils.sweep", "keywords", "--k", "5", "10", "--min-freq", "5", "--workers", "2"],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=600,
+    )
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "artifacts" / "sweeps" / "keywords" / "results.json").exists()
+    assert "n_topics" in result.stdout
@@ -2,234 +2,212 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
-from bertopic import BERTopic
-from collections import Counter, defaultdict
 import streamlit.components.v1 as components
+import altair as alt
+from utils import artifacts, lod, metrics, modeling
+from utils.datasets import HASH_FUNCS, load_dataset
+from utils.hierarchy import load_tree
+from utils.jobs import get_job_registry
+from utils.render_cache import get_render_cache
+from utils.similarity import SimilarityIndex
+from utils.sweep import load_sweep
 
-def app():
-
-    # -------------------------
-    # Caching helpers
-    # -------------------------
-    @st.cache_data(ttl=60*60*24)  # cache 24h; adjust as needed
-    def load_embeddings(path):
-        return np.load(path)
-
-    @st.cache_data(ttl=60*60*24)
-    def load_keywords(path):
-        return pd.read_csv(path)
-
-    @st.cache_resource
-    def fit_topic_model(filtered_keywords, filtered_embeddings, n_topics):
-        """
-        Fit BERTopic with a KMeans clusterer.
-        This is cached so re-fitting only happens when inputs/parameters change.
-        """
-        kmeans = KMeans(n_clusters=n_topics, random_state=42)
-        topic_model = BERTopic(hdbscan_model=kmeans, language='french')
-        topics, probs = topic_model.fit_transform(filtered_keywords, filtered_embeddings)
-        return topic_model, topics
-
-    # -------------------------
-    # Paths (change if needed)
-    # -------------------------
-    EMBEDDINGS_PATH = "public/keywords_embeddings.npy"
-    KEYWORDS_PATH = "public/keywords.csv"
 
+def _timed_render(view, docs, int_datamap_kwds):
+    with metrics.stage("keywords.render_datamap"):
+        return modeling.render_datamap(view.coords, view.topics, view.labels, docs, int_datamap_kwds)
 
-    MIN_FREQ = 5
-    N_TOPICS = 30
 
-    # -------------------------
-    # UI - Sidebar (paramètres)
-    # -------------------------
-    # with st.sidebar:
-    #     st.header("⚙️ Paramètres - Mot-Clé")
-    #     n_topics = st.slider("Nombre de topics (K)", min_value=2, max_value=50, value=N_TOPICS, step=1)
-    #     min_freq = st.slider("Fréquence minimale (filtre)", min_value=1, max_value=100, value=MIN_FREQ, step=1)
-    #     st.markdown("---")
-    #     # st.caption("Chargement et modèle sont mis en cache pour éviter des recalculs inutiles.")
-    #     # st.markdown("**Astuce** : changez K ou la fréquence minimale pour recomputer les topics.")
-
-    # -------------------------
-    # Chargement des données
-    # -------------------------
-    try:
-        embeddings = load_embeddings(EMBEDDINGS_PATH)
-        keywords_df = load_keywords(KEYWORDS_PATH)
-    except Exception as e:
-        st.error(f"Erreur lors du chargement des fichiers : {e}")
-        st.stop()
-
-    # Validate
-    if not {"item", "count"}.issubset(keywords_df.columns):
-        st.error("Le fichier keywords.csv doit contenir les colonnes 'item' et 'count'.")
-        st.stop()
+def pipeline(job, dataset, n_topics, min_freq, sweep=None, tree=None):
+    """
+    Load -> fit -> render of the keyword map. Runs in a worker thread (see
+    utils.jobs), so it must not call Streamlit; errors are raised and shown
+    by the page. ``dataset`` is the keywords handle (utils.datasets).
+    """
+    job.stage("load")
+    # Validated, de-duplicated columnar copy of keywords.csv, indexed by embedding row
+    keywords_df, embeddings = dataset.table, dataset.embeddings
 
     # -------------------------
     # Filtrage par fréquence
     # -------------------------
-    df_filtered = keywords_df[keywords_df['count'] >= MIN_FREQ]
-    filtered_indexes = df_filtered.index.tolist()
+    df_filtered = keywords_df[keywords_df['count'] >= min_freq]
+    filtered_indexes = df_filtered.index.to_numpy()
     if len(filtered_indexes) == 0:
-        st.warning("Aucun mot-clé après application du filtre de fréquence. Réduisez le seuil.")
-        st.stop()
+        raise ValueError("Aucun mot-clé après application du filtre de fréquence. Réduisez le seuil.")
 
-    filtered_embeddings = embeddings[filtered_indexes]
+    with metrics.stage("keywords.read_embeddings"):
+        filtered_embeddings = embeddings[filtered_indexes]
     filtered_keywords = df_filtered['item'].tolist()
     filtered_freq = df_filtered['count'].tolist()
 
     # -------------------------
-    # Fit model (cached)
+    # Tree cut, sweep or prebuilt model; fit only as a fallback
+    # -------------------------
+    job.stage("fit")
+    if tree is not None:
+        with metrics.stage("keywords.tree_cut"):
+            view = tree.cut(n_topics)
+    else:
+        view = None
+        if sweep is not None and (n_topics, min_freq) != (modeling.N_TOPICS, modeling.MIN_FREQ):
+            view = sweep.get(n_topics, min_freq)
+        elif (n_topics, min_freq) == (modeling.N_TOPICS, modeling.MIN_FREQ):
+            with metrics.stage("keywords.load_artifacts"):
+                view = artifacts.load_artifacts("keywords")
+        if view is None or len(view.topics) != len(filtered_keywords):
+            view = artifacts.build_keywords(filtered_keywords, filtered_embeddings, filtered_freq, n_topics,
+                                            artifacts.keywords_doc_terms(min_freq))
+
+    job.stage("render")
+    int_datamap_kwds = {
+        "min_fontsize": 12,
+        "max_fontsize": 18,
+        "marker_size_array": filtered_freq,
+        "point_radius_min_pixels": 4,
+        "point_radius_max_pixels": 40,
+        "initial_zoom_fraction": 0.4,
+    }
+    # Rendered HTML is cached across reruns and sessions (memory + disk);
+    # large corpora get the level-of-detail map (tiles written once, on disk).
+    # Everything the map shows follows from the dataset and these parameters
+    with metrics.stage("keywords.render_key"):
+        datamap_key = dataset.key(
+            "datamap", view.version, n_topics, min_freq,
+            {k: v for k, v in int_datamap_kwds.items() if k != "marker_size_array"},
+        )
+    if lod.use_lod(len(filtered_keywords)):
+        with metrics.stage("keywords.render_lod"):
+            datamap_html = lod.render_lod(datamap_key, view.coords, view.topics, view.labels, filtered_keywords,
+                                          int_datamap_kwds)
+    else:
+        datamap_html = get_render_cache().get_or_render(
+            datamap_key,
+            lambda: _timed_render(view, filtered_keywords, int_datamap_kwds),
+        )
+    return {"keywords_df": keywords_df, "view": view, "datamap_html": datamap_html}
+
+
+def app():
+    """
+    Sidebar of the keyword map and submission of its background job.
+    Returns ``(job, show)``; ``show(result)`` draws the map once the job is done.
+    """
+
+    # -------------------------
+    # Caching helpers
     # -------------------------
-    with st.spinner("🧠 Ajustement du modèle BERTopic (cela peut prendre un moment la première fois)..."):
-        topic_model, topics = fit_topic_model(filtered_keywords, filtered_embeddings, N_TOPICS)
-
-    # Build topic -> Counter of words (fréquences)
-    topic_words = defaultdict(Counter)
-    for word, freq, label in zip(filtered_keywords, filtered_freq, topics):
-        topic_words[label][word] = freq
-
-    # Create readable labels (top 3 mots)
-    topic_labels = {label: ' '.join(w for w, _ in c.most_common(3)) for label, c in topic_words.items()}
-    if len(topic_labels) > 0:
-        try:
-            topic_model.set_topic_labels(topic_labels)
-        except Exception:
-            # some BERTopic versions may differ; ignore if it fails
-            pass
+    @metrics.cached(st.cache_resource, "keywords.load_similarity_index", hash_funcs=HASH_FUNCS)
+    def load_similarity_index(dataset):
+        # Rows of the ingested table, normalized once; each query is a single
+        # matrix-vector product + argpartition. Keyed by the dataset digest
+        return SimilarityIndex(dataset.embeddings[dataset.rows])
+
+    @metrics.cached(st.cache_resource, "keywords.load_sweep_results")
+    def load_sweep_results():
+        # Precomputed (K, min_freq) grid, None if no sweep was run
+        return load_sweep("keywords")
+
+    @metrics.cached(st.cache_resource, "keywords.load_topic_tree")
+    def load_topic_tree():
+        # Hierarchical tree from `python -m utils.hierarchy keywords`, cut at any K in milliseconds
+        return load_tree("keywords")
 
     # -------------------------
-    # Layout principal
+    # Dataset: table + embeddings, content digest computed once (utils.datasets)
     # -------------------------
-    # st.title("🧠 Explorateur BERTopic — mots-clés")
-    # st.markdown(
-    #     "Explorez des topics créés à partir d'embeddings de mots-clés. "
-    #     "Utilisez le panneau de gauche pour ajuster les paramètres."
-    # )
-
-    # Two-column main area: left = carte interactive, right = résumé
-
-    
-        fig_interactive = topic_model.visualize_document_datamap(
-            docs=filtered_keywords,
-            embeddings=filtered_embeddings,
-            interactive=True,
-            enable_search=True,
-            custom_labels=True,
-            int_datamap_kwds={
-                "min_fontsize": 12,
-                "max_fontsize": 18,
-                "marker_size_array": filtered_freq,
-                "point_radius_min_pixels": 4,
-                "point_radius_max_pixels": 40,
-                "initial_zoom_fraction": 0.4,
-            }
-        )
-        components.html(str(fig_interactive), height=700)
-
-
-       
-
-        # st.subheader("☁️ Nuages de mots par topic")
-        # # Display wordclouds in rows of 5
-        # def display_wordclouds(topic_words_map, cols_per_row=5):
-        #     topics = sorted(topic_words_map.items(), key=lambda x: x[0])
-        #     if len(topics) == 0:
-        #         st.warning("Aucun topic à afficher.")
-        #         return
-        #     # chunk into rows
-        #     for i in range(0, len(topics), cols_per_row):
-        #         row = topics[i:i+cols_per_row]
-        #         cols = st.columns(cols_per_row)
-        #         for j, (label, counter) in enumerate(row):
-        #             col = cols[j]
-        #             with col:
-        #                 wc = WordCloud(width=300, height=200, background_color='white', min_font_size=12)
-        #                 wc.generate_from_frequencies(counter)
-        #                 fig, ax = plt.subplots(figsize=(3,2))
-        #                 ax.imshow(wc, interpolation='bilinear')
-        #                 ax.axis('off')
-        #                 title = topic_labels.get(label, f"Topic {label}")
-        #                 ax.set_title(title, fontsize=10)
-        #                 st.pyplot(fig)
-        #                 plt.close(fig)
-
-        # display_wordclouds(topic_words, cols_per_row=5)
-
-    # with right_col:
-    #     st.subheader("🔎 Résumé rapide")
-    #     st.markdown(f"- **Embeddings chargés** : {embeddings.shape[0]} éléments")
-    #     st.markdown(f"- **Mots-clés après filtre** : {len(filtered_keywords)}")
-    #     st.markdown(f"- **Nombre de topics (K)** : {N_TOPICS}")
-    #     st.markdown("---")
-
-    #st.markdown("---")
+    dataset = load_dataset("keywords")
+
+
+    MIN_FREQ = modeling.MIN_FREQ
+    N_TOPICS = modeling.N_TOPICS
 
     # -------------------------
-    # Section similaire (autocomplete)
+    # UI - Sidebar (paramètres)
     # -------------------------
-    # st.subheader("🔍 Trouver les tokens les plus similaires")
-    # st.markdown("Recherchez un token via la liste (autocomplétion). Le calcul de similarité n'entraîne pas la recomputation du modèle.")
-
-    # # Use a searchable selectbox for autocomplete-like behavior
-    # token_choice = st.selectbox(
-    #     "Sélectionnez un token (commencez à taper pour rechercher) :",
-    #     options=sorted(keywords_df['item'].unique()),
-    #     index=0 if len(keywords_df)>0 else None,
-    #     help="Selectionnez un mot-clé existant"
-    # )
-
-    # if token_choice:
-    #     # compute similarity against the full embeddings (not only filtered) so results are global
-    #     idx_full = keywords_df[keywords_df['item'] == token_choice].index
-    #     if len(idx_full) == 0:
-    #         st.error("Token introuvable dans la liste des mots-clés.")
-    #     else:
-    #         idx_full = idx_full[0]
-    #         token_emb = embeddings[idx_full].reshape(1, -1)
-    #         sims = cosine_similarity(token_emb, embeddings)[0]
-    #         sim_df = pd.DataFrame({
-    #             'item': keywords_df['item'],
-    #             'similarity': sims
-    #         })
-    #         sim_df = sim_df[sim_df['item'] != token_choice]
-    #         top10 = sim_df.sort_values(by="similarity", ascending=False).head(10).reset_index(drop=True)
-
-    #         # Chart + table
-    #         st.markdown(f"**Top 10 tokens similaires à** : `{token_choice}`")
-    #         bar = alt.Chart(top10).mark_bar().encode(
-    #             x=alt.X('similarity:Q', title='Similarité (cosinus)', scale=alt.Scale(domain=[0,1])),
-    #             y=alt.Y('item:N', sort='-x', title='Token similaire'),
-    #             tooltip=['item', alt.Tooltip('similarity:Q', format='.4f')]
-    #         ).properties(height=360, width=700)
-    #         st.altair_chart(bar, use_container_width=True)
-    
-
-        # export_data = {}
-        # for _, counter in topic_words.items():
-        #     # topic = concaténation des 3 premiers mots
-        #     topic = '.'.join(x for x, _ in counter.most_common(3))
-        #     # liste de tous les mots du topic
-        #     words = [w for w, f in counter.most_common()]
-        #     export_data[topic] = words
-
-        # # Construction du CSV manuellement
-        # lines = []
-        # for topic, words in export_data.items():
-        #     line = ",".join([topic] + words)
-        #     lines.append(line)
-
-        # csv_str = "\n".join(lines)
-
-        # # Bouton de téléchargement CSV
-        # st.download_button(
-        #     label="📥 Télécharger topics en CSV",
-        #     data=csv_str,
-        #     file_name="topics_keywords.csv",
-        #     mime="text/csv"
-        # )
-
-    
-    #st.caption("Application développée pour l'exploration interactive de topics — modifiez K ou le filtre de fréquence pour recalculer les topics (opération coûteuse).")
+    # Only configurations precomputed by `python -m utils.sweep keywords` or by
+    # `python -m utils.hierarchy keywords` are offered, so moving a slider never triggers a fit.
+    n_topics, min_freq = N_TOPICS, MIN_FREQ
+    sweep = load_sweep_results()
+    tree = load_topic_tree()
+    use_tree = False
+    if sweep is not None or tree is not None:
+        with st.sidebar:
+            st.header("⚙️ Paramètres - Mot-Clé")
+            if tree is not None:
+                use_tree = st.toggle("Regroupement hiérarchique", key="keywords_tree",
+                                     help="Découpe un arbre de topics précalculé (fréquence minimale par défaut).")
+            if use_tree:
+                n_topics = st.slider("Nombre de topics (K)", 2, tree.max_k, min(N_TOPICS, tree.max_k), key="keywords_tree_k")
+            elif sweep is not None:
+                # The default configuration is always available (prebuilt artifacts);
+                # other K values only where they were swept for the chosen frequency
+                freq_options = sorted({*sweep.min_freq_values(), MIN_FREQ})
+                min_freq = st.select_slider("Fréquence minimale (filtre)", options=freq_options,
+                                            value=MIN_FREQ, key="keywords_min_freq")
+                k_options = sorted({*sweep.n_topics_values(min_freq), *([N_TOPICS] if min_freq == MIN_FREQ else [])})
+                n_topics = st.select_slider("Nombre de topics (K)", options=k_options,
+                                            value=N_TOPICS if N_TOPICS in k_options else k_options[-1],
+                                            key=f"keywords_k_f{min_freq}")
+                with st.expander("📈 Qualité des configurations"):
+                    st.dataframe(sweep.table(), hide_index=True, use_container_width=True)
+            st.markdown("---")
+
+    # -------------------------
+    # Background job: load -> fit -> render, shared by every session
+    # -------------------------
+    job = get_job_registry().submit(
+        ("keywords", dataset.digest, n_topics, min_freq, use_tree),
+        pipeline, dataset, n_topics, min_freq, sweep=sweep, tree=tree if use_tree else None,
+    )
+
+    def show(result):
+        keywords_df, view = result["keywords_df"], result["view"]
+        if use_tree:
+            merged = tree.merged_at(n_topics)
+            if merged is not None:
+                st.sidebar.caption(
+                    f"À K={n_topics - 1}, « {view.labels[merged[0]]} » et « {view.labels[merged[1]]} » fusionnent."
+                )
+
+        # -------------------------
+        # Layout principal
+        # -------------------------
+        components.html(result["datamap_html"], height=700)
+
+        # -------------------------
+        # Section similaire (autocomplete)
+        # -------------------------
+        with st.expander("🔍 Trouver les tokens les plus similaires"):
+            st.markdown("Recherchez un token via la liste (autocomplétion). Le calcul de similarité n'entraîne pas la recomputation du modèle.")
+
+            # Use a searchable selectbox for autocomplete-like behavior
+            token_choice = st.selectbox(
+                "Sélectionnez un token (commencez à taper pour rechercher) :",
+                options=dataset.memo("item_options", lambda: sorted(keywords_df['item'].unique())),
+                index=None,
+                help="Selectionnez un mot-clé existant"
+            )
+
+            if token_choice:
+                # search against the full embeddings (not only filtered) so results are global
+                idx_full = np.flatnonzero(keywords_df['item'].to_numpy() == token_choice)
+                if len(idx_full) == 0:
+                    st.error("Token introuvable dans la liste des mots-clés.")
+                else:
+                    neighbours, sims = load_similarity_index(dataset).most_similar(int(idx_full[0]), k=10)
+                    top10 = pd.DataFrame({
+                        'item': keywords_df['item'].to_numpy()[neighbours],
+                        'similarity': sims
+                    })
+
+                    # Chart + table
+                    st.markdown(f"**Top 10 tokens similaires à** : `{token_choice}`")
+                    bar = alt.Chart(top10).mark_bar().encode(
+                        x=alt.X('similarity:Q', title='Similarité (cosinus)', scale=alt.Scale(domain=[0,1])),
+                        y=alt.Y('item:N', sort='-x', title='Token similaire'),
+                        tooltip=['item', alt.Tooltip('similarity:Q', format='.4f')]
+                    ).properties(height=360, width=700)
+                    st.altair_chart(bar, use_container_width=True)
+
+    return job, show
@@ -2,141 +2,215 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
-from bertopic import BERTopic
-from collections import Counter, defaultdict
 import streamlit.components.v1 as components
-from sklearn.feature_extraction.text import CountVectorizer
-from utils import STOPWORDS
+from utils import artifacts, lod, metrics, modeling, preprocess
+from utils.datasets import HASH_FUNCS, load_dataset
+from utils.hierarchy import load_tree
+from utils.jobs import get_job_registry
+from utils.render_cache import get_render_cache
+from utils.similarity import SimilarityIndex
+from utils.sweep import load_sweep
+from utils.topic_summary import sentiment_counts
 
 
-STOPWORDS = list(STOPWORDS)
+def _timed_render(view, docs, int_datamap_kwds):
+    with metrics.stage("sentences.render_datamap"):
+        return modeling.render_datamap(view.coords, view.topics, view.labels, docs, int_datamap_kwds)
 
 
-def app():
-
-    # -------------------------
-    # Caching helpers
-    # -------------------------
-    @st.cache_data(ttl=60*60*24)
-    def load_embeddings(path):
-        return np.load(path)
-
-    @st.cache_data(ttl=60*60*24)
-    def load_keywords(path):
-        return pd.read_csv(path, sep='\t')
-
-    @st.cache_resource
-    def fit_topic_model(keywords, embeddings, n_topics):
-        kmeans = KMeans(n_clusters=n_topics, random_state=42)
-        topic_model = BERTopic(
-            hdbscan_model=kmeans,
-            language='french',
-            vectorizer_model=CountVectorizer(stop_words=STOPWORDS, strip_accents='ascii')
-        )
-        topics, _ = topic_model.fit_transform(keywords, embeddings)
-        return topic_model, topics
+def pipeline(job, dataset, k_all, sweep=None, tree=None):
+    """
+    Load -> fit -> render of the review map. Runs in a worker thread (see
+    utils.jobs), so it must not call Streamlit. ``dataset`` is the reviews
+    handle (utils.datasets).
+    """
+    job.stage("load")
+    # Validated, de-duplicated columnar copy of sentences.tsv, indexed by embedding row
+    df_all, embeddings = dataset.table, dataset.embeddings
 
     # -------------------------
-    # Paths
+    # Fit model
     # -------------------------
-    EMBEDDINGS_PATH = "public/sentences_embeddings.npy"
-    SENTENCES_PATH = "public/sentences.tsv"
+    job.stage("fit")
+    if tree is not None:
+        with metrics.stage("sentences.tree_cut"):
+            view = tree.cut(k_all)
+    else:
+        view = None
+        if sweep is not None and k_all != modeling.K_ALL:
+            view = sweep.get(k_all)
+        elif k_all == modeling.K_ALL:
+            with metrics.stage("sentences.load_artifacts"):
+                view = artifacts.load_artifacts("sentences")
+        if view is None or len(view.topics) != len(df_all):
+            view = artifacts.build_sentences(df_all["text"].tolist(), embeddings[df_all.index.to_numpy()], k_all,
+                                             preprocess.load_doc_terms("sentences"))
 
     # -------------------------
-    # Sidebar
-    # -------------------------
-    # with st.sidebar:
-    #     st.header("⚙️ Paramètres - Reviews")
-    #     k_all = st.slider("Nombre de topics (K)", min_value=2, max_value=50, value=25, step=1)
-    K_ALL = 30
-    # -------------------------
-    # Load data
+    # Interactive Map
     # -------------------------
+    job.stage("render")
+    # hover texts and marker sizes only depend on the data: built once per dataset
+    hover_text = dataset.memo("hover_text", lambda: [
+        f"{'🙂' if sent == 'positif' else '☹️'} {txt}"
+        for sent, txt in zip(df_all["sentiment"], df_all["text"])
+    ])
+
+    int_datamap_kwds = {
+        "min_fontsize": 12,
+        "max_fontsize": 18,
+        "point_radius_min_pixels": 4,
+        "point_radius_max_pixels": 40,
+        "initial_zoom_fraction": 0.4,
+        "marker_size_array": dataset.memo("marker_sizes", lambda: [len(s.split()) for s in df_all["text"].tolist()]),
+    }
+    # Rendered HTML is cached across reruns and sessions (memory + disk);
+    # large corpora get the level-of-detail map (tiles written once, on disk).
+    # A failed render still shows the rest of the view
+    with metrics.stage("sentences.render_key"):
+        datamap_key = dataset.key(
+            "datamap", view.version, k_all,
+            {k: v for k, v in int_datamap_kwds.items() if k != "marker_size_array"},
+        )
     try:
-        embeddings = load_embeddings(EMBEDDINGS_PATH)
-        sentences_df = load_keywords(SENTENCES_PATH)
+        if lod.use_lod(len(hover_text)):
+            with metrics.stage("sentences.render_lod"):
+                datamap_html = lod.render_lod(datamap_key, view.coords, view.topics, view.labels, hover_text,
+                                              int_datamap_kwds)
+        else:
+            datamap_html = get_render_cache().get_or_render(
+                datamap_key,
+                lambda: _timed_render(view, hover_text, int_datamap_kwds),
+            )
+        render_error = None
     except Exception as e:
-        st.error(f"Erreur lors du chargement des fichiers : {e}")
-        st.stop()
+        datamap_html, render_error = None, e
+    return {
+        "df_all": df_all, "view": view, "hover_text": hover_text,
+        "datamap_html": datamap_html, "render_error": render_error,
+    }
 
-    # Validate
-    if not {"sentiment", "text"}.issubset(sentences_df.columns):
-        st.error("Le fichier sentences.tsv doit contenir les colonnes 'sentiment' et 'text'.")
-        st.stop()
 
-    # -------------------------
-    # Merge POS & NEG
-    # -------------------------
-    df_all = sentences_df.reset_index(drop=True)
-    
+def app():
+    """
+    Sidebar of the review map and submission of its background job.
+    Returns ``(job, show)``; ``show(result)`` draws the map once the job is done.
+    """
 
     # -------------------------
-    # Fit model
+    # Caching helpers
     # -------------------------
-    with st.spinner("🧠 Ajustement du modèle BERTopic sur tous les avis..."):
-        topic_model, topics = fit_topic_model(df_all["text"].tolist(), embeddings, K_ALL)
+    @metrics.cached(st.cache_resource, "sentences.load_similarity_index", hash_funcs=HASH_FUNCS)
+    def load_similarity_index(dataset):
+        return SimilarityIndex(dataset.embeddings[dataset.rows])
 
-    # -------------------------
-    # Build topic words
-    # -------------------------
-    topic_words = defaultdict(Counter)
-    for label, word_scores in topic_model.get_topics().items():
-        for word, score in word_scores:
-            if word not in STOPWORDS:
-                topic_words[label][word] = score
+    @metrics.cached(st.cache_resource, "sentences.load_sweep_results")
+    def load_sweep_results():
+        return load_sweep("sentences")
 
-    topic_labels = {label: ' '.join(w for w, _ in c.most_common(3)) for label, c in topic_words.items()}
-    try:
-        topic_model.set_topic_labels(topic_labels)
-    except Exception:
-        pass
+    @metrics.cached(st.cache_resource, "sentences.load_topic_tree")
+    def load_topic_tree():
+        return load_tree("sentences")
 
     # -------------------------
-    # Interactive Map
+    # Dataset: table + embeddings, content digest computed once (utils.datasets)
     # -------------------------
-
-    hover_text = [
-        f"{"🙂" if sent == "positif" else "☹️"} {txt}"
-        for sent, txt in zip(df_all["sentiment"], df_all["text"])
-    ]
-
-    try:
-        fig_interactive = topic_model.visualize_document_datamap(
-            docs=hover_text,
-            embeddings=embeddings,
-            custom_labels=True,
-            enable_search=True,
-            interactive=True,
-            int_datamap_kwds={
-                "min_fontsize": 12,
-                "max_fontsize": 18,
-                "point_radius_min_pixels": 4,
-                "point_radius_max_pixels": 40,
-                "initial_zoom_fraction": 0.4,
-                "marker_size_array": [len(s.split()) for s in df_all["text"].tolist()],
-            }
-        )
-        components.html(str(fig_interactive), height=600)
-    except Exception as e:
-        st.error(f"Impossible d'afficher la carte interactive : {e}")
+    dataset = load_dataset("sentences")
 
     # -------------------------
-    # Wordclouds
+    # Sidebar
     # -------------------------
-    # st.markdown("☁️ **Nuages de mots par topic**")
-    # topics_sorted = sorted(topic_words.items(), key=lambda x: x[0])
-    # for i in range(0, len(topics_sorted), 5):
-    #     row = topics_sorted[i:i+5]
-    #     cols = st.columns(len(row))
-    #     for j, (label, counter) in enumerate(row):
-    #         with cols[j]:
-    #             wc = WordCloud(width=300, height=200, background_color='white', min_font_size=12)
-    #             wc.generate_from_frequencies(counter)
-    #             fig, ax = plt.subplots(figsize=(3, 2))
-    #             ax.imshow(wc, interpolation='bilinear')
-    #             ax.axis('off')
-    #             title = topic_labels.get(label, f"Topic {label}")
-    #             ax.set_title(title, fontsize=10)
-    #             st.pyplot(fig)
-    #             plt.close(fig)
+    K_ALL = modeling.K_ALL
+    k_all = K_ALL
+    sweep = load_sweep_results()
+    tree = load_topic_tree()
+    use_tree = False
+    if sweep is not None or tree is not None:
+        with st.sidebar:
+            st.header("⚙️ Paramètres - Reviews")
+            if tree is not None:
+                use_tree = st.toggle("Regroupement hiérarchique", key="sentences_tree",
+                                     help="Découpe un arbre de topics précalculé : K change instantanément.")
+            if use_tree:
+                k_all = st.slider("Nombre de topics (K)", 2, tree.max_k, min(K_ALL, tree.max_k), key="sentences_tree_k")
+            elif sweep is not None:
+                # The default K is always available (prebuilt artifacts), even if not swept
+                k_options = sorted({*sweep.n_topics_values(), K_ALL})
+                k_all = st.select_slider("Nombre de topics (K)", options=k_options,
+                                         value=K_ALL if K_ALL in k_options else k_options[-1], key="sentences_k")
+                with st.expander("📈 Qualité des configurations"):
+                    st.dataframe(sweep.table().drop(columns="min_freq"), hide_index=True, use_container_width=True)
+    # -------------------------
+    # Background job: load -> fit -> render, shared by every session
+    # -------------------------
+    job = get_job_registry().submit(
+        ("sentences", dataset.digest, k_all, use_tree),
+        pipeline, dataset, k_all, sweep=sweep, tree=tree if use_tree else None,
+    )
+
+    def show(result):
+        df_all, view, hover_text = result["df_all"], result["view"], result["hover_text"]
+        topics, topic_labels = view.topics, view.labels
+        if use_tree:
+            merged = tree.merged_at(k_all)
+            if merged is not None:
+                st.sidebar.caption(
+                    f"À K={k_all - 1}, « {topic_labels[merged[0]]} » et « {topic_labels[merged[1]]} » fusionnent."
+                )
+
+        if result["render_error"] is None:
+            components.html(result["datamap_html"], height=600)
+        else:
+            st.error(f"Impossible d'afficher la carte interactive : {result['render_error']}")
+
+        # -------------------------
+        # Sentiment per topic
+        # -------------------------
+        with st.expander("📊 Répartition des avis par thématique"):
+            counts = sentiment_counts(topics, df_all["sentiment"])
+            counts.index = [topic_labels.get(t, f"Topic {t}") for t in counts.index]
+            st.dataframe(counts.sort_values(list(counts.columns), ascending=False), use_container_width=True)
+
+        # -------------------------
+        # Similar reviews
+        # -------------------------
+        with st.expander("🔍 Trouver les avis les plus proches"):
+            review_choice = st.selectbox(
+                "Sélectionnez un avis (commencez à taper pour rechercher) :",
+                options=range(len(df_all)),
+                format_func=lambda i: hover_text[i],
+                index=None,
+            )
+            if review_choice is not None:
+                neighbours, sims = load_similarity_index(dataset).most_similar(review_choice, k=10)
+                st.dataframe(
+                    pd.DataFrame({
+                        "avis": [hover_text[i] for i in neighbours],
+                        "thématique": [topic_labels.get(t, f"Topic {t}") for t in np.asarray(topics)[neighbours]],
+                        "similarité": sims,
+                    }),
+                    hide_index=True,
+                    use_container_width=True,
+                )
+
+        # -------------------------
+        # Wordclouds
+        # -------------------------
+        # st.markdown("☁️ **Nuages de mots par topic**")
+        # topics_sorted = sorted(topic_words.items(), key=lambda x: x[0])
+        # for i in range(0, len(topics_sorted), 5):
+        #     row = topics_sorted[i:i+5]
+        #     cols = st.columns(len(row))
+        #     for j, (label, counter) in enumerate(row):
+        #         with cols[j]:
+        #             wc = WordCloud(width=300, height=200, background_color='white', min_font_size=12)
+        #             wc.generate_from_frequencies(counter)
+        #             fig, ax = plt.subplots(figsize=(3, 2))
+        #             ax.imshow(wc, interpolation='bilinear')
+        #             ax.axis('off')
+        #             title = topic_labels.get(label, f"Topic {label}")
+        #             ax.set_title(title, fontsize=10)
+        #             st.pyplot(fig)
+        #             plt.close(fig)
+
+    return job, show
@@ -0,0 +1,403 @@
+"""
+Agreement between the participants' topic definitions and the model topics.
+
+Each participant writes their own definitions of the themes (one JSON file
+per participant, same format as utils.definitions). Every review of
+``sentences.tsv`` is labelled with each participant's themes as
+utils.classify does (best theme reaching its threshold, or no theme), then
+the labellings are compared:
+
+    - between participants: pairwise Cohen's kappa and Fleiss' kappa, over
+      the theme names (a theme absent from a file is never chosen by that
+      participant; "no theme" is a category of its own)
+    - with the BERTopic topics of the sentences view (utils.artifacts):
+      adjusted Rand index and normalized mutual information of each
+      participant's labelling, and the theme x topic confusion
+
+Every metric is computed from contingency tables built with np.bincount
+(or sparse indicator products) for all participants at once, streaming the reviews
+in chunks: there is no loop over pairs of participants nor over reviews.
+
+    python -m utils.agreement participants/       # every *.json file of the directory
+    python -m utils.agreement alice.json bob.json --include-defaults --out public/agreement.tsv
+"""
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from . import artifacts, encode, ingest, metrics, modeling
+from .classify import DEFAULT_THRESHOLD, embed_definitions
+from .definitions import TOPIC_DEFINITIONS, load_definitions
+from .embeddings import get_store
+
+NO_THEME = ""
+STUDY_ANNOTATOR = "définitions de l'étude"
+# (reviews x participants x themes) similarity scores held at once
+SCORE_BUDGET = 1 << 24
+
+
+# -------------------------
+# Contingency tables
+# -------------------------
+def contingencies(labels, reference, n_labels, n_reference):
+    """
+    ``(n_annotators, n_labels, n_reference)`` contingency tables of every row
+    of ``labels`` (n_annotators, n_items) against ``reference`` (n_items,).
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    n_annotators = len(labels)
+    codes = (np.arange(n_annotators)[:, None] * n_labels + labels) * n_reference + reference
+    size = n_annotators * n_labels * n_reference
+    return np.bincount(codes.ravel(), minlength=size).reshape(n_annotators, n_labels, n_reference)
+
+
+def _comb2(x):
+    return x * (x - 1) / 2
+
+
+def adjusted_rand_index(table):
+    """
+    Adjusted Rand index of contingency table(s) ``(..., n_a, n_b)``.
+    """
+    table = np.asarray(table, dtype=np.float64)
+    pairs = _comb2(table).sum(axis=(-2, -1))
+    rows = _comb2(table.sum(axis=-1)).sum(axis=-1)
+    cols = _comb2(table.sum(axis=-2)).sum(axis=-1)
+    expected = rows * cols / np.maximum(_comb2(table.sum(axis=(-2, -1))), 1)
+    denom = (rows + cols) / 2 - expected
+    # Both labellings trivial (one cluster, or one item per cluster): identical partitions
+    return np.where(denom != 0, (pairs - expected) / np.where(denom != 0, denom, 1), 1.0)
+
+
+def _entropy(p):
+    logs = np.log(p, out=np.zeros_like(p), where=p > 0)
+    return -(p * logs).sum(axis=-1)
+
+
+def normalized_mutual_info(table):
+    """
+    Mutual information of contingency table(s) ``(..., n_a, n_b)``,
+    normalized by the arithmetic mean of the two entropies.
+    """
+    table = np.asarray(table, dtype=np.float64)
+    p = table / np.maximum(table.sum(axis=(-2, -1), keepdims=True), 1)
+    p_a, p_b = p.sum(axis=-1), p.sum(axis=-2)
+    outer = p_a[..., :, None] * p_b[..., None, :]
+    ratio = np.divide(p, outer, out=np.ones_like(p), where=p > 0)
+    mi = np.maximum((p * np.log(ratio)).sum(axis=(-2, -1)), 0.0)
+    norm = (_entropy(p_a) + _entropy(p_b)) / 2
+    return np.where(norm > 0, mi / np.where(norm > 0, norm, 1), 1.0)
+
+
+def _pair_agreements(labels, n_categories):
+    """
+    ``(n_annotators, n_annotators)`` number of items on which each pair of
+    annotators chose the same category.
+
+    Product of the sparse (n_annotators, n_items x n_categories) indicator
+    of the labels with itself: its size and cost depend on the number of
+    labels, not on the number of categories (which grows with the
+    participants, each adding their own theme names).
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    n_annotators, n_items = labels.shape
+    columns = np.arange(n_items)[None, :] * n_categories + labels
+    x = sparse.csr_matrix(
+        (np.ones(labels.size, dtype=np.int64), columns.ravel(), np.arange(0, labels.size + 1, n_items)),
+        shape=(n_annotators, n_items * n_categories),
+    )
+    return (x @ x.T).toarray()
+
+
+def _kappa_matrix(agreements, marginals):
+    """
+    Cohen's kappa of every pair of annotators from their agreement counts
+    and their (n_annotators, n_categories) label counts (dense or sparse).
+    """
+    marginals = sparse.csr_matrix(marginals, dtype=np.float64)
+    n = marginals[0].sum()
+    observed = agreements / n
+    expected = (marginals @ marginals.T).toarray() / n ** 2
+    return np.where(expected < 1, (observed - expected) / np.where(expected < 1, 1 - expected, 1), 1.0)
+
+
+def pairwise_cohen_kappa(labels, n_categories):
+    """
+    ``(n_annotators, n_annotators)`` Cohen's kappa of every pair of rows of
+    ``labels`` (n_annotators, n_items), from one product of sparse indicators.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    marginals = np.stack([np.bincount(row, minlength=n_categories) for row in labels])
+    return _kappa_matrix(_pair_agreements(labels, n_categories), marginals)
+
+
+def fleiss_sums(counts):
+    """
+    ``(category_totals, item_agreement_sum, n_items)`` of ``counts``
+    (n_items, n_categories): additive over chunks of items, see fleiss_kappa.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    raters = counts[0].sum()
+    if raters < 2:
+        raise ValueError("Fleiss' kappa needs at least two annotators")
+    agreement = ((counts ** 2).sum(axis=1) - raters) / (raters * (raters - 1))
+    return counts.sum(axis=0), float(agreement.sum()), len(counts)
+
+
+def fleiss_kappa(counts=None, sums=None):
+    """
+    Fleiss' kappa of ``counts`` (n_items, n_categories), every item rated by
+    the same number of annotators, or of ``sums`` as returned by fleiss_sums
+    (summed over chunks of items, or see pair_fleiss_sums).
+    """
+    totals, agreement, n_items = fleiss_sums(counts) if sums is None else sums
+    p = totals / totals.sum()
+    observed = agreement / n_items
+    expected = (p ** 2).sum()
+    return 1.0 if expected >= 1 else float((observed - expected) / (1 - expected))
+
+
+def pair_fleiss_sums(agreements, marginals):
+    """
+    fleiss_sums from the pairwise agreement counts and the (n_annotators,
+    n_categories) label counts (dense or sparse): the squared category counts
+    of the items, summed, are the agreements of every ordered pair of annotators.
+    """
+    raters = len(agreements)
+    if raters < 2:
+        raise ValueError("Fleiss' kappa needs at least two annotators")
+    marginals = sparse.csr_matrix(marginals, dtype=np.float64)
+    n_items = int(marginals[0].sum())
+    agreement = (agreements.sum() - raters * n_items) / (raters * (raters - 1))
+    return np.asarray(marginals.sum(axis=0)).ravel(), float(agreement), n_items
+
+
+# -------------------------
+# Labelling
+# -------------------------
+def _themes(annotators):
+    """
+    Categories (no theme first, then every theme name in order of appearance).
+    """
+    names = dict.fromkeys(name for definitions, _ in annotators.values() for name in definitions)
+    return [NO_THEME, *names]
+
+
+def embed_annotators(annotators, categories, threshold=DEFAULT_THRESHOLD,
+                     embeddings_path=modeling.SENTENCES_EMBEDDINGS_PATH):
+    """
+    Padded ``(vectors, limits, slots)`` of the annotators' themes:
+    ``(n_annotators, max_themes, dim)`` unit vectors, their thresholds (+inf
+    on padding) and the ``(n_annotators, max_themes + 1)`` category index of
+    each annotator's label slots (slot 0: no theme, slot s: theme s - 1,
+    padding: no theme).
+    """
+    encoder = encode.encoder_for(embeddings_path)
+    category_ids = {name: i for i, name in enumerate(categories)}
+    max_themes = max(len(definitions) for definitions, _ in annotators.values())
+    vectors = None
+    limits = np.full((len(annotators), max_themes), np.inf, dtype=np.float32)
+    slots = np.zeros((len(annotators), max_themes + 1), dtype=np.int64)
+    for a, (definitions, thresholds) in enumerate(annotators.values()):
+        embedded = embed_definitions(definitions, embeddings_path, encoder)
+        if vectors is None:
+            vectors = np.zeros((len(annotators), max_themes, embedded.shape[1]), dtype=np.float32)
+        k = len(definitions)
+        vectors[a, :k] = embedded
+        limits[a, :k] = [thresholds.get(name, threshold) for name in definitions]
+        slots[a, 1:k + 1] = [category_ids[name] for name in definitions]
+    return vectors, limits, slots
+
+
+def label_chunk(embeddings, vectors, limits):
+    """
+    ``(n_annotators, n_rows)`` label slot of each review for each annotator:
+    1 + their best theme reaching its threshold, 0 (no theme) if none does.
+    """
+    x = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    x = x / np.where(norms == 0, 1.0, norms)
+    n_annotators, max_themes, dim = vectors.shape
+    scores = (x @ vectors.reshape(-1, dim).T).reshape(len(x), n_annotators, max_themes)
+    matches = scores >= limits
+    best = np.where(matches, scores, -np.inf).argmax(axis=-1)
+    return np.where(matches.any(axis=-1), best + 1, 0).T
+
+
+# -------------------------
+# Driver
+# -------------------------
+@dataclass
+class Agreement:
+    annotators: list
+    categories: list            # theme names, NO_THEME first
+    slots: np.ndarray           # (n_annotators, max_themes + 1) category of each label slot
+    topics: np.ndarray          # model topic ids (columns of the contingency tables)
+    topic_labels: dict
+    contingency: np.ndarray     # (n_annotators, max_themes + 1, n_topics), rows are label slots
+    kappa: np.ndarray           # (n_annotators, n_annotators) pairwise Cohen's kappa
+    fleiss: float
+
+    @property
+    def ari(self):
+        return adjusted_rand_index(self.contingency)
+
+    @property
+    def nmi(self):
+        return normalized_mutual_info(self.contingency)
+
+    def summary(self):
+        """
+        One row per annotator: agreement with the model and with the others.
+        """
+        n_reviews = self.contingency[0].sum()
+        others = self.kappa.copy()
+        np.fill_diagonal(others, np.nan)
+        with np.errstate(invalid="ignore"):
+            mean_kappa = np.nanmean(others, axis=1) if len(self.annotators) > 1 else np.full(1, np.nan)
+        return pd.DataFrame({
+            "themes": (self.contingency.sum(axis=2) > 0)[:, 1:].sum(axis=1),
+            "coverage": 1 - self.contingency[:, 0].sum(axis=1) / n_reviews,
+            "ari": self.ari,
+            "nmi": self.nmi,
+            "mean_kappa": mean_kappa,
+        }, index=pd.Index(self.annotators, name="annotator")).round(4)
+
+    def confusion(self, annotator=None):
+        """
+        Theme x model topic counts, summed over the annotators (or of one).
+        """
+        if annotator is None:
+            slots, tables = self.slots, self.contingency
+        else:
+            a = self.annotators.index(annotator)
+            slots, tables = self.slots[a:a + 1], self.contingency[a:a + 1]
+        table = np.zeros((len(self.categories), len(self.topics)), dtype=np.int64)
+        np.add.at(table, slots.ravel(), tables.reshape(-1, len(self.topics)))
+        if annotator is not None:
+            used = np.unique(slots)
+            table, categories = table[used], [self.categories[c] for c in used]
+        else:
+            categories = self.categories
+        return pd.DataFrame(
+            table,
+            index=pd.Index([c or "(aucun)" for c in categories], name="theme"),
+            columns=[self.topic_labels.get(t, f"Topic {t}") for t in self.topics],
+        )
+
+
+def load_topics(view="sentences"):
+    """
+    Model topic of every review (in table order) and the topic labels, from
+    the prebuilt artifacts if up to date, else a fit.
+    """
+    built = artifacts.load_artifacts(view)
+    if built is None:
+        built = artifacts.build_view(view)
+    return np.asarray(built.topics), built.labels
+
+
+def evaluate(annotators, threshold=DEFAULT_THRESHOLD, chunk_size=None,
+             embeddings_path=modeling.SENTENCES_EMBEDDINGS_PATH):
+    """
+    Label every review with each annotator's themes and compare the
+    labellings with each other and with the model topics.
+
+    ``annotators``: ``{name: (definitions, thresholds)}`` as returned by
+    utils.definitions.load_definitions.
+    """
+    if not annotators:
+        raise ValueError("Aucun participant à comparer")
+    names = list(annotators)
+    categories = _themes(annotators)
+    n_categories = len(categories)
+    with metrics.stage("agreement.embed"):
+        vectors, limits, slots = embed_annotators(annotators, categories, threshold, embeddings_path)
+    with metrics.stage("agreement.topics"):
+        topics, topic_labels = load_topics()
+    topic_ids, topic_codes = np.unique(topics, return_inverse=True)
+
+    rows = ingest.load_table("sentences", ["sentiment"]).index.to_numpy()
+    if len(rows) != len(topics):
+        raise ValueError(f"{len(topics)} topics for {len(rows)} reviews: rebuild the sentences view")
+    store = get_store(embeddings_path)
+    chunk_size = chunk_size or max(1, SCORE_BUDGET // vectors.shape[0] // vectors.shape[1])
+
+    # Everything held across chunks is sized by the annotators' own themes
+    # (label slots), never by the (n_annotators, n_categories) union
+    n_slots = slots.shape[1]
+    table = np.zeros((len(names), n_slots, len(topic_ids)), dtype=np.int64)
+    agreements = np.zeros((len(names), len(names)), dtype=np.int64)
+    annotator_rows = np.arange(len(names))[:, None]
+    with metrics.stage("agreement.label"):
+        for start in range(0, len(rows), chunk_size):
+            labels = label_chunk(store[rows[start:start + chunk_size]], vectors, limits)
+            table += contingencies(labels, topic_codes[start:start + chunk_size], n_slots, len(topic_ids))
+            agreements += _pair_agreements(slots[annotator_rows, labels], n_categories)
+    metrics.count("agreement.annotators", len(names))
+
+    # label counts per category, for the kappas (sparse: each annotator uses few categories;
+    # duplicate (annotator, category) entries, i.e. padding slots, are summed)
+    marginals = sparse.csr_matrix(
+        (table.sum(axis=2).ravel(), (np.repeat(np.arange(len(names)), n_slots), slots.ravel())),
+        shape=(len(names), n_categories),
+    )
+    return Agreement(
+        annotators=names,
+        categories=categories,
+        slots=slots,
+        topics=topic_ids,
+        topic_labels=topic_labels,
+        contingency=table,
+        kappa=_kappa_matrix(agreements, marginals),
+        fleiss=fleiss_kappa(sums=pair_fleiss_sums(agreements, marginals)) if len(names) > 1 else float("nan"),
+    )
+
+
+def load_annotators(paths, include_defaults=False):
+    """
+    ``{name: (definitions, thresholds)}`` of every JSON file in ``paths``
+    (files or directories of ``*.json``), named after the file.
+    """
+    annotators = {}
+    if include_defaults:
+        annotators[STUDY_ANNOTATOR] = (dict(TOPIC_DEFINITIONS), {})
+    for path in map(Path, paths):
+        files = sorted(path.glob("*.json")) if path.is_dir() else [path]
+        for file in files:
+            definitions, thresholds = load_definitions([file], include_defaults=False)
+            if definitions:
+                annotators[file.stem] = (definitions, thresholds)
+    return annotators
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Agreement between the participants' topic definitions and the model topics.")
+    parser.add_argument("paths", nargs="+", help="JSON files (or directories of JSON files), one per participant")
+    parser.add_argument("--include-defaults", action="store_true", help="add the study's definitions as a participant")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="minimum cosine similarity for a theme to match a review")
+    parser.add_argument("--out", help="TSV file for the per-participant table")
+    parser.add_argument("--confusion", help="TSV file for the theme x topic confusion")
+    args = parser.parse_args(argv)
+
+    result = evaluate(load_annotators(args.paths, args.include_defaults), args.threshold)
+    summary = result.summary()
+    print(summary.to_string())
+    print(f"\n{len(result.annotators)} participants, {len(result.categories) - 1} themes, "
+          f"{len(result.topics)} topics; Fleiss' kappa {result.fleiss:.4f}")
+    confusion = result.confusion()
+    print(confusion.to_string())
+    if args.out:
+        summary.to_csv(args.out, sep="\t")
+    if args.confusion:
+        confusion.to_csv(args.confusion, sep="\t")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Offline build step for the topic views.
+
+Fits both views ahead of time and stores versioned artifacts on disk so the
+Streamlit app only has to load them:
+
+    python -m utils.artifacts            # build keywords + sentences
+    python -m utils.artifacts keywords   # build a single view
+
+Layout (one directory per build, ``LATEST`` points to the current one):
+
+    artifacts/<view>/<tag>/topics.npy     topic id of every document
+    artifacts/<view>/<tag>/labels.json    custom labels {topic id: label}
+    artifacts/<view>/<tag>/coords.npy     2D datamap coordinates
+    artifacts/<view>/<tag>/manifest.json  version, parameters and source fingerprints
+
+The fitted BERTopic model is not saved: it is fitted on row ids (see
+utils.preprocess) over a precomputed UMAP reduction, so it could not
+transform new text anyway. New reviews are assigned to the saved topics by
+utils.online (nearest topic centroid), and the service (utils.service)
+answers text queries the same way.
+"""
+import argparse
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from . import ingest, metrics, modeling, preprocess
+from .embeddings import EMBEDDINGS_FORMAT, format_paths, get_store, resolve_format
+from .reductions import CLUSTER_UMAP_PARAMS, DATAMAP_UMAP_PARAMS, load_reductions
+
+ARTIFACTS_DIR = Path(os.environ.get("TOPIC_ARTIFACTS_DIR", "artifacts"))
+# Bump when the artifact layout or the fitting procedure changes
+ARTIFACT_VERSION = 3
+
+VIEWS = ("keywords", "sentences")
+
+
+@dataclass
+class ViewArtifacts:
+    topics: np.ndarray
+    labels: dict
+    coords: np.ndarray
+    version: str = "in-memory"
+
+
+# -------------------------
+# Source fingerprints
+# -------------------------
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _file_stat(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _view_sources(view):
+    if view == "keywords":
+        data_path, embeddings_path = modeling.KEYWORDS_PATH, modeling.KEYWORDS_EMBEDDINGS_PATH
+    else:
+        data_path, embeddings_path = modeling.SENTENCES_PATH, modeling.SENTENCES_EMBEDDINGS_PATH
+    try:
+        fmt = resolve_format(embeddings_path, EMBEDDINGS_FORMAT)
+    except FileNotFoundError:
+        return [data_path, embeddings_path]
+    return [data_path] + [str(p) for p in format_paths(embeddings_path, fmt)]
+
+
+def _view_params(view):
+    umap = {"cluster": CLUSTER_UMAP_PARAMS, "datamap": DATAMAP_UMAP_PARAMS}
+    if view == "keywords":
+        return {"min_freq": modeling.MIN_FREQ, "n_topics": modeling.N_TOPICS, "umap": umap}
+    return {"n_topics": modeling.K_ALL, "umap": umap}
+
+
+def source_fingerprints(view):
+    """
+    Content hash and size/mtime of every data file a view is built from.
+    """
+    return {
+        path: {"sha256": file_digest(path), "stat": _file_stat(path)}
+        for path in _view_sources(view)
+    }
+
+
+def sources_match(manifest, view):
+    """
+    Whether a build recorded with ``source_fingerprints(view)`` still matches the data files.
+    """
+    return _sources_match(manifest, _view_sources(view))
+
+
+def _sources_match(manifest, sources):
+    """
+    Cheap check on size/mtime first; only re-hash files whose stat changed
+    (e.g. after a fresh checkout).
+    """
+    recorded = manifest.get("sources", {})
+    if sorted(recorded) != sorted(sources):
+        return False
+    for path in sources:
+        entry = recorded[path]
+        if not os.path.exists(path):
+            return False
+        if _file_stat(path) == entry["stat"]:
+            continue
+        if file_digest(path) != entry["sha256"]:
+            return False
+    return True
+
+
+# -------------------------
+# Build
+# -------------------------
+def load_keywords_view_data():
+    """
+    Keywords filtered by MIN_FREQ, with their embeddings and frequencies.
+    """
+    keywords_df = ingest.load_table("keywords", ["item", "count"])
+    embeddings = get_store(modeling.KEYWORDS_EMBEDDINGS_PATH)
+    df_filtered = keywords_df[keywords_df['count'] >= modeling.MIN_FREQ]
+    return (
+        df_filtered['item'].tolist(),
+        embeddings[df_filtered.index.to_numpy()],
+        df_filtered['count'].tolist(),
+    )
+
+
+def keywords_doc_terms(min_freq=modeling.MIN_FREQ):
+    """
+    Cached document-term matrix of the keywords kept by ``min_freq``.
+    """
+    counts = ingest.load_table("keywords", ["count"])["count"].to_numpy()
+    return preprocess.load_doc_terms("keywords").subset(np.flatnonzero(counts >= min_freq))
+
+
+def load_sentences_view_data():
+    sentences_df = ingest.load_table("sentences", ["text"])
+    embeddings = get_store(modeling.SENTENCES_EMBEDDINGS_PATH)
+    return sentences_df["text"].tolist(), embeddings[sentences_df.index.to_numpy()]
+
+
+def build_keywords(keywords, embeddings, freqs, n_topics, doc_terms=None):
+    # One UMAP pass per dataset, shared by the fit and the datamap layout
+    with metrics.stage("keywords.reductions"):
+        reduced = load_reductions("keywords", embeddings)
+    with metrics.stage("keywords.bertopic_fit"):
+        _, topics = modeling.fit_keywords_model(keywords, embeddings, n_topics, reduced.cluster, doc_terms)
+    with metrics.stage("keywords.labels"):
+        labels = modeling.keywords_topic_labels(keywords, freqs, topics)
+    return ViewArtifacts(np.asarray(topics), labels, reduced.layout)
+
+
+def build_sentences(texts, embeddings, n_topics, doc_terms=None):
+    with metrics.stage("sentences.reductions"):
+        reduced = load_reductions("sentences", embeddings)
+    with metrics.stage("sentences.bertopic_fit"):
+        topic_model, topics = modeling.fit_sentences_model(texts, embeddings, n_topics, reduced.cluster, doc_terms)
+    with metrics.stage("sentences.labels"):
+        labels = modeling.sentences_topic_labels(topic_model)
+    return ViewArtifacts(np.asarray(topics), labels, reduced.layout)
+
+
+def build_view(view):
+    if view == "keywords":
+        keywords, embeddings, freqs = load_keywords_view_data()
+        return build_keywords(keywords, embeddings, freqs, modeling.N_TOPICS, keywords_doc_terms())
+    if view == "sentences":
+        texts, embeddings = load_sentences_view_data()
+        return build_sentences(texts, embeddings, modeling.K_ALL, preprocess.load_doc_terms("sentences"))
+    raise ValueError(f"Unknown view: {view!r}")
+
+
+# -------------------------
+# Save / load
+# -------------------------
+def save_artifacts(view, artifacts, root=ARTIFACTS_DIR):
+    sources = source_fingerprints(view)
+    params = _view_params(view)
+    tag_source = json.dumps(
+        {"version": ARTIFACT_VERSION, "params": params,
+         "sources": {p: s["sha256"] for p, s in sources.items()}},
+        sort_keys=True,
+    )
+    tag = f"v{ARTIFACT_VERSION}-{hashlib.sha256(tag_source.encode()).hexdigest()[:12]}"
+
+    out_dir = Path(root) / view / tag
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "topics.npy", np.asarray(artifacts.topics))
+    np.save(out_dir / "coords.npy", np.asarray(artifacts.coords, dtype=np.float32))
+    with open(out_dir / "labels.json", "w", encoding="utf-8") as f:
+        json.dump({str(k): v for k, v in artifacts.labels.items()}, f, ensure_ascii=False, indent=2)
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "tag": tag,
+        "view": view,
+        "params": params,
+        "sources": sources,
+        "n_documents": int(len(artifacts.topics)),
+    }
+    with open(out_dir / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    # Switch LATEST last so readers never see a half-written build
+    latest_tmp = Path(root) / view / "LATEST.tmp"
+    latest_tmp.write_text(tag)
+    os.replace(latest_tmp, Path(root) / view / "LATEST")
+    artifacts.version = tag
+    return out_dir
+
+
+def load_artifacts(view, root=ARTIFACTS_DIR):
+    """
+    Load the latest build of a view, or return None if there is none or if it
+    no longer matches the current data files and parameters.
+    """
+    latest = Path(root) / view / "LATEST"
+    if not latest.exists():
+        return None
+    out_dir = latest.parent / latest.read_text().strip()
+    try:
+        with open(out_dir / "manifest.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != ARTIFACT_VERSION or manifest.get("params") != _view_params(view):
+        return None
+    if not sources_match(manifest, view):
+        return None
+
+    with open(out_dir / "labels.json", encoding="utf-8") as f:
+        labels = {int(k): v for k, v in json.load(f).items()}
+    return ViewArtifacts(
+        topics=np.load(out_dir / "topics.npy"),
+        labels=labels,
+        coords=np.load(out_dir / "coords.npy"),
+        version=manifest["tag"],
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the topic views and save their artifacts.")
+    parser.add_argument("views", nargs="*", help=f"views to build among {', '.join(VIEWS)} (default: all)")
+    parser.add_argument("--out", type=Path, default=ARTIFACTS_DIR, help="artifacts root directory")
+    args = parser.parse_args(argv)
+    unknown = set(args.views) - set(VIEWS)
+    if unknown:
+        parser.error(f"unknown views: {', '.join(sorted(unknown))}")
+
+    for view in args.views or VIEWS:
+        print(f"[{view}] fitting...")
+        artifacts = build_view(view)
+        out_dir = save_artifacts(view, artifacts, root=args.out)
+        print(f"[{view}] {len(artifacts.topics)} documents, {len(artifacts.labels)} topics -> {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
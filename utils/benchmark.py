@@ -0,0 +1,287 @@
+"""
+Scaling benchmark of the load, fit, label and render stages.
+
+Scaled copies of ``keywords.csv`` / ``sentences.tsv`` are synthesized by
+resampling the real rows (with jittered embeddings, so clustering still has
+structure), then every stage the app runs is timed separately:
+
+    ingest            stream the csv / tsv into its columnar file (utils.ingest)
+    load_data         memory-map the columnar file
+    load_embeddings   open the embedding store and read every row
+    warmup            imports and numba JIT on a few rows (cold-start cost,
+                      kept out of the scaling stages below)
+    reduce            the UMAP reductions (clustering space + 2D layout)
+    fit               BERTopic + KMeans on the reduced embeddings
+    labels            topic labels (keyword frequencies / c-TF-IDF)
+    render            the interactive datamap HTML (level-of-detail map above
+                      lod.LOD_MIN_POINTS documents)
+
+Each (view, size) runs in a fresh process; the memory of a stage is the
+peak resident set size sampled while it runs (tracemalloc would slow the
+Python-heavy stages down several times). Results go to
+``benchmarks/<date>-<commit>.json``:
+
+    python -m utils.benchmark sentences --sizes 3400 100000 1000000
+    python -m utils.benchmark keywords --sizes 1000000 --stages load_data load_embeddings
+    python -m utils.benchmark --compare benchmarks/a.json benchmarks/b.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import ingest, lod, modeling
+from .metrics import rss_mb
+
+BENCHMARK_DIR = Path(os.environ.get("TOPIC_BENCHMARK_DIR", "benchmarks"))
+STAGES = ("ingest", "load_data", "load_embeddings", "warmup", "reduce", "fit", "labels", "render")
+DEFAULT_SIZES = (3_400, 10_000, 100_000)
+EMBEDDING_NOISE = 0.05
+CHUNK_ROWS = 65536
+RSS_SAMPLE_INTERVAL = 0.01
+
+_SOURCES = {
+    "keywords": (modeling.KEYWORDS_PATH, modeling.KEYWORDS_EMBEDDINGS_PATH, ","),
+    "sentences": (modeling.SENTENCES_PATH, modeling.SENTENCES_EMBEDDINGS_PATH, "\t"),
+}
+
+
+# -------------------------
+# Synthetic data
+# -------------------------
+def synthesize(view, n_rows, out_dir, seed=0):
+    """
+    Write a scaled copy of the view's data file and embeddings to ``out_dir``.
+    Returns ``(data_path, embeddings_path)``.
+    """
+    if view not in _SOURCES:
+        raise ValueError(f"Unknown view: {view!r}")
+    source, embeddings_path, sep = _SOURCES[view]
+    rng = np.random.default_rng(seed)
+
+    df = pd.read_csv(source, sep=sep)
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    rows = rng.integers(0, len(df), n_rows)
+    scaled = df.iloc[rows].reset_index(drop=True)
+    # number the resampled copies, otherwise the ingestion de-duplicates them away
+    column = "item" if view == "keywords" else "text"
+    copy = scaled.groupby(column).cumcount()
+    suffix = "_" + copy.astype(str) if view == "keywords" else " [" + copy.astype(str) + "]"
+    scaled[column] = scaled[column].where(copy == 0, scaled[column] + suffix)
+
+    data_path = Path(out_dir) / f"{view}-{n_rows}{Path(source).suffix}"
+    scaled.to_csv(data_path, sep=sep, index=False)
+    out_path = Path(out_dir) / f"{view}-{n_rows}_embeddings.npy"
+    out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=(n_rows, embeddings.shape[1]))
+    for start in range(0, n_rows, CHUNK_ROWS):
+        chunk = np.asarray(embeddings[rows[start:start + CHUNK_ROWS]], dtype=np.float32)
+        out[start:start + len(chunk)] = chunk + EMBEDDING_NOISE * rng.standard_normal(chunk.shape, dtype=np.float32)
+    out.flush()
+    del out
+    return data_path, out_path
+
+
+# -------------------------
+# Stages
+# -------------------------
+class _RssSampler(threading.Thread):
+    """
+    Peak RSS of the process while a stage runs.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.start_mb = self.peak_mb = rss_mb()
+        self._finished = threading.Event()
+
+    def run(self):
+        while not self._finished.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_mb = max(self.peak_mb, rss_mb())
+
+    def stop(self):
+        self._finished.set()
+        self.join()
+        self.peak_mb = max(self.peak_mb, rss_mb())
+
+
+def _timed(results, name, fn):
+    sampler = _RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        value = fn()
+    finally:
+        seconds = time.perf_counter() - start
+        sampler.stop()
+    results.append({
+        "stage": name,
+        "seconds": round(seconds, 4),
+        "peak_rss_mb": round(sampler.peak_mb, 1),
+        "rss_increase_mb": round(sampler.peak_mb - sampler.start_mb, 1),
+    })
+    return value
+
+
+def _warmup(view, embeddings, docs):
+    """
+    Import the heavy libraries and compile UMAP's numba kernels on a few rows.
+    """
+    import datamapplot  # noqa: F401
+    from .reductions import compute_reductions
+
+    n = min(len(docs), 300)
+    reduced = compute_reductions(embeddings[:n])
+    fit = modeling.fit_keywords_model if view == "keywords" else modeling.fit_sentences_model
+    fit(docs[:n], embeddings[:n], 2, reduced.cluster)
+
+
+def run_stages(view, n_rows, stages=STAGES, n_topics=modeling.N_TOPICS, seed=0):
+    """
+    Synthesize ``n_rows`` rows of ``view`` and time the requested stages
+    (a stage's inputs are computed untimed when an earlier stage is skipped).
+    """
+    from .embeddings import get_store
+    from .reductions import compute_reductions
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="topic-bench-") as tmp:
+        data_path, embeddings_path = synthesize(view, n_rows, tmp, seed=seed)
+
+        def stage(name, fn):
+            return _timed(results, name, fn) if name in stages else fn()
+
+        last = max(STAGES.index(name) for name in stages)
+
+        columnar = Path(tmp) / "columnar"
+        stage("ingest", lambda: ingest.ingest(view, columnar, source=data_path))
+        df = stage("load_data", lambda: ingest.load_table(view, root=columnar, source=data_path))
+        embeddings = stage("load_embeddings", lambda: get_store(embeddings_path)[df.index.to_numpy()])
+        if view == "keywords":
+            # same frequency filter as the app
+            keep = (df["count"] >= modeling.MIN_FREQ).to_numpy()
+            df, embeddings = df[keep], embeddings[keep]
+            docs = df["item"].tolist()
+        else:
+            docs = df["text"].tolist()
+
+        if last >= STAGES.index("warmup"):
+            stage("warmup", lambda: _warmup(view, embeddings, docs))
+        if last >= STAGES.index("reduce"):
+            k = min(n_topics, max(2, len(docs) // 2))
+            reduced = stage("reduce", lambda: compute_reductions(embeddings))
+        if last >= STAGES.index("fit"):
+            if view == "keywords":
+                fit = lambda: modeling.fit_keywords_model(docs, embeddings, k, reduced.cluster)
+            else:
+                fit = lambda: modeling.fit_sentences_model(docs, embeddings, k, reduced.cluster)
+            topic_model, topics = stage("fit", fit)
+        if last >= STAGES.index("labels"):
+            if view == "keywords":
+                labels = stage("labels", lambda: modeling.keywords_topic_labels(docs, df["count"].tolist(), topics))
+            else:
+                labels = stage("labels", lambda: modeling.sentences_topic_labels(topic_model))
+        if last >= STAGES.index("render"):
+            if lod.use_lod(len(docs)):
+                # the app's large-corpus map (overview page + detail tiles)
+                render = lambda: lod.render_lod("bench", reduced.layout, topics, labels, docs, {},
+                                                root=Path(tmp) / "datamaps")
+            else:
+                render = lambda: modeling.render_datamap(reduced.layout, topics, labels, docs, {})
+            stage("render", render)
+    return {"view": view, "n_rows": n_rows, "n_docs": len(docs), "stages": results}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(views, sizes=DEFAULT_SIZES, stages=STAGES, out_dir=BENCHMARK_DIR):
+    """
+    Run every (view, size) in its own process and write the results as JSON.
+    """
+    commit = _git_commit()
+    runs = []
+    for view in views:
+        for n_rows in sizes:
+            with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                run = pool.submit(run_stages, view, n_rows, tuple(stages)).result()
+            runs.append(run)
+            for s in run["stages"]:
+                print(f"[{view} {n_rows:>9}] {s['stage']:<16} {s['seconds']:>9.3f} s "
+                      f"{s['peak_rss_mb']:>9.1f} MB peak rss (+{s['rss_increase_mb']:.1f})")
+
+    report = {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "runs": runs,
+    }
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def _flatten(report):
+    return pd.DataFrame([
+        {"view": run["view"], "n_rows": run["n_rows"], **s} for run in report["runs"] for s in run["stages"]
+    ]).set_index(["view", "n_rows", "stage"])
+
+
+def compare(baseline_path, candidate_path):
+    """
+    Side-by-side seconds / peak RSS of two result files, with the candidate/baseline ratio.
+    """
+    reports = []
+    for path in (baseline_path, candidate_path):
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    base, cand = (_flatten(r) for r in reports)
+    table = base[["seconds", "peak_rss_mb"]].join(
+        cand[["seconds", "peak_rss_mb"]], lsuffix="_baseline", rsuffix="_candidate", how="outer"
+    )
+    table["time_ratio"] = cand["seconds"] / base["seconds"]
+    table["memory_ratio"] = cand["peak_rss_mb"] / base["peak_rss_mb"]
+    return table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the app's stages on scaled synthetic data.")
+    parser.add_argument("views", nargs="*", help="keywords and/or sentences (default: both)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="numbers of rows")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), help=f"among {', '.join(STAGES)}")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        print(f"baseline {args.compare[0]}, candidate {args.compare[1]}")
+        print(compare(*args.compare).to_string(float_format=lambda x: f"{x:.3f}"))
+        return
+    unknown = set(args.views) - set(_SOURCES) | set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown views or stages: {', '.join(sorted(unknown))}")
+    path = run_benchmark(args.views or list(_SOURCES), args.sizes, args.stages)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
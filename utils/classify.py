@@ -0,0 +1,167 @@
+"""
+Batch classification of the reviews against the topic definitions.
+
+The definitions of the study (utils.definitions, plus any user-added JSON
+file) are embedded with the encoder that produced the review embeddings,
+and every review of ``sentences.tsv`` is scored against them by cosine
+similarity:
+
+    - a theme matches a review when their similarity reaches its threshold
+      (``--threshold``, or the theme's own threshold in the JSON file)
+    - ``topic`` is the best matching theme (empty when none matches),
+      ``topics`` every matching theme, ``sentiment`` the review's
+      ``sentiment`` column
+
+The review embeddings are read from the memory-mapped store in chunks
+scored in a process pool, with at most two chunks per worker in flight,
+and results are appended to a TSV as they arrive: memory stays bounded
+whatever the number of reviews.
+
+    python -m utils.classify
+    python -m utils.classify --definitions mes_themes.json --threshold 0.3
+"""
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import encode, ingest, modeling
+from .definitions import load_definitions
+from .embeddings import get_store
+
+CLASSIFIED_PATH = "public/sentences_topics.tsv"
+CHUNK_SIZE = 50_000
+# Minimum cosine similarity between a review and a definition. Depends on the
+# encoder: sentence-transformers scores are higher than the TF-IDF fallback's
+DEFAULT_THRESHOLD = 0.1
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def embed_definitions(definitions, embeddings_path=modeling.SENTENCES_EMBEDDINGS_PATH, encoder=None):
+    """
+    Unit vectors of the definitions (``"<name> : <definition>"``), in the
+    space of the review embeddings (``encoder``: the one recorded for
+    ``embeddings_path``, loaded if not given).
+    """
+    encoder = encoder or encode.encoder_for(embeddings_path)
+    return _normalize(encoder.encode([f"{name} : {text}" for name, text in definitions.items()]))
+
+
+def score(embeddings, definition_vectors, thresholds):
+    """
+    ``(best, best_score, matches)`` of each row: index of the best theme
+    reaching its threshold (-1 if none), its similarity (NaN if none) and
+    the (n_rows, n_themes) boolean matrix of matching themes.
+    """
+    scores = _normalize(embeddings) @ definition_vectors.T
+    matches = scores >= thresholds
+    matched = matches.any(axis=1)
+    # argmax of an all -inf row is 0: unmatched rows are reset below
+    best = np.where(matches, scores, -np.inf).argmax(axis=1)
+    best_score = np.where(matched, scores[np.arange(len(scores)), best], np.nan)
+    best = np.where(matched, best, -1)
+    return best, best_score, matches
+
+
+# -------------------------
+# Workers
+# -------------------------
+_worker = {}
+
+
+def _init_worker(embeddings_path, definition_vectors, thresholds):
+    _worker.update(store=get_store(embeddings_path), vectors=definition_vectors, thresholds=thresholds)
+
+
+def _score_rows(rows):
+    return score(_worker["store"][rows], _worker["vectors"], _worker["thresholds"])
+
+
+def _bounded_map(pool, fn, items, max_in_flight):
+    """
+    ``pool.map`` in order, with at most ``max_in_flight`` pending tasks.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# -------------------------
+# Driver
+# -------------------------
+def classify(definitions, thresholds=None, threshold=DEFAULT_THRESHOLD, out_path=CLASSIFIED_PATH,
+             chunk_size=CHUNK_SIZE, max_workers=None, embeddings_path=modeling.SENTENCES_EMBEDDINGS_PATH):
+    """
+    Classify every review and write one row per review to ``out_path``.
+    Returns the number of reviews per (theme, sentiment).
+    """
+    if not definitions:
+        raise ValueError("Aucun thème à classer")
+    names = np.array(list(definitions), dtype=object)
+    vectors = embed_definitions(definitions, embeddings_path)
+    limits = np.array([(thresholds or {}).get(name, threshold) for name in names], dtype=np.float32)
+
+    table = ingest.load_table("sentences")
+    rows = table.index.to_numpy()
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = pd.DataFrame(0, index=pd.Index([*names, ""], name="topic"),
+                          columns=table["sentiment"].cat.categories, dtype=np.int64)
+
+    out_path = Path(out_path)
+    tmp = out_path.with_suffix(".tmp")
+    starts = range(0, len(rows), chunk_size)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(embeddings_path, vectors, limits)) as pool:
+        results = _bounded_map(pool, _score_rows, (rows[s:s + chunk_size] for s in starts), 2 * max_workers)
+        for start, (best, best_score, matches) in zip(starts, results):
+            chunk = table.iloc[start:start + chunk_size]
+            topic = np.where(best >= 0, names[np.maximum(best, 0)], "")
+            out = pd.DataFrame({
+                "source_row": chunk.index,
+                "sentiment": chunk["sentiment"].to_numpy(),
+                "topic": topic,
+                "score": np.round(best_score, 4),
+                "topics": ["|".join(names[m]) for m in matches],
+                "text": chunk["text"].to_numpy(),
+            })
+            out.to_csv(tmp, sep="\t", index=False, header=start == 0, mode="w" if start == 0 else "a")
+            counts = counts.add(pd.crosstab(out["topic"], out["sentiment"]), fill_value=0)
+    os.replace(tmp, out_path)
+    return counts.astype(np.int64)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify every review against the topic definitions.")
+    parser.add_argument("--definitions", nargs="*", default=[],
+                        help="JSON files of additional (or redefined) themes, see utils.definitions")
+    parser.add_argument("--only-added", action="store_true", help="ignore the predefined themes")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="minimum cosine similarity for a theme to match a review")
+    parser.add_argument("--out", default=CLASSIFIED_PATH)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    definitions, thresholds = load_definitions(args.definitions, include_defaults=not args.only_added)
+    counts = classify(definitions, thresholds, args.threshold, args.out, args.chunk_size, args.workers)
+    counts.index = counts.index.where(counts.index != "", "(aucun)")
+    print(counts.to_string())
+    print(f"{int(counts.to_numpy().sum())} reviews -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
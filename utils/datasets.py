@@ -0,0 +1,152 @@
+"""
+Content-addressed dataset handles.
+
+A ``DatasetHandle`` is the ingested table of a view (utils.ingest) plus
+its embedding store, with a content digest computed once when it is
+loaded:
+
+    - the table digest is computed while ingesting and kept in the
+      columnar file's metadata
+    - the embedding files are hashed once and their digest is kept in
+      ``<view>.embeddings.json`` next to the columnar file, valid as long
+      as their size and mtime do not change
+
+Caches then key on the handle instead of the raw arrays: job keys, render
+keys and Streamlit caches (``hash_funcs=HASH_FUNCS``) hash a 64-character
+digest, so a lookup costs the same whatever the size of the corpus.
+Values derived from the data alone (e.g. the sorted keyword list of a
+selectbox) are memoized on the handle with ``handle.memo``.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from . import ingest, modeling
+from .embeddings import format_paths, get_store
+from .render_cache import render_key
+
+EMBEDDINGS_PATHS = {
+    "keywords": modeling.KEYWORDS_EMBEDDINGS_PATH,
+    "sentences": modeling.SENTENCES_EMBEDDINGS_PATH,
+}
+
+
+class DatasetHandle:
+    """
+    Ingested table + embedding store of a view, identified by ``digest``.
+    """
+
+    def __init__(self, view, digest, table, embeddings):
+        self.view = view
+        self.digest = digest
+        self.table = table              # DataFrame indexed by embedding row (see utils.ingest)
+        self.embeddings = embeddings    # utils.embeddings.EmbeddingStore
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.table)
+
+    def __repr__(self):
+        return f"DatasetHandle({self.view!r}, {self.digest[:12]}, {len(self)} rows)"
+
+    @property
+    def rows(self):
+        return self.table.index.to_numpy()
+
+    def key(self, *parts):
+        """
+        Cache key of something computed from this dataset and small ``parts``.
+        """
+        return render_key(self.view, self.digest, *parts)
+
+    def memo(self, name, fn):
+        """
+        ``fn()`` computed once per handle (i.e. once per dataset content).
+        """
+        with self._lock:
+            if name not in self._memo:
+                self._memo[name] = fn()
+            return self._memo[name]
+
+
+def hash_handle(handle):
+    return handle.digest
+
+
+# for st.cache_resource / st.cache_data(hash_funcs=...)
+HASH_FUNCS = {DatasetHandle: hash_handle}
+
+
+# -------------------------
+# Digests
+# -------------------------
+def _file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def embeddings_digest(view, paths, root=ingest.COLUMNAR_DIR):
+    """
+    Digest of the embedding files of ``view``, re-hashed only when their
+    size or mtime changed.
+    """
+    sidecar = ingest.columnar_path(view, root).with_name(f"{view}.embeddings.json")
+    stats = {str(p): _stat(p) for p in paths}
+    try:
+        with open(sidecar, encoding="utf-8") as f:
+            recorded = json.load(f)
+        if recorded["stats"] == stats:
+            return recorded["digest"]
+    except (OSError, ValueError, KeyError):
+        pass
+    h = hashlib.sha256()
+    for path in sorted(stats):
+        h.update(f"{os.path.basename(path)}:{_file_digest(path)}".encode())
+    digest = h.hexdigest()
+    try:
+        sidecar.parent.mkdir(parents=True, exist_ok=True)
+        tmp = sidecar.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"stats": stats, "digest": digest}, f)
+        os.replace(tmp, sidecar)
+    except OSError:
+        pass
+    return digest
+
+
+# -------------------------
+# Loading
+# -------------------------
+_handles = {}
+_handles_lock = threading.Lock()
+
+
+def load_dataset(view):
+    """
+    Process-wide handle of ``view``: reused as long as the table and the
+    embedding files are unchanged (only their metadata is checked).
+    """
+    metadata = ingest.table_metadata(view)
+    store = get_store(EMBEDDINGS_PATHS[view])
+    paths = [str(p) for p in format_paths(store.path, store.format)]
+    stamp = (metadata["digest"], tuple(tuple(_stat(p)) for p in paths))
+    with _handles_lock:
+        cached = _handles.get(view)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        digest = hashlib.sha256(
+            f"{view}:{metadata['digest']}:{embeddings_digest(view, paths)}".encode()
+        ).hexdigest()
+        handle = DatasetHandle(view, digest, ingest.load_table(view), store)
+        _handles[view] = (stamp, handle)
+        return handle
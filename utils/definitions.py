@@ -0,0 +1,57 @@
+"""
+Topic definitions of the study.
+
+The five themes shown in the sidebar of app.py, shared with the batch
+classifier (utils.classify). Participants can add their own themes in a
+JSON file:
+
+    {
+        "Petit-déjeuner": "Qualité, variété et service du petit-déjeuner.",
+        "Propreté": {"definition": "Propreté de la chambre et des parties communes.", "threshold": 0.25}
+    }
+
+A theme may come with its own similarity threshold; a theme with the name
+of a predefined one replaces its definition.
+"""
+import json
+
+TOPIC_DEFINITIONS = {
+    "Chambre": "Qualité, taille, propreté, confort et équipements de la chambre.",
+    "Emplacement": "Localisation de l’hôtel dans la ville, proximité des attractions et accessibilité.",
+    "Ambiance": "Atmosphère générale, décoration, style, charme ou modernité ressentie.",
+    "Rapport qualité-prix": "Adéquation entre le prix payé et l’expérience vécue.",
+    "Personnel": "Accueil, amabilité, professionnalisme et disponibilité du personnel."
+}
+
+
+def parse_definitions(raw):
+    """
+    ``{name: definition}`` and ``{name: threshold}`` (themes that set one)
+    from a JSON-like dict of user definitions.
+    """
+    definitions, thresholds = {}, {}
+    for name, value in raw.items():
+        if isinstance(value, dict):
+            if "definition" not in value:
+                raise ValueError(f"Le thème « {name} » n'a pas de définition")
+            definitions[name] = str(value["definition"])
+            if value.get("threshold") is not None:
+                thresholds[name] = float(value["threshold"])
+        else:
+            definitions[name] = str(value)
+    return definitions, thresholds
+
+
+def load_definitions(paths=(), include_defaults=True):
+    """
+    Predefined themes (unless ``include_defaults`` is false) followed by the
+    themes of each JSON file in ``paths``. Returns ``(definitions, thresholds)``.
+    """
+    definitions = dict(TOPIC_DEFINITIONS) if include_defaults else {}
+    thresholds = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            added, added_thresholds = parse_definitions(json.load(f))
+        definitions.update(added)
+        thresholds.update(added_thresholds)
+    return definitions, thresholds
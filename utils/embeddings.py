@@ -0,0 +1,269 @@
+"""
+Memory-mapped embedding store.
+
+Embedding matrices are opened with ``np.load(mmap_mode='r')`` and shared
+read-only: every Streamlit session (and every process on the host, through
+the page cache) reads the same pages instead of holding its own copy.
+
+Besides the original float32 ``.npy`` files, two compact on-disk formats
+are supported, stored next to the original:
+
+    <name>.f16.npy                     float16 matrix
+    <name>.i8.npy + <name>.i8.scale.npy  int8 matrix with a float32 scale per row
+
+Conversion and accuracy check:
+
+    python -m utils.embeddings convert public/keywords_embeddings.npy --format int8
+    python -m utils.embeddings check public/keywords_embeddings.npy --format int8
+
+A passing check is recorded in ``<name>.i8.check.json`` (``.f16.`` for
+float16); from then on the default "auto" format loads the compact file
+instead of the original, until either file changes.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+
+FORMATS = ("float32", "float16", "int8")
+# "auto" picks the most compact format with a passing check, else the first
+# existing file in FORMATS order
+EMBEDDINGS_FORMAT = os.environ.get("TOPIC_EMBEDDINGS_FORMAT", "auto")
+
+
+def format_paths(path, fmt):
+    """
+    Files holding ``path`` in the given format (matrix first, then scale for int8).
+    """
+    path = Path(path)
+    if fmt == "float32":
+        return [path]
+    stem = path.with_suffix("")
+    if fmt == "float16":
+        return [Path(f"{stem}.f16.npy")]
+    if fmt == "int8":
+        return [Path(f"{stem}.i8.npy"), Path(f"{stem}.i8.scale.npy")]
+    raise ValueError(f"Unknown embeddings format: {fmt!r}")
+
+
+def check_path(path, fmt):
+    """
+    Record of the last passing ``check`` of ``path`` in a compact format.
+    """
+    return Path(f"{Path(path).with_suffix('')}.{'f16' if fmt == 'float16' else 'i8'}.check.json")
+
+
+def _stamps(path, fmt):
+    return [[os.stat(p).st_size, os.stat(p).st_mtime_ns] for p in [Path(path)] + format_paths(path, fmt)]
+
+
+def checked(path, fmt):
+    """
+    Whether ``fmt`` passed ``check`` against the current original and compact files.
+    """
+    try:
+        with open(check_path(path, fmt), encoding="utf-8") as f:
+            record = json.load(f)
+        return record["stamps"] == _stamps(path, fmt)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def resolve_format(path, fmt="auto"):
+    if fmt != "auto":
+        return fmt
+    for candidate in reversed(FORMATS[1:]):
+        if checked(path, candidate):
+            return candidate
+    for candidate in FORMATS:
+        if all(p.exists() for p in format_paths(path, candidate)):
+            return candidate
+    raise FileNotFoundError(f"No embeddings found for {path}")
+
+
+class EmbeddingStore:
+    """
+    Read-only view over an embedding matrix stored on disk.
+
+    ``store[idx]`` returns the requested rows as float32 (only those rows are
+    copied); ``store.raw`` is the underlying memory map.
+    """
+
+    def __init__(self, path, fmt="auto"):
+        self.path = Path(path)
+        self.format = resolve_format(path, fmt)
+        files = format_paths(path, self.format)
+        self.raw = np.load(files[0], mmap_mode="r")
+        self.scale = np.load(files[1], mmap_mode="r") if self.format == "int8" else None
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    def __len__(self):
+        return self.raw.shape[0]
+
+    def __getitem__(self, idx):
+        rows = np.asarray(self.raw[idx], dtype=np.float32)
+        if self.scale is not None:
+            rows *= np.asarray(self.scale[idx], dtype=np.float32)[..., None]
+        return rows
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self[:]
+        return dense if dtype is None else dense.astype(dtype, copy=False)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path, fmt=None):
+    """
+    Process-wide shared store for ``path`` (opened once, never copied).
+    The store is reopened if the file on disk changed.
+    """
+    fmt = fmt or EMBEDDINGS_FORMAT
+    resolved = resolve_format(path, fmt)
+    stamp = tuple(os.stat(p).st_mtime_ns for p in format_paths(path, resolved))
+    key = (str(path), fmt)
+    with _stores_lock:
+        cached = _stores.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, EmbeddingStore(path, resolved))
+            _stores[key] = cached
+        return cached[1]
+
+
+# -------------------------
+# Quantization
+# -------------------------
+def quantize_int8(embeddings):
+    """
+    Symmetric per-row int8 quantization: ``x ~= q * scale[:, None]``.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    scale = np.abs(embeddings).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.rint(embeddings / scale[:, None]).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+def convert(path, fmt, chunk_size=65536):
+    """
+    Write the compact version of a float32 ``.npy`` file, chunk by chunk.
+    """
+    source = np.load(path, mmap_mode="r")
+    files = format_paths(path, fmt)
+    if fmt == "float32":
+        return files
+    dtype = np.float16 if fmt == "float16" else np.int8
+    out = np.lib.format.open_memmap(files[0], mode="w+", dtype=dtype, shape=source.shape)
+    scale_out = None
+    if fmt == "int8":
+        scale_out = np.lib.format.open_memmap(files[1], mode="w+", dtype=np.float32, shape=(source.shape[0],))
+    for start in range(0, source.shape[0], chunk_size):
+        block = np.asarray(source[start:start + chunk_size], dtype=np.float32)
+        if fmt == "float16":
+            out[start:start + len(block)] = block.astype(np.float16)
+        else:
+            q, scale = quantize_int8(block)
+            out[start:start + len(block)] = q
+            scale_out[start:start + len(block)] = scale
+    out.flush()
+    if scale_out is not None:
+        scale_out.flush()
+    return files
+
+
+def _normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def nearest_centroid(embeddings, centroids):
+    return (_normalize(embeddings) @ _normalize(centroids).T).argmax(axis=1)
+
+
+def assignment_agreement(original, compact, topics):
+    """
+    Compare topic assignments made with the original and the compact matrix.
+
+    Centroids are the per-topic means of the original embeddings; every row
+    is assigned to its nearest centroid (cosine) with both matrices.
+    """
+    original = np.asarray(original, dtype=np.float32)
+    compact = np.asarray(compact, dtype=np.float32)
+    topics = np.asarray(topics)
+    labels, codes = np.unique(topics, return_inverse=True)
+    centroids = np.zeros((len(labels), original.shape[1]), dtype=np.float32)
+    np.add.at(centroids, codes, _normalize(original))
+    ref = nearest_centroid(original, centroids)
+    new = nearest_centroid(compact, centroids)
+    row_cos = np.sum(_normalize(original) * _normalize(compact), axis=1)
+    return {
+        "agreement": float(np.mean(ref == new)),
+        "n_changed": int(np.sum(ref != new)),
+        "min_row_cosine": float(row_cos.min()),
+        "mean_row_cosine": float(row_cos.mean()),
+    }
+
+
+def _reference_topics(path, original):
+    """
+    Topics of the prebuilt artifacts when they match this matrix, else a KMeans(30) fit.
+    """
+    from . import artifacts, modeling
+
+    for view, emb_path in (("keywords", modeling.KEYWORDS_EMBEDDINGS_PATH),
+                           ("sentences", modeling.SENTENCES_EMBEDDINGS_PATH)):
+        if Path(emb_path) == Path(path):
+            built = artifacts.load_artifacts(view)
+            if built is not None and len(built.topics) == len(original):
+                return built.topics
+    from sklearn.cluster import KMeans
+
+    return KMeans(n_clusters=min(30, len(original)), random_state=42).fit_predict(original)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert and check compact embedding files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("convert", "check"):
+        p = sub.add_parser(name)
+        p.add_argument("path", help="original float32 .npy file")
+        p.add_argument("--format", choices=FORMATS[1:], default="int8")
+    sub.choices["check"].add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        files = convert(args.path, args.format)
+        before = os.path.getsize(args.path)
+        after = sum(os.path.getsize(f) for f in files)
+        print(f"{args.path} -> {', '.join(map(str, files))} ({before / 1e6:.1f} MB -> {after / 1e6:.1f} MB)")
+        return 0
+
+    original = np.load(args.path, mmap_mode="r")
+    compact = EmbeddingStore(args.path, args.format)
+    report = assignment_agreement(original, compact[:], _reference_topics(args.path, original))
+    for name, value in report.items():
+        print(f"{name}: {value}")
+    record = check_path(args.path, args.format)
+    if report["agreement"] < args.min_agreement:
+        record.unlink(missing_ok=True)
+        print(f"agreement below {args.min_agreement}", file=sys.stderr)
+        return 1
+    with open(record, "w", encoding="utf-8") as f:
+        json.dump({**report, "min_agreement": args.min_agreement,
+                   "stamps": _stamps(args.path, args.format)}, f, indent=2)
+    print(f"-> {record} ('auto' now loads {args.format})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
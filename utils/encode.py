@@ -0,0 +1,289 @@
+"""
+Incremental embedding pipeline.
+
+Reads ``sentences.tsv`` / ``keywords.csv`` in chunks and writes the
+row-aligned embedding matrices used by the views:
+
+    python -m utils.encode                 # every view whose .npy is missing
+    python -m utils.encode sentences       # (re)build a single view
+
+A matrix without a ``.json`` sidecar was not written here (the shipped
+``keywords_embeddings.npy`` has a sidecar marking it as prebuilt) and is
+only replaced with ``--force``.
+
+Texts are encoded with a local sentence-transformers model
+(``TOPIC_EMBEDDING_MODEL``: a local directory or an already downloaded hub
+id). When no weights are available, an offline TF-IDF + SVD encoder is
+fitted once on the corpus and frozen.
+
+Vectors are cached per text content hash and per encoder in
+``public/.embed_cache/<encoder id>/``, so appending reviews only encodes
+the new rows.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import modeling
+
+EMBED_CACHE_DIR = Path(os.environ.get("TOPIC_EMBED_CACHE_DIR", "public/.embed_cache"))
+EMBEDDING_MODEL = os.environ.get("TOPIC_EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+CHUNK_SIZE = 10_000
+# Encoder id of a matrix shipped with the repository rather than written by embed_file
+PREBUILT = "prebuilt"
+
+# view -> (data file, read_csv kwargs, text column, output matrix)
+TARGETS = {
+    "sentences": (modeling.SENTENCES_PATH, {"sep": "\t"}, "text", modeling.SENTENCES_EMBEDDINGS_PATH),
+    "keywords": (modeling.KEYWORDS_PATH, {}, "item", modeling.KEYWORDS_EMBEDDINGS_PATH),
+}
+
+
+def text_hashes(texts):
+    """
+    16-byte content hash of every text.
+    """
+    return np.array(
+        [hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest() for t in texts],
+        dtype="S16",
+    )
+
+
+# -------------------------
+# Encoders
+# -------------------------
+class SentenceTransformerEncoder:
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+
+        # Never download: only weights already present on this machine are used
+        self.model = SentenceTransformer(model_name, local_files_only=True)
+        self.model_name = model_name
+        self.id = "st-" + Path(model_name).name
+
+    def encode(self, texts):
+        return self.model.encode(list(texts), batch_size=64, convert_to_numpy=True).astype(np.float32)
+
+
+class TfidfSvdEncoder:
+    """
+    Offline fallback: word uni/bigram TF-IDF projected with a TruncatedSVD.
+    Fitted once, then frozen so cached vectors stay valid.
+    """
+
+    def __init__(self, n_components=256, max_features=20_000):
+        self.n_components = n_components
+        self.max_features = max_features
+        self.vectorizer = None
+        self.svd = None
+        self.id = None
+
+    def fit(self, texts, max_samples=200_000):
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        texts = list(texts)
+        if len(texts) > max_samples:
+            rng = np.random.default_rng(42)
+            texts = [texts[i] for i in rng.choice(len(texts), max_samples, replace=False)]
+        self.vectorizer = TfidfVectorizer(
+            ngram_range=(1, 2), max_features=self.max_features, strip_accents="unicode",
+            sublinear_tf=True, dtype=np.float32,
+        )
+        tfidf = self.vectorizer.fit_transform(texts)
+        n_components = max(1, min(self.n_components, tfidf.shape[1] - 1, len(texts) - 1))
+        self.svd = TruncatedSVD(n_components=n_components, random_state=42).fit(tfidf)
+        self.svd.components_ = self.svd.components_.astype(np.float32)
+        digest = hashlib.sha256(pickle.dumps((self.vectorizer.idf_, self.svd.components_))).hexdigest()[:12]
+        self.id = f"tfidf-svd-{digest}"
+        return self
+
+    def encode(self, texts):
+        x = self.svd.transform(self.vectorizer.transform(list(texts)))
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (x / norms).astype(np.float32)
+
+
+def _iter_texts(path, read_kwargs, column, chunk_size=CHUNK_SIZE):
+    for chunk in pd.read_csv(path, usecols=[column], chunksize=chunk_size, **read_kwargs):
+        yield chunk[column].fillna("").astype(str).tolist()
+
+
+def load_fallback_encoder(corpus_paths=None, cache_dir=EMBED_CACHE_DIR):
+    """
+    The frozen TF-IDF + SVD encoder, fitted on the view corpora the first time.
+    """
+    path = Path(cache_dir) / "tfidf_svd.pkl"
+    if path.exists():
+        # Plain state dict: stays loadable whether this module ran as __main__ or not
+        with open(path, "rb") as f:
+            encoder = TfidfSvdEncoder()
+            encoder.__dict__.update(pickle.load(f))
+            return encoder
+    texts = []
+    for data_path, read_kwargs, column, _ in (corpus_paths or TARGETS.values()):
+        if os.path.exists(data_path):
+            for chunk in _iter_texts(data_path, read_kwargs, column):
+                texts.extend(chunk)
+    encoder = TfidfSvdEncoder().fit(texts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        pickle.dump(encoder.__dict__, f)
+    return encoder
+
+
+def load_encoder(model_name=EMBEDDING_MODEL, cache_dir=EMBED_CACHE_DIR):
+    """
+    Local sentence-transformers model if its weights are available, else the
+    offline TF-IDF + SVD encoder.
+    """
+    try:
+        return SentenceTransformerEncoder(model_name)
+    except Exception:
+        return load_fallback_encoder(cache_dir=cache_dir)
+
+
+def encoder_for(embeddings_path, cache_dir=EMBED_CACHE_DIR):
+    """
+    Encoder that produced ``embeddings_path`` (recorded in its .json sidecar),
+    to embed new texts in the same space.
+    """
+    with open(Path(embeddings_path).with_suffix(".json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta["encoder"] == PREBUILT:
+        raise ValueError(f"{embeddings_path} ships prebuilt and its encoder is not distributed")
+    if meta["encoder"].startswith("tfidf-svd-"):
+        encoder = load_fallback_encoder(cache_dir=cache_dir)
+    else:
+        encoder = SentenceTransformerEncoder(meta["model"])
+    if encoder.id != meta["encoder"]:
+        raise ValueError(f"{embeddings_path} was built with {meta['encoder']}, available encoder is {encoder.id}")
+    return encoder
+
+
+# -------------------------
+# Content-hash cache
+# -------------------------
+class VectorCache:
+    """
+    Append-only store of ``hash -> vector`` for one encoder: every run that
+    encodes new texts adds a ``part-*.npz`` file with only those rows.
+    """
+
+    def __init__(self, encoder_id, cache_dir=EMBED_CACHE_DIR):
+        self.dir = Path(cache_dir) / encoder_id
+        self.index = {}
+        self.parts = []
+        for part in sorted(self.dir.glob("part-*.npz")):
+            with np.load(part) as data:
+                hashes, vectors = data["hashes"], data["vectors"]
+            offset = len(self.parts)
+            self.parts.append(vectors)
+            for row, h in enumerate(hashes.tolist()):
+                self.index[h] = (offset, row)
+
+    def __contains__(self, h):
+        return h in self.index
+
+    def lookup(self, hashes):
+        return np.stack([self.parts[p][r] for p, r in (self.index[h] for h in hashes)])
+
+    def add(self, hashes, vectors):
+        if len(hashes) == 0:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        part = self.dir / f"part-{len(self.parts):05d}.npz"
+        np.savez(part, hashes=np.asarray(hashes, dtype="S16"), vectors=vectors)
+        offset = len(self.parts)
+        self.parts.append(vectors)
+        for row, h in enumerate(hashes):
+            self.index[h] = (offset, row)
+
+
+def embed_file(data_path, read_kwargs, column, out_path, encoder, cache_dir=EMBED_CACHE_DIR, chunk_size=CHUNK_SIZE):
+    """
+    Write the embedding matrix of ``data_path`` row by row, encoding only
+    texts missing from the cache. Returns ``(n_rows, n_encoded)``.
+    """
+    cache = VectorCache(encoder.id, cache_dir)
+    n_rows = sum(len(chunk) for chunk in _iter_texts(data_path, read_kwargs, column, chunk_size))
+    out = None
+    start = 0
+    n_encoded = 0
+    for texts in _iter_texts(data_path, read_kwargs, column, chunk_size):
+        hashes = text_hashes(texts).tolist()
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cache and h not in missing:
+                missing[h] = t
+        if missing:
+            cache.add(list(missing), encoder.encode(list(missing.values())))
+            n_encoded += len(missing)
+        vectors = cache.lookup(hashes)
+        if out is None:
+            tmp_path = Path(out_path).with_suffix(".tmp.npy")
+            out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(n_rows, vectors.shape[1]))
+        out[start:start + len(vectors)] = vectors
+        start += len(vectors)
+    if out is None:
+        raise ValueError(f"{data_path} is empty")
+    out.flush()
+    del out
+    os.replace(tmp_path, out_path)
+    meta = {"encoder": encoder.id, "model": getattr(encoder, "model_name", None),
+            "source": str(data_path), "column": column, "n_rows": n_rows}
+    with open(Path(out_path).with_suffix(".json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return n_rows, n_encoded
+
+
+def is_prebuilt(embeddings_path):
+    """
+    Whether ``embeddings_path`` exists and was not written by ``embed_file``.
+    """
+    embeddings_path = Path(embeddings_path)
+    if not embeddings_path.exists():
+        return False
+    sidecar = embeddings_path.with_suffix(".json")
+    if not sidecar.exists():
+        return True
+    with open(sidecar, encoding="utf-8") as f:
+        return json.load(f)["encoder"] == PREBUILT
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compute the embedding matrices of the views.")
+    parser.add_argument("views", nargs="*", help=f"views to embed among {', '.join(TARGETS)} (default: missing ones)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="local sentence-transformers model")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--force", action="store_true", help="also replace prebuilt matrices")
+    args = parser.parse_args(argv)
+    unknown = set(args.views) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown views: {', '.join(sorted(unknown))}")
+    if not args.force:
+        prebuilt = [v for v in args.views if is_prebuilt(TARGETS[v][3])]
+        if prebuilt:
+            parser.error(f"{', '.join(prebuilt)}: the matrix ships prebuilt, "
+                         "and the artifacts and sweeps built on it would no longer match; use --force to replace it")
+
+    views = args.views or [v for v, target in TARGETS.items() if not os.path.exists(target[3])]
+    if not views:
+        print("All embedding matrices exist; name a view to rebuild it.")
+        return
+    encoder = load_encoder(args.model)
+    for view in views:
+        data_path, read_kwargs, column, out_path = TARGETS[view]
+        n_rows, n_encoded = embed_file(data_path, read_kwargs, column, out_path, encoder, chunk_size=args.chunk_size)
+        print(f"[{view}] {n_rows} rows ({n_encoded} newly encoded with {encoder.id}) -> {out_path}")
+
+
+if __name__ == "__main__":
+    main()
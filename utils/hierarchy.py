@@ -0,0 +1,194 @@
+"""
+Hierarchical topic tree: any number of topics from one build.
+
+A fine-grained KMeans (up to 200 clusters) runs once on the clustering-space
+reduction, then the fine centroids are merged with Ward linkage. Cutting the
+tree at K is a lookup of the precomputed fine -> coarse map, and the labels
+of the K topics are summed from per-fine-cluster term counts, so the app can
+move a K slider live. Cuts are nested: going from K to K-1 merges exactly
+two topics ("is the bathroom part of the room?").
+
+    python -m utils.hierarchy              # build both views
+    python -m utils.hierarchy sentences
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from . import artifacts, ingest, modeling, preprocess, topic_summary
+from .embeddings import get_store
+from .online import c_tf_idf, topic_indicator
+from .reductions import load_reductions
+
+HIERARCHY_DIR = artifacts.ARTIFACTS_DIR / "hierarchy"
+N_FINE = 200
+MIN_K, MAX_K = 2, 50
+
+
+class TopicTree:
+    """
+    Fine clusters of every document plus the nested fine -> coarse map of each K.
+    """
+
+    def __init__(self, fine_labels, linkage, cuts, fine_terms, vocabulary, label_mode, coords):
+        self.fine_labels = np.asarray(fine_labels)
+        self.linkage = np.asarray(linkage)
+        self.cuts = np.asarray(cuts)          # (MAX_K - MIN_K + 1, n_fine)
+        self.fine_terms = sparse.csr_matrix(fine_terms)
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        self.label_mode = label_mode          # "frequency" (keywords) or "ctfidf" (reviews)
+        self.coords = np.asarray(coords)
+        self.digest = None                    # content digest of the saved tree (see load_tree)
+
+    @property
+    def max_k(self):
+        return MIN_K + len(self.cuts) - 1
+
+    def coarse_map(self, k):
+        return self.cuts[k - MIN_K]
+
+    def labels(self, k):
+        fine_to_coarse = self.coarse_map(k)
+        terms = topic_indicator(fine_to_coarse, k) @ self.fine_terms
+        if self.label_mode == "ctfidf":
+            terms = c_tf_idf(terms)
+        return topic_summary.labels_from_matrix(terms, self.vocabulary, np.arange(k))
+
+    def cut(self, k):
+        """
+        Topic assignments, labels and layout for K topics.
+        """
+        return artifacts.ViewArtifacts(
+            topics=self.coarse_map(k)[self.fine_labels],
+            labels=self.labels(k),
+            coords=self.coords,
+            # render caches key on the version: it must change with the tree's content
+            version=f"tree-k{k}" if self.digest is None else f"tree-{self.digest[:12]}-k{k}",
+        )
+
+    def merged_at(self, k):
+        """
+        The topics of the K-topic cut that are merged into one at K-1 (None
+        if both cuts are the same partition, as ties in the linkage allow).
+        """
+        if k <= MIN_K:
+            return None
+        upper, lower = self.coarse_map(k), self.coarse_map(k - 1)
+        pairs = np.unique(np.stack([upper, lower], axis=1), axis=0)
+        parents, counts = np.unique(pairs[:, 1], return_counts=True)
+        if not (counts > 1).any():
+            return None
+        merged = pairs[pairs[:, 1] == parents[counts > 1][0], 0]
+        return tuple(int(t) for t in merged)
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def save(self, path):
+        terms = self.fine_terms
+        np.savez(
+            path,
+            fine_labels=self.fine_labels, linkage=self.linkage, cuts=self.cuts,
+            terms_data=terms.data, terms_indices=terms.indices, terms_indptr=terms.indptr,
+            terms_shape=terms.shape, vocabulary=self.vocabulary.astype(str),
+            label_mode=self.label_mode, coords=self.coords,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            fine_terms = sparse.csr_matrix(
+                (d["terms_data"], d["terms_indices"], d["terms_indptr"]), shape=tuple(d["terms_shape"])
+            )
+            return cls(d["fine_labels"], d["linkage"], d["cuts"], fine_terms,
+                       d["vocabulary"].tolist(), str(d["label_mode"]), d["coords"])
+
+
+def build_tree(cluster_space, doc_terms, vocabulary, label_mode, coords, n_fine=N_FINE, max_k=MAX_K):
+    """
+    Fine KMeans + Ward merging of the fine centroids (unweighted by cluster size).
+    ``doc_terms`` is a (n_docs, n_terms) weight matrix used for the labels.
+    """
+    from scipy.cluster.hierarchy import fcluster, linkage
+    from sklearn.cluster import KMeans
+
+    if len(cluster_space) < 2:
+        raise ValueError(f"A topic tree needs at least 2 documents, got {len(cluster_space)}")
+    n_fine = max(2, min(n_fine, len(cluster_space) // 5))
+    max_k = min(max_k, n_fine)
+    kmeans = KMeans(n_clusters=n_fine, random_state=42).fit(cluster_space)
+    fine_labels = kmeans.labels_
+    tree = linkage(kmeans.cluster_centers_, method="ward")
+    cuts = np.stack([fcluster(tree, k, criterion="maxclust") - 1 for k in range(MIN_K, max_k + 1)])
+    fine_terms = topic_indicator(fine_labels, n_fine) @ doc_terms
+    return TopicTree(fine_labels, tree, cuts, fine_terms, vocabulary, label_mode, coords)
+
+
+def build_view_tree(view):
+    if view == "keywords":
+        keywords_df = ingest.load_table("keywords", ["item", "count"])
+        df_filtered = keywords_df[keywords_df['count'] >= modeling.MIN_FREQ]
+        embeddings = get_store(modeling.KEYWORDS_EMBEDDINGS_PATH)[df_filtered.index.to_numpy()]
+        term_codes, vocabulary = pd.factorize(df_filtered['item'])
+        # one "document" per keyword, weighted by its frequency
+        doc_terms = sparse.csr_matrix(
+            (df_filtered['count'].to_numpy(dtype=np.float64), (np.arange(len(term_codes)), term_codes)),
+            shape=(len(term_codes), len(vocabulary)),
+        )
+        label_mode = "frequency"
+    elif view == "sentences":
+        sentences_df = ingest.load_table("sentences", [])
+        embeddings = get_store(modeling.SENTENCES_EMBEDDINGS_PATH)[sentences_df.index.to_numpy()]
+        sentence_terms = preprocess.load_doc_terms("sentences")
+        doc_terms, vocabulary = sentence_terms.matrix, sentence_terms.vocabulary
+        label_mode = "ctfidf"
+    else:
+        raise ValueError(f"Unknown view: {view!r}")
+    reduced = load_reductions(view, embeddings)
+    return build_tree(reduced.cluster, doc_terms, np.asarray(vocabulary, dtype=object), label_mode, reduced.layout)
+
+
+def save_tree(view, tree, root=HIERARCHY_DIR):
+    Path(root).mkdir(parents=True, exist_ok=True)
+    tree.save(Path(root) / f"{view}.npz")
+    with open(Path(root) / f"{view}.json", "w", encoding="utf-8") as f:
+        json.dump({"view": view, "sources": artifacts.source_fingerprints(view)}, f, indent=2)
+
+
+def load_tree(view, root=HIERARCHY_DIR):
+    """
+    Persisted tree of ``view``, or None if missing or built from other data files.
+    """
+    try:
+        with open(Path(root) / f"{view}.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not artifacts.sources_match(manifest, view):
+        return None
+    path = Path(root) / f"{view}.npz"
+    tree = TopicTree.load(path)
+    tree.digest = artifacts.file_digest(path)
+    return tree
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the hierarchical topic trees.")
+    parser.add_argument("views", nargs="*", help=f"views to build among {', '.join(artifacts.VIEWS)} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = set(args.views) - set(artifacts.VIEWS)
+    if unknown:
+        parser.error(f"unknown views: {', '.join(sorted(unknown))}")
+
+    for view in args.views or artifacts.VIEWS:
+        tree = build_view_tree(view)
+        save_tree(view, tree)
+        print(f"[{view}] {len(tree.fine_labels)} documents, {tree.fine_terms.shape[0]} fine clusters, K up to {tree.max_k}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Columnar ingestion of the raw keyword / review files.
+
+The raw ``keywords.csv`` and ``sentences.tsv`` are streamed in chunks,
+validated (required columns and types), de-duplicated and written once to
+an uncompressed Arrow IPC (Feather v2) file in ``public/.columnar/``.
+Reading it back memory-maps the file: only the requested columns are
+touched, numeric columns are zero-copy, strings stay Arrow-backed and the
+review sentiment comes back as a categorical.
+
+Every row keeps its line number in the raw file (``source_row``), which is
+also the row of its embedding; loaded tables use it as their index, so
+``store[df.index]`` always selects the right embeddings.
+
+The columnar file records the size and mtime of the raw file it was built
+from, plus a digest of the rows it holds (see utils.datasets), and is
+rebuilt automatically when the raw file changes:
+
+    python -m utils.ingest              # both views
+    python -m utils.ingest sentences
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import modeling
+
+COLUMNAR_DIR = Path(os.environ.get("TOPIC_COLUMNAR_DIR", "public/.columnar"))
+CHUNK_SIZE = 100_000
+INGEST_VERSION = 2
+
+# view -> raw file, separator, required columns and their type, de-duplication key
+SCHEMAS = {
+    "keywords": {
+        "path": modeling.KEYWORDS_PATH,
+        "sep": ",",
+        "columns": {"item": "string", "count": "int64"},
+        "key": ["item"],
+    },
+    "sentences": {
+        "path": modeling.SENTENCES_PATH,
+        "sep": "\t",
+        "columns": {"sentiment": "category", "text": "string"},
+        "key": ["sentiment", "text"],
+    },
+}
+
+
+class SchemaError(ValueError):
+    """
+    The raw file does not have the expected columns or types.
+    """
+
+
+def columnar_path(view, root=COLUMNAR_DIR):
+    return Path(root) / f"{view}.arrow"
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {"source": str(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "version": INGEST_VERSION}
+
+
+def _validate(chunk, schema, path, first_row):
+    missing = set(schema["columns"]) - set(chunk.columns)
+    if missing:
+        raise SchemaError(f"{path} doit contenir les colonnes {', '.join(sorted(schema['columns']))} "
+                          f"(manquantes : {', '.join(sorted(missing))})")
+    chunk = chunk[list(schema["columns"])]
+    empty = chunk.isna().any(axis=1).to_numpy()
+    if empty.any():
+        rows = (np.flatnonzero(empty)[:5] + first_row + 2).tolist()  # file line numbers (header is line 1)
+        raise SchemaError(f"{path} : valeurs manquantes lignes {rows}")
+    for column, dtype in schema["columns"].items():
+        if dtype == "int64":
+            values = pd.to_numeric(chunk[column], errors="coerce")
+            if values.isna().any():
+                rows = (np.flatnonzero(values.isna())[:5] + first_row + 2).tolist()
+                raise SchemaError(f"{path} : '{column}' doit être entier (lignes {rows})")
+            chunk = chunk.assign(**{column: values.astype(np.int64)})
+        else:
+            chunk = chunk.assign(**{column: chunk[column].astype(str)})
+    return chunk
+
+
+def ingest(view, root=COLUMNAR_DIR, chunk_size=CHUNK_SIZE, source=None):
+    """
+    Stream the raw file of ``view`` (or ``source``, a file with the same
+    schema) into its columnar file. Returns a report.
+    """
+    import pyarrow as pa
+
+    schema = SCHEMAS[view]
+    path = source or schema["path"]
+    stamp = _source_stamp(path)
+    out = columnar_path(view, root)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_suffix(".tmp")
+
+    # categories grow as they are met: earlier codes stay valid
+    categories = {c: {} for c, dtype in schema["columns"].items() if dtype == "category"}
+    seen = set()
+    digest = hashlib.blake2b(digest_size=16)
+    n_rows = n_kept = 0
+    writer = None
+    try:
+        reader = pd.read_csv(path, sep=schema["sep"], chunksize=chunk_size, dtype=str,
+                             keep_default_na=False, na_values=[""])
+        for chunk in reader:
+            chunk = _validate(chunk, schema, path, n_rows)
+            chunk.insert(0, "source_row", np.arange(n_rows, n_rows + len(chunk), dtype=np.int64))
+            n_rows += len(chunk)
+
+            # de-duplicate on the key columns, within the chunk and against earlier chunks
+            hashes = pd.util.hash_pandas_object(chunk[schema["key"]], index=False).to_numpy()
+            keep = ~pd.Series(hashes).duplicated().to_numpy()
+            keep &= np.fromiter((h not in seen for h in hashes.tolist()), dtype=bool, count=len(hashes))
+            seen.update(hashes[keep].tolist())
+            chunk = chunk[keep]
+            n_kept += len(chunk)
+            # content digest of the kept rows, every column included
+            digest.update(chunk["source_row"].to_numpy().tobytes())
+            digest.update(pd.util.hash_pandas_object(chunk[list(schema["columns"])], index=False).to_numpy().tobytes())
+
+            arrays = {"source_row": pa.array(chunk["source_row"].to_numpy())}
+            for column, dtype in schema["columns"].items():
+                if dtype == "category":
+                    codes = categories[column]
+                    arrays[column] = pa.array(
+                        np.fromiter((codes.setdefault(v, len(codes)) for v in chunk[column]), dtype=np.int32,
+                                    count=len(chunk))
+                    )
+                elif dtype == "int64":
+                    arrays[column] = pa.array(chunk[column].to_numpy())
+                else:
+                    arrays[column] = pa.array(chunk[column].tolist(), type=pa.large_string())
+            batch = pa.RecordBatch.from_pydict(arrays)
+            if writer is None:
+                writer = pa.ipc.new_file(str(tmp), batch.schema)
+            writer.write_batch(batch)
+        if writer is None:
+            raise SchemaError(f"{path} est vide")
+        writer.close()
+        writer = None
+
+        # source stamp, counts and category names live in a sidecar next to the Arrow file
+        metadata = {**stamp, "rows": n_rows, "kept": n_kept, "digest": digest.hexdigest(),
+                    "categories": {c: list(codes) for c, codes in categories.items()}}
+        meta_tmp = out.with_suffix(".json.tmp")
+        with open(meta_tmp, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        os.replace(tmp, out)
+        os.replace(meta_tmp, out.with_suffix(".json"))
+    finally:
+        if writer is not None:
+            writer.close()
+        tmp.unlink(missing_ok=True)
+    return metadata
+
+
+def _metadata(view, root):
+    try:
+        with open(columnar_path(view, root).with_suffix(".json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_current(view, root=COLUMNAR_DIR, source=None):
+    metadata = _metadata(view, root)
+    if metadata is None or not columnar_path(view, root).exists():
+        return False
+    return metadata == {**metadata, **_source_stamp(source or SCHEMAS[view]["path"])}
+
+
+_ingest_lock = threading.Lock()
+
+
+def table_metadata(view, root=COLUMNAR_DIR, source=None):
+    """
+    Metadata of the columnar file of ``view`` (ingested first if missing or stale).
+    """
+    with _ingest_lock:
+        if not is_current(view, root, source):
+            ingest(view, root, source=source)
+        return _metadata(view, root)
+
+
+def load_table(view, columns=None, root=COLUMNAR_DIR, source=None):
+    """
+    DataFrame of ``view`` (only ``columns`` if given) indexed by ``source_row``,
+    memory-mapped from the columnar file (ingested first if missing or stale).
+    """
+    import pyarrow as pa
+
+    schema = SCHEMAS[view]
+    columns = list(schema["columns"]) if columns is None else list(columns)
+    unknown = set(columns) - set(schema["columns"])
+    if unknown:
+        raise KeyError(f"Unknown columns for {view}: {', '.join(sorted(unknown))}")
+    metadata = table_metadata(view, root, source)
+
+    # the memory map stays open as long as the returned columns reference it
+    source = pa.memory_map(str(columnar_path(view, root)), "r")
+    table = pa.ipc.open_file(source).read_all().select(["source_row", *columns])
+    df = table.to_pandas(
+        types_mapper=lambda t: pd.ArrowDtype(t) if pa.types.is_large_string(t) else None,
+        self_destruct=True,
+    ).set_index("source_row")
+    df.index.name = None
+    for column in columns:
+        if schema["columns"][column] == "category":
+            df[column] = pd.Categorical.from_codes(df[column].to_numpy(), metadata["categories"][column])
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest the raw data files into columnar files.")
+    parser.add_argument("views", nargs="*", help=f"views among {', '.join(SCHEMAS)} (default: all)")
+    args = parser.parse_args(argv)
+    unknown = set(args.views) - set(SCHEMAS)
+    if unknown:
+        parser.error(f"unknown views: {', '.join(sorted(unknown))}")
+
+    for view in args.views or SCHEMAS:
+        report = ingest(view)
+        print(f"[{view}] {report['rows']} rows read, {report['kept']} kept -> {columnar_path(view)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Background jobs shared by every Streamlit session.
+
+Each view runs its pipeline (load -> fit -> render) as one job in a
+process-wide thread pool, so the keyword and review maps are built
+concurrently instead of one after the other. Jobs are keyed by their
+parameters and the digest of their dataset (utils.datasets): a session
+asking for a job that is already running (or finished) gets the same job
+back instead of starting a second one. Each job records the status of its stages so the
+page can show progress while it waits.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import metrics
+
+MAX_WORKERS = int(os.environ.get("TOPIC_JOB_WORKERS", "2"))
+# Finished jobs kept for later reruns and sessions
+MAX_FINISHED_JOBS = 32
+
+STAGES = {
+    "load": "Chargement des données",
+    "fit": "Ajustement du modèle",
+    "render": "Rendu de la carte",
+}
+PENDING, RUNNING, DONE = "pending", "running", "done"
+
+
+class Job:
+    """
+    One pipeline run: a future plus the status of each stage.
+    """
+
+    def __init__(self, key, stages=STAGES):
+        self.key = key
+        self.stages = OrderedDict((name, PENDING) for name in stages)
+        self.future = None
+        self._running = None
+
+    @property
+    def name(self):
+        return self.key[0] if isinstance(self.key, tuple) else str(self.key)
+
+    def _end_stage(self):
+        # stage durations go to utils.metrics as "<view>.<stage>"
+        if self._running is not None:
+            name, start = self._running
+            metrics.observe(f"{self.name}.{name}", time.perf_counter() - start)
+            self._running = None
+
+    def stage(self, name):
+        """
+        Mark ``name`` as running and every earlier stage as done.
+        """
+        self._end_stage()
+        self._running = (name, time.perf_counter())
+        for other in self.stages:
+            if other == name:
+                self.stages[other] = RUNNING
+                break
+            self.stages[other] = DONE
+
+    def done(self):
+        return self.future.done()
+
+    def failed(self):
+        return self.future.done() and self.future.exception() is not None
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def progress(self):
+        """
+        ``(fraction done, label of the running stage)``.
+        """
+        if self.future.done():
+            return 1.0, None
+        n_done = sum(status == DONE for status in self.stages.values())
+        running = next((name for name, status in self.stages.items() if status == RUNNING), None)
+        return n_done / len(self.stages), STAGES.get(running, running)
+
+
+class JobRegistry:
+    """
+    Thread pool plus the in-flight and recently finished jobs, by key.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_finished=MAX_FINISHED_JOBS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="topic-job")
+        self._jobs = OrderedDict()
+        self._max_finished = max_finished
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Job running ``fn(job, *args, **kwargs)``; an existing job with the same
+        key is returned instead, unless it failed.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.failed():
+                self._jobs.move_to_end(key)
+                metrics.count("jobs.reused")
+                return job
+            metrics.count("jobs.submitted")
+            job = Job(key)
+            job.future = self._pool.submit(self._run, job, fn, *args, **kwargs)
+            self._jobs[key] = job
+            self._prune()
+            return job
+
+    @staticmethod
+    def _run(job, fn, *args, **kwargs):
+        try:
+            result = fn(job, *args, **kwargs)
+        finally:
+            job._end_stage()
+        for name in job.stages:
+            job.stages[name] = DONE
+        return result
+
+    def _prune(self):
+        finished = [key for key, job in self._jobs.items() if job.done()]
+        for key in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[key]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_job_registry():
+    """
+    Process-wide registry (shared by every Streamlit session).
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = JobRegistry()
+        return _registry
@@ -0,0 +1,123 @@
+"""
+Lazy loading of the heavy dependencies.
+
+BERTopic, scikit-learn, UMAP and datamapplot (and through them torch and
+numba) are only imported inside the functions that fit or render. The
+Streamlit page starts warming them up in a background thread while the
+static sidebar is served, so the first fit/render does not pay the full
+import cost either.
+
+Import-time report (each module measured in a fresh interpreter):
+
+    python -m utils.lazy
+    python -m utils.lazy --json import_times.json
+"""
+import argparse
+import importlib
+import json
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# Imported on demand by utils.modeling / the datamap rendering
+HEAVY_MODULES = (
+    "sklearn.cluster",
+    "sklearn.feature_extraction.text",
+    "umap",
+    "bertopic",
+    "datamapplot",
+)
+# What the page needs before its first paint
+STARTUP_MODULES = ("streamlit", "topic_keywords", "topic_sentence")
+
+# Wall-clock import time (seconds) of every module loaded by the background thread
+IMPORT_TIMES = {}
+
+_preload_thread = None
+_preload_lock = threading.Lock()
+
+
+def _preload(modules):
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        IMPORT_TIMES[name] = time.perf_counter() - start
+
+
+def preload_in_background(modules=HEAVY_MODULES):
+    """
+    Start importing ``modules`` in a daemon thread (once per process).
+    Code that needs one of them simply imports it: Python's import lock makes
+    it wait for the background import instead of importing twice.
+    """
+    global _preload_thread
+    with _preload_lock:
+        if _preload_thread is None:
+            _preload_thread = threading.Thread(target=_preload, args=(modules,), name="heavy-imports", daemon=True)
+            _preload_thread.start()
+    return _preload_thread
+
+
+def preload_done():
+    return _preload_thread is not None and not _preload_thread.is_alive()
+
+
+# -------------------------
+# Import-time report
+# -------------------------
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure_import(module):
+    """
+    Import ``module`` in a fresh interpreter with ``-X importtime``.
+    Returns the cumulative time (seconds) and the number of modules it pulled in.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        return {"module": module, "error": proc.stderr.strip().splitlines()[-1:]}
+    cumulative_us = 0
+    n_modules = 0
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        n_modules += 1
+        _, cumulative, indent, name = match.groups()
+        # top-level entries have a single space of indentation
+        if len(indent) == 1:
+            cumulative_us += int(cumulative)
+    return {"module": module, "seconds": cumulative_us / 1e6, "n_modules": n_modules}
+
+
+def import_time_report(modules=STARTUP_MODULES + HEAVY_MODULES):
+    return [measure_import(m) for m in modules]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time of the app's dependencies.")
+    parser.add_argument("modules", nargs="*", help="modules to measure (default: startup + heavy modules)")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = import_time_report(tuple(args.modules) or STARTUP_MODULES + HEAVY_MODULES)
+    for row in report:
+        if "error" in row:
+            print(f"{row['module']:<34} error: {' '.join(row['error'])}")
+        else:
+            print(f"{row['module']:<34} {row['seconds']:8.3f} s  {row['n_modules']:5d} modules")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version, "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
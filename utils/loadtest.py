@@ -0,0 +1,92 @@
+"""
+Load test of the query service (utils.service).
+
+Sends ``--requests`` requests with ``--concurrency`` of them in flight and
+reports the throughput and the latency percentiles:
+
+    python -m utils.service &
+    python -m utils.loadtest --endpoint assign --concurrency 64 --requests 5000
+    python -m utils.loadtest --endpoint search --view keywords
+
+Request texts are sampled from the ingested table of the view, so every
+request is a realistic query.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from . import ingest
+from .preprocess import TEXT_COLUMNS
+
+ENDPOINTS = ("assign", "search", "topics")
+
+
+def _request(url, endpoint, view, text):
+    from tornado.httpclient import HTTPRequest
+
+    if endpoint == "topics":
+        return HTTPRequest(f"{url}/views/{view}/topics")
+    body = {"texts": [text]} if endpoint == "assign" else {"text": text, "k": 10}
+    return HTTPRequest(f"{url}/views/{view}/{endpoint}", method="POST", body=json.dumps(body),
+                       headers={"Content-Type": "application/json"})
+
+
+async def run(url, endpoint, view, n_requests, concurrency, texts, timeout=30.0):
+    """
+    Latencies (seconds) of the successful requests, the number of errors and
+    the total wall time.
+    """
+    from tornado.httpclient import AsyncHTTPClient
+
+    client = AsyncHTTPClient(max_clients=concurrency)
+    latencies, errors = [], 0
+    remaining = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors
+        for i in remaining:
+            request = _request(url, endpoint, view, texts[i % len(texts)])
+            request.request_timeout = timeout
+            start = time.perf_counter()
+            try:
+                await client.fetch(request)
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return np.array(latencies), errors, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the query service.")
+    parser.add_argument("--url", default="http://127.0.0.1:8601")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="assign")
+    parser.add_argument("--view", choices=tuple(TEXT_COLUMNS), default="sentences")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    table = ingest.load_table(args.view, [TEXT_COLUMNS[args.view]])
+    texts = table[TEXT_COLUMNS[args.view]].tolist()
+    texts = [texts[i] for i in np.random.default_rng(args.seed).permutation(len(texts))]
+
+    latencies, errors, wall = asyncio.run(
+        run(args.url.rstrip("/"), args.endpoint, args.view, args.requests, args.concurrency, texts)
+    )
+    print(f"{args.endpoint} on {args.view}: {len(latencies)} ok, {errors} errors, "
+          f"concurrency {args.concurrency}, {wall:.2f}s")
+    print(f"throughput {len(latencies) / wall:.1f} req/s")
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99])
+        print(f"latency p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, max {latencies.max() * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""
+Level-of-detail datamap for large corpora.
+
+``modeling.render_datamap`` inlines every point, hover text and marker size
+in one HTML blob: fine for a few thousand documents, unusable at 100k+.
+Above ``LOD_MIN_POINTS`` documents the views render this map instead:
+
+    - the page embeds only an overview: points aggregated per (grid cell,
+      topic) on a ``OVERVIEW_GRID`` x ``OVERVIEW_GRID`` grid, as base64
+      binary arrays, plus the topic labels
+    - the full points are split into square detail tiles, the grid being
+      refined until no tile holds more than ``TILE_POINTS`` (binary
+      coordinates / topic codes / sizes, plus a JSON list of hover texts)
+      written once under ``static/datamaps/<render key>/``
+    - a canvas renderer draws the overview and, once the visible area
+      holds at most ``DETAIL_MAX_POINTS`` documents, fetches the visible
+      tiles through Streamlit's static file serving (``app/static/...``,
+      enabled in .streamlit/config.toml) and draws every point
+    - a search box highlights the topics whose label contains the query
+      and, in detail mode, the loaded documents whose text contains it;
+      a click on a topic label selects the topic and zooms on it
+
+so the page payload depends on the grid and the number of topics, not on
+the corpus, and the browser never holds more than a zoomed-in window of
+points. The search box stands in for datamapplot's, which needs every
+point in the page: text search only covers the documents of the visible
+tiles.
+"""
+import base64
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+LOD_DIR = Path(os.environ.get("TOPIC_LOD_DIR", "static/datamaps"))
+# URL of LOD_DIR, relative to the page (Streamlit serves ./static at app/static)
+LOD_URL = os.environ.get("TOPIC_LOD_URL", "app/static/datamaps")
+LOD_MIN_POINTS = int(os.environ.get("TOPIC_LOD_MIN_POINTS", "50000"))
+
+OVERVIEW_GRID = 64
+TILE_POINTS = 4000          # most documents per detail tile (unless MAX_TILES_PER_SIDE is reached)
+MAX_TILES_PER_SIDE = 256
+DETAIL_MAX_POINTS = 30000   # most documents drawn individually at once
+MAX_TILESETS = 8            # tile directories kept on disk
+LOD_VERSION = 2             # manifest format: older tile directories are rebuilt
+
+
+def use_lod(n_points):
+    return n_points >= LOD_MIN_POINTS
+
+
+def _b64(array, dtype):
+    return base64.b64encode(np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder("<")).tobytes()).decode()
+
+
+def _size_codes(sizes, n):
+    """
+    Marker sizes rescaled to 0-255 (square-root scale, as a radius).
+    """
+    if sizes is None:
+        return np.zeros(n, dtype=np.uint8)
+    sizes = np.sqrt(np.maximum(np.asarray(sizes, dtype=np.float64), 0))
+    span = sizes.max() - sizes.min()
+    if span == 0:
+        return np.zeros(n, dtype=np.uint8)
+    return np.round((sizes - sizes.min()) / span * 255).astype(np.uint8)
+
+
+def _cells(coords, bounds, n_cells):
+    x0, y0, x1, y1 = bounds
+    ix = np.clip(((coords[:, 0] - x0) / (x1 - x0) * n_cells).astype(np.int64), 0, n_cells - 1)
+    iy = np.clip(((coords[:, 1] - y0) / (y1 - y0) * n_cells).astype(np.int64), 0, n_cells - 1)
+    return iy * n_cells + ix
+
+
+def build_tiles(out_dir, coords, topics, labels, docs, sizes=None):
+    """
+    Write the detail tiles of a map to ``out_dir`` and return its manifest
+    (bounds, tile grid, overview aggregates and topic labels).
+    """
+    coords = np.asarray(coords, dtype=np.float32)
+    n = len(coords)
+    topic_ids, codes = np.unique(np.asarray(topics), return_inverse=True)
+    names = ["Unlabelled" if t == -1 else labels.get(int(t), f"Topic {t}") for t in topic_ids]
+    size_codes = _size_codes(sizes, n)
+
+    lo, hi = coords.min(axis=0), coords.max(axis=0)
+    pad = np.maximum((hi - lo) * 0.02, 1e-6)
+    bounds = [float(v) for v in (*(lo - pad), *(hi + pad))]
+
+    # detail tiles: the grid doubles until the densest tile is small enough,
+    # then documents are sorted by tile, one file pair per non-empty tile
+    n_tiles = 1
+    while True:
+        tile_of = _cells(coords, bounds, n_tiles)
+        tile_counts = np.bincount(tile_of, minlength=n_tiles * n_tiles)
+        if tile_counts.max() <= TILE_POINTS or n_tiles >= MAX_TILES_PER_SIDE:
+            break
+        n_tiles *= 2
+    order = np.argsort(tile_of, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(tile_counts)])
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for tile in np.flatnonzero(tile_counts):
+        rows = order[starts[tile]:starts[tile + 1]]
+        with open(tmp / f"{tile}.bin", "wb") as f:
+            # x (float32) | y (float32) | topic code (uint16) | size (uint8), little-endian
+            f.write(np.ascontiguousarray(coords[rows, 0], dtype="<f4").tobytes())
+            f.write(np.ascontiguousarray(coords[rows, 1], dtype="<f4").tobytes())
+            f.write(codes[rows].astype("<u2").tobytes())
+            f.write(size_codes[rows].tobytes())
+        with open(tmp / f"{tile}.json", "w", encoding="utf-8") as f:
+            json.dump([str(docs[i]) for i in rows], f, ensure_ascii=False)
+
+    # overview: one weighted point per (grid cell, topic)
+    groups, inverse, counts = np.unique(
+        _cells(coords, bounds, OVERVIEW_GRID) * len(topic_ids) + codes, return_inverse=True, return_counts=True
+    )
+    mean_x = np.bincount(inverse, weights=coords[:, 0]) / counts
+    mean_y = np.bincount(inverse, weights=coords[:, 1]) / counts
+
+    # one label per topic, at the median of its documents, with the extent
+    # of its central documents (a click on the label zooms there)
+    label_rows = []
+    for code, name in enumerate(names):
+        if topic_ids[code] != -1:
+            members = coords[codes == code]
+            x, y = np.median(members, axis=0)
+            (x0, y0), (x1, y1) = np.percentile(members, [2, 98], axis=0)
+            label_rows.append([float(x), float(y), code, float(x0), float(y0), float(x1), float(y1)])
+
+    manifest = {
+        "version": LOD_VERSION,
+        "n_points": n,
+        "bounds": bounds,
+        "tiles": n_tiles,
+        # non-empty tiles only: id = row * tiles + column
+        "tile_ids": _b64(np.flatnonzero(tile_counts), "u4"),
+        "tile_counts": _b64(tile_counts[tile_counts > 0], "u4"),
+        "names": names,
+        "unlabelled": [bool(t == -1) for t in topic_ids],
+        "labels": label_rows,
+        "overview": {
+            "n": len(groups),
+            "x": _b64(mean_x, "f4"),
+            "y": _b64(mean_y, "f4"),
+            "count": _b64(counts, "u4"),
+            "code": _b64(groups % len(topic_ids), "u2"),
+        },
+    }
+    with open(tmp / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    return manifest
+
+
+def _prune(root, keep):
+    tilesets = sorted((p for p in Path(root).iterdir() if p.is_dir() and p.name != keep and p.suffix != ".tmp"),
+                      key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in tilesets[MAX_TILESETS - 1:]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def render_lod(key, coords, topics, labels, docs, int_datamap_kwds, root=LOD_DIR, url=LOD_URL):
+    """
+    HTML of the level-of-detail map; its tiles are written under
+    ``root/key`` on first use and reused afterwards.
+    """
+    out_dir = Path(root) / key
+    try:
+        with open(out_dir / "manifest.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") != LOD_VERSION:
+            raise ValueError(f"tiles of {key} use an older format")
+        os.utime(out_dir)
+    except (OSError, ValueError):
+        manifest = build_tiles(out_dir, coords, topics, labels, docs, int_datamap_kwds.get("marker_size_array"))
+        _prune(root, key)
+    options = {
+        "url": f"{url.rstrip('/')}/{key}",
+        "detailMaxPoints": DETAIL_MAX_POINTS,
+        "radiusMin": int_datamap_kwds.get("point_radius_min_pixels", 2),
+        "radiusMax": min(int_datamap_kwds.get("point_radius_max_pixels", 12), 12),
+        "fontMin": int_datamap_kwds.get("min_fontsize", 12),
+        "fontMax": int_datamap_kwds.get("max_fontsize", 18),
+        "overviewGrid": OVERVIEW_GRID,
+    }
+    return (_TEMPLATE
+            .replace("__MANIFEST__", json.dumps(manifest, ensure_ascii=False).replace("</", "<\\/"))
+            .replace("__OPTIONS__", json.dumps(options)))
+
+
+_TEMPLATE = r"""<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<style>
+  html, body { margin: 0; height: 100%; overflow: hidden; font-family: sans-serif; background: #fff; }
+  canvas { display: block; width: 100%; height: 100%; cursor: grab; }
+  #tip { position: absolute; pointer-events: none; max-width: 360px; padding: 6px 8px; font-size: 13px;
+         background: rgba(255,255,255,.95); border: 1px solid #ccc; border-radius: 4px; display: none; }
+  #status { position: absolute; left: 8px; bottom: 6px; font-size: 12px; color: #666; }
+  #search { position: absolute; left: 8px; top: 8px; width: 240px; padding: 4px 6px; font-size: 13px;
+            border: 1px solid #ccc; border-radius: 4px; }
+</style></head>
+<body><canvas id="map"></canvas><input id="search" type="search" placeholder="Rechercher un topic ou un texte…">
+<div id="tip"></div><div id="status"></div>
+<script>
+const M = __MANIFEST__;
+const O = __OPTIONS__;
+const BASE = new URL(O.url + "/", document.baseURI).href;
+const canvas = document.getElementById("map"), ctx = canvas.getContext("2d");
+const tip = document.getElementById("tip"), status = document.getElementById("status");
+const search = document.getElementById("search");
+const [X0, Y0, X1, Y1] = M.bounds, T = M.tiles;
+
+function decode(b64, Type) {
+  const bytes = Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+  return new Type(bytes.buffer);
+}
+const ov = { x: decode(M.overview.x, Float32Array), y: decode(M.overview.y, Float32Array),
+             count: decode(M.overview.count, Uint32Array), code: decode(M.overview.code, Uint16Array) };
+const tileCounts = new Map();
+{ const ids = decode(M.tile_ids, Uint32Array), counts = decode(M.tile_counts, Uint32Array);
+  ids.forEach((id, k) => tileCounts.set(id, counts[k])); }
+const colors = M.names.map((_, i) => M.unlabelled[i] ? "#aaaaaa" : `hsl(${(i * 137.508) % 360}, 65%, 50%)`);
+
+// world <-> screen: sx = (x - X0) * s + tx, sy = (Y1 - y) * s + ty
+let W = 0, H = 0, s = 1, tx = 0, ty = 0;
+function resize() {
+  const dpr = window.devicePixelRatio || 1;
+  W = canvas.clientWidth; H = canvas.clientHeight;
+  canvas.width = W * dpr; canvas.height = H * dpr;
+  ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+}
+function fit() {
+  s = Math.min(W / (X1 - X0), H / (Y1 - Y0)) * 0.95;
+  tx = (W - (X1 - X0) * s) / 2; ty = (H - (Y1 - Y0) * s) / 2;
+}
+const sx = x => (x - X0) * s + tx, sy = y => (Y1 - y) * s + ty;
+const wx = px => (px - tx) / s + X0, wy = py => Y1 - (py - ty) / s;
+
+// -------- detail tiles --------
+const tiles = new Map();   // tile id -> {x, y, code, size, texts} | "pending"
+const MAX_CACHED_TILES = 256;
+function visibleTiles() {
+  const tw = (X1 - X0) / T, th = (Y1 - Y0) / T;
+  const i0 = Math.max(0, Math.floor((wx(0) - X0) / tw)), i1 = Math.min(T - 1, Math.floor((wx(W) - X0) / tw));
+  const j0 = Math.max(0, Math.floor((wy(H) - Y0) / th)), j1 = Math.min(T - 1, Math.floor((wy(0) - Y0) / th));
+  const out = [];
+  for (let j = j0; j <= j1; j++) for (let i = i0; i <= i1; i++) if (tileCounts.has(j * T + i)) out.push(j * T + i);
+  return out;
+}
+async function loadTile(id) {
+  tiles.set(id, "pending");
+  try {
+    const n = tileCounts.get(id);
+    const [buf, texts] = await Promise.all([
+      fetch(BASE + id + ".bin").then(r => { if (!r.ok) throw new Error(r.status); return r.arrayBuffer(); }),
+      fetch(BASE + id + ".json").then(r => r.json()),
+    ]);
+    tiles.set(id, { x: new Float32Array(buf, 0, n), y: new Float32Array(buf, 4 * n, n),
+                    code: new Uint16Array(buf.slice(8 * n, 10 * n)), size: new Uint8Array(buf, 10 * n, n), texts,
+                    lower: texts.map(t => t.toLowerCase()) });
+    if (tiles.size > MAX_CACHED_TILES) {
+      for (const key of tiles.keys()) { if (tiles.size <= MAX_CACHED_TILES) break; if (tiles.get(key) !== "pending") tiles.delete(key); }
+    }
+  } catch (e) {
+    tiles.delete(id);
+    status.textContent = "Détail indisponible (" + e.message + ")";
+    return;
+  }
+  draw();
+}
+
+// -------- search --------
+// topics whose label contains the query are highlighted everywhere; documents
+// whose text contains it only in detail mode (texts live in the tiles)
+let query = "", matchTopics = null;
+function setQuery(q) {
+  query = q.trim().toLowerCase();
+  matchTopics = query ? new Set(M.names.map((n, i) => n.toLowerCase().includes(query) ? i : -1).filter(i => i >= 0)) : null;
+  redraw();
+}
+const topicActive = code => !query || matchTopics.has(code) || matchTopics.size === 0;
+const pointActive = (t, k) => !query || matchTopics.has(t.code[k]) || t.lower[k].includes(query);
+
+// -------- drawing --------
+let mode = "overview", shown = [], labelBoxes = [];
+function draw() {
+  ctx.clearRect(0, 0, W, H);
+  const visible = visibleTiles();
+  const inView = visible.reduce((n, id) => n + tileCounts.get(id), 0);
+  // a few tiles are always drawn in detail, even where the grid could not split them further
+  mode = inView <= O.detailMaxPoints || visible.length <= 4 ? "detail" : "overview";
+  shown = [];
+  let missing = false, matches = 0;
+  if (mode === "detail") {
+    for (const id of visible) {
+      const t = tiles.get(id);
+      if (t === undefined) loadTile(id);
+      if (!t || t === "pending") { missing = true; continue; }
+      shown.push(t);
+      for (let k = 0; k < t.x.length; k++) {
+        const r = O.radiusMin + (O.radiusMax - O.radiusMin) * t.size[k] / 255;
+        const active = pointActive(t, k);
+        matches += active;
+        ctx.fillStyle = colors[t.code[k]];
+        ctx.globalAlpha = active ? 0.75 : 0.08;
+        ctx.beginPath(); ctx.arc(sx(t.x[k]), sy(t.y[k]), r, 0, 2 * Math.PI); ctx.fill();
+      }
+    }
+  }
+  if (mode === "overview" || missing) {
+    const cell = Math.max((X1 - X0) / O.overviewGrid * s, 1);
+    for (let k = 0; k < M.overview.n; k++) {
+      const px = sx(ov.x[k]), py = sy(ov.y[k]);
+      if (px < -cell || py < -cell || px > W + cell || py > H + cell) continue;
+      ctx.fillStyle = colors[ov.code[k]];
+      ctx.globalAlpha = topicActive(ov.code[k]) ? 0.55 : 0.06;
+      ctx.beginPath(); ctx.arc(px, py, Math.min(cell * 0.6, O.radiusMin + Math.sqrt(ov.count[k])), 0, 2 * Math.PI); ctx.fill();
+    }
+  }
+  labelBoxes = [];
+  for (const label of M.labels) {
+    const [x, y, code] = label;
+    const size = O.fontMin + (O.fontMax - O.fontMin) * Math.min(1, s * (X1 - X0) / W / 4);
+    ctx.font = `bold ${size}px sans-serif`; ctx.textAlign = "center";
+    ctx.globalAlpha = topicActive(code) ? 1 : 0.25;
+    ctx.lineWidth = 3; ctx.strokeStyle = "rgba(255,255,255,.85)";
+    ctx.strokeText(M.names[code], sx(x), sy(y)); ctx.fillStyle = "#222"; ctx.fillText(M.names[code], sx(x), sy(y));
+    const w = ctx.measureText(M.names[code]).width;
+    labelBoxes.push([sx(x) - w / 2, sy(y) - size, sx(x) + w / 2, sy(y) + size / 4, label]);
+  }
+  ctx.globalAlpha = 1;
+  if (!status.textContent.startsWith("Détail indisponible")) {
+    let text = mode === "detail" ? `${inView.toLocaleString()} points affichés`
+                                 : `${M.n_points.toLocaleString()} points agrégés, zoomez pour le détail`;
+    if (query && mode === "detail") text += ` · ${matches.toLocaleString()} correspondent à « ${query} »`;
+    else if (query) text += ` · ${matchTopics.size} topic(s) correspondent, zoomez pour chercher dans les textes`;
+    status.textContent = text;
+  }
+}
+
+// a click on a topic label selects the topic and zooms on its documents
+function zoomToLabel([, , code, x0, y0, x1, y1]) {
+  search.value = M.names[code]; setQuery(M.names[code]);
+  s = Math.min(W / Math.max(x1 - x0, 1e-6), H / Math.max(y1 - y0, 1e-6)) * 0.9;
+  tx = W / 2 - ((x0 + x1) / 2 - X0) * s; ty = H / 2 - (Y1 - (y0 + y1) / 2) * s;
+  redraw();
+}
+
+// -------- hover --------
+function nearest(px, py) {
+  let best = null, bestD = 64;
+  if (mode === "detail") {
+    for (const t of shown) for (let k = 0; k < t.x.length; k++) {
+      const d = (sx(t.x[k]) - px) ** 2 + (sy(t.y[k]) - py) ** 2;
+      if (d < bestD) { bestD = d; best = `<b>${esc(M.names[t.code[k]])}</b><br>${esc(t.texts[k])}`; }
+    }
+  } else {
+    bestD = 144;
+    for (let k = 0; k < M.overview.n; k++) {
+      const d = (sx(ov.x[k]) - px) ** 2 + (sy(ov.y[k]) - py) ** 2;
+      if (d < bestD) { bestD = d; best = `<b>${esc(M.names[ov.code[k]])}</b><br>${ov.count[k]} documents`; }
+    }
+  }
+  return best;
+}
+function esc(text) { const d = document.createElement("div"); d.textContent = text; return d.innerHTML; }
+
+// -------- interaction --------
+let drag = null, pending = false;
+function redraw() { if (!pending) { pending = true; requestAnimationFrame(() => { pending = false; draw(); }); } }
+canvas.addEventListener("wheel", e => {
+  e.preventDefault();
+  const f = Math.exp(-e.deltaY * 0.0015), x = wx(e.offsetX), y = wy(e.offsetY);
+  s *= f; tx = e.offsetX - (x - X0) * s; ty = e.offsetY - (Y1 - y) * s;
+  redraw();
+}, { passive: false });
+let moved = 0;
+canvas.addEventListener("mousedown", e => { drag = [e.offsetX, e.offsetY]; moved = 0; canvas.style.cursor = "grabbing"; });
+window.addEventListener("mouseup", () => { drag = null; canvas.style.cursor = "grab"; });
+canvas.addEventListener("click", e => {
+  if (moved > 4) return;
+  const hit = labelBoxes.find(([a, b, c, d]) => e.offsetX >= a && e.offsetX <= c && e.offsetY >= b && e.offsetY <= d);
+  if (hit) zoomToLabel(hit[4]);
+});
+search.addEventListener("input", () => setQuery(search.value));
+canvas.addEventListener("mousemove", e => {
+  if (drag) {
+    moved += Math.abs(e.offsetX - drag[0]) + Math.abs(e.offsetY - drag[1]);
+    tx += e.offsetX - drag[0]; ty += e.offsetY - drag[1]; drag = [e.offsetX, e.offsetY];
+    tip.style.display = "none"; redraw(); return;
+  }
+  const html = nearest(e.offsetX, e.offsetY);
+  if (html) {
+    tip.innerHTML = html; tip.style.display = "block";
+    tip.style.left = Math.min(e.offsetX + 12, W - 370) + "px"; tip.style.top = (e.offsetY + 12) + "px";
+  } else tip.style.display = "none";
+});
+canvas.addEventListener("mouseleave", () => { tip.style.display = "none"; });
+canvas.addEventListener("dblclick", () => { fit(); redraw(); });
+search.addEventListener("keydown", e => { if (e.key === "Escape") { search.value = ""; setQuery(""); } });
+window.addEventListener("resize", () => { resize(); redraw(); });
+resize(); fit(); draw();
+</script></body></html>
+"""
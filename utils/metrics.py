@@ -0,0 +1,194 @@
+"""
+Lightweight timing, memory and cache instrumentation.
+
+    with metrics.stage("keywords.read_csv"):
+        df = pd.read_csv(path)
+
+records the wall time and the resident-memory change of the block, and
+``metrics.cached(st.cache_resource, "keywords.load_embeddings")`` wraps a
+Streamlit cache helper to count its calls and misses (the body only runs
+on a miss). The time of a call that hits the cache is mostly Streamlit's
+argument hashing.
+
+Everything is process-wide (shared by the sessions) and exposed three ways:
+
+    - ``snapshot()``, shown by the app in a hidden expander (``?debug=1``)
+    - one JSON line per stage on the ``topic_metrics`` logger; set
+      ``TOPIC_METRICS_LOG=<path>`` to write them to a file
+    - a Prometheus text endpoint on ``TOPIC_METRICS_PORT`` (``/metrics``)
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_LOG = os.environ.get("TOPIC_METRICS_LOG")
+METRICS_PORT = os.environ.get("TOPIC_METRICS_PORT")
+
+logger = logging.getLogger("topic_metrics")
+
+_lock = threading.Lock()
+_stages = {}      # name -> {"count", "total_seconds", "max_seconds", "last_seconds", "last_rss_delta_mb"}
+_counters = {}    # name -> int
+
+
+def rss_mb():
+    """
+    Current resident set size of the process, in MiB (0 where /proc is unavailable).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return 0.0
+
+
+def observe(name, seconds, rss_delta_mb=0.0):
+    with _lock:
+        stats = _stages.setdefault(
+            name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "last_seconds": 0.0, "last_rss_delta_mb": 0.0}
+        )
+        stats["count"] += 1
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        stats["last_seconds"] = seconds
+        stats["last_rss_delta_mb"] = rss_delta_mb
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({
+            "event": "stage", "stage": name, "seconds": round(seconds, 6),
+            "rss_delta_mb": round(rss_delta_mb, 2), "thread": threading.current_thread().name,
+        }))
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the block and record its resident-memory change under ``name``.
+    """
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, rss_mb() - rss_before)
+
+
+def cached(cache_decorator, name, **cache_kwargs):
+    """
+    ``cache_decorator`` (e.g. ``st.cache_data``) with call / miss counters and
+    timings: ``<name>.call`` is every call (hashing + lookup, + body on a
+    miss), ``<name>`` is the body alone.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def body(*args, **kwargs):
+            count(f"cache.{name}.miss")
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        cached_body = cache_decorator(**cache_kwargs)(body) if cache_kwargs else cache_decorator(body)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            count(f"cache.{name}.call")
+            with stage(f"{name}.call"):
+                return cached_body(*args, **kwargs)
+
+        wrapper.clear = cached_body.clear
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """
+    ``(stages, caches, counters)``: per-stage timing rows, per-cache
+    call/hit/miss rows and the remaining raw counters.
+    """
+    with _lock:
+        stages = [{"stage": name, **stats} for name, stats in sorted(_stages.items())]
+        counters = dict(_counters)
+    caches = {}
+    for key in [k for k in counters if k.startswith("cache.")]:
+        cache, kind = key[len("cache."):].rsplit(".", 1)
+        caches.setdefault(cache, {"cache": cache, "call": 0, "miss": 0})[kind] = counters.pop(key)
+    for row in caches.values():
+        row["hit"] = row["call"] - row["miss"]
+    return stages, sorted(caches.values(), key=lambda row: row["cache"]), counters
+
+
+# -------------------------
+# Exporters
+# -------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text():
+    stages, caches, counters = snapshot()
+    lines = [
+        "# TYPE topic_stage_seconds summary",
+        *(f'topic_stage_seconds_sum{{stage="{_escape(s["stage"])}"}} {s["total_seconds"]:.6f}' for s in stages),
+        *(f'topic_stage_seconds_count{{stage="{_escape(s["stage"])}"}} {s["count"]}' for s in stages),
+        "# TYPE topic_stage_max_seconds gauge",
+        *(f'topic_stage_max_seconds{{stage="{_escape(s["stage"])}"}} {s["max_seconds"]:.6f}' for s in stages),
+        "# TYPE topic_cache_calls_total counter",
+        *(f'topic_cache_calls_total{{cache="{_escape(c["cache"])}"}} {c["call"]}' for c in caches),
+        "# TYPE topic_cache_misses_total counter",
+        *(f'topic_cache_misses_total{{cache="{_escape(c["cache"])}"}} {c["miss"]}' for c in caches),
+        "# TYPE topic_events_total counter",
+        *(f'topic_events_total{{event="{_escape(name)}"}} {value}' for name, value in sorted(counters.items())),
+        "# TYPE topic_resident_memory_bytes gauge",
+        f"topic_resident_memory_bytes {int(rss_mb() * 2**20)}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_setup_lock = threading.Lock()
+
+
+def setup(log_path=METRICS_LOG, port=METRICS_PORT):
+    """
+    Attach the log file and start the metrics endpoint, once per process
+    (each only if configured).
+    """
+    global _server
+    with _setup_lock:
+        if log_path and not logger.handlers:
+            handler = logging.FileHandler(log_path, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        if port and _server is None:
+            try:
+                _server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+            except OSError as e:
+                logger.warning("metrics endpoint not started on port %s: %s", port, e)
+                return
+            threading.Thread(target=_server.serve_forever, name="metrics-endpoint", daemon=True).start()
@@ -0,0 +1,111 @@
+import numpy as np
+
+from . import topic_summary
+
+
+# -------------------------
+# Data paths & parameters shared by the views and the build step
+# -------------------------
+KEYWORDS_PATH = "public/keywords.csv"
+KEYWORDS_EMBEDDINGS_PATH = "public/keywords_embeddings.npy"
+SENTENCES_PATH = "public/sentences.tsv"
+SENTENCES_EMBEDDINGS_PATH = "public/sentences_embeddings.npy"
+
+MIN_FREQ = 5
+N_TOPICS = 30
+K_ALL = 30
+
+def _dimensionality_reduction(embeddings, reduced):
+    """
+    BERTopic arguments for a fit: with a precomputed clustering-space
+    reduction, BERTopic's own UMAP step is replaced by a pass-through.
+    """
+    if reduced is None:
+        return {}, embeddings
+    from bertopic.dimensionality import BaseDimensionalityReduction
+
+    return {"umap_model": BaseDimensionalityReduction()}, reduced
+
+
+def _fit_model(docs, embeddings, n_topics, reduced, doc_terms):
+    """
+    BERTopic with a KMeans clusterer, fitted on row ids over the precomputed
+    document-term matrix of ``docs`` (see utils.preprocess).
+    """
+    from sklearn.cluster import KMeans
+    from bertopic import BERTopic
+    from . import preprocess
+
+    if doc_terms is None:
+        doc_terms = preprocess.build_doc_terms(docs)
+    umap_kwargs, fit_embeddings = _dimensionality_reduction(embeddings, reduced)
+    kmeans = KMeans(n_clusters=n_topics, random_state=42)
+    topic_model = BERTopic(
+        hdbscan_model=kmeans,
+        language='french',
+        vectorizer_model=preprocess.DocTermVectorizer(doc_terms),
+        **umap_kwargs
+    )
+    topics, _ = topic_model.fit_transform(preprocess.document_ids(len(docs)), fit_embeddings)
+    # representative documents were picked among the row ids
+    topic_model.representative_docs_ = {
+        topic: [docs[int(i)] for i in ids] for topic, ids in (topic_model.representative_docs_ or {}).items()
+    }
+    return topic_model, topics
+
+
+def fit_keywords_model(keywords, embeddings, n_topics, reduced=None, doc_terms=None):
+    """
+    Fit BERTopic with a KMeans clusterer on the keyword embeddings.
+    ``reduced`` is the precomputed UMAP reduction of ``embeddings`` (see utils.reductions),
+    ``doc_terms`` the document-term matrix of ``keywords`` (built if not given).
+    """
+    return _fit_model(keywords, embeddings, n_topics, reduced, doc_terms)
+
+
+def fit_sentences_model(texts, embeddings, n_topics, reduced=None, doc_terms=None):
+    """
+    Fit BERTopic with a KMeans clusterer on the review embeddings.
+    ``reduced`` is the precomputed UMAP reduction of ``embeddings`` (see utils.reductions),
+    ``doc_terms`` the document-term matrix of ``texts`` (built if not given).
+    """
+    return _fit_model(texts, embeddings, n_topics, reduced, doc_terms)
+
+
+def keywords_topic_labels(keywords, freqs, topics):
+    """
+    Readable labels for the keyword view: the 3 most frequent words of each topic.
+    """
+    return topic_summary.keyword_labels(keywords, freqs, topics)
+
+
+def sentences_topic_labels(topic_model):
+    """
+    Readable labels for the review view: the 3 best c-TF-IDF words of each topic.
+    """
+    return topic_summary.ctfidf_labels(topic_model)
+
+
+def render_datamap(coords, topics, labels, docs, int_datamap_kwds):
+    """
+    Interactive datamap from precomputed 2D coordinates, topic assignments and
+    labels, as BERTopic's visualize_document_datamap(custom_labels=True) draws
+    it, but without needing a fitted model for this exact configuration.
+    """
+    import datamapplot
+
+    topic_ids, codes = np.unique(np.asarray(topics), return_inverse=True)
+    names = np.array(
+        ["Unlabelled" if t == -1 else labels.get(int(t), f"Topic {t}") for t in topic_ids],
+        dtype=object,
+    )
+    named_topic_per_doc = names[codes]
+    return datamapplot.create_interactive_plot(
+        np.asarray(coords),
+        named_topic_per_doc,
+        hover_text=list(docs),
+        enable_search=True,
+        width=1200,
+        height=750,
+        **int_datamap_kwds,
+    )
@@ -0,0 +1,275 @@
+"""
+Online topic assignment for newly arriving reviews.
+
+Instead of re-fitting KMeans + BERTopic on every review, new rows are
+assigned to the nearest fitted topic centroid in vectorized batches.
+Centroids are then moved MiniBatchKMeans-style (per-topic learning rate
+1 / count) and the c-TF-IDF labels are refreshed from running per-topic
+term counts. A full refit only happens once the drift metric crosses
+a threshold:
+
+    python -m utils.online new_reviews.tsv            # append, assign, refit if drifted
+    python -m utils.online new_reviews.tsv --no-refit
+
+``new_reviews.tsv`` has the same ``sentiment``/``text`` columns as
+``sentences.tsv``; its rows are appended to it.
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from . import artifacts, encode, ingest, modeling, preprocess
+from .embeddings import get_store
+from .topic_summary import labels_from_matrix
+
+# Refit when new rows sit this much farther from their centroid than the fitted rows did
+DRIFT_THRESHOLD = 1.25
+# ... or when this share of the corpus was assigned online
+MAX_ONLINE_FRACTION = 0.5
+BATCH_SIZE = 8192
+N_LABEL_WORDS = 3
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def topic_indicator(codes, n_topics):
+    """
+    Sparse (n_topics, n_docs) 0/1 matrix: ``indicator @ X`` sums the rows of X per topic.
+    """
+    n = len(codes)
+    return sparse.csr_matrix((np.ones(n, dtype=np.float32), (codes, np.arange(n))), shape=(n_topics, n))
+
+
+def c_tf_idf(term_counts):
+    """
+    BERTopic's class-based TF-IDF on a (n_topics, n_terms) count matrix.
+    """
+    term_counts = sparse.csr_matrix(term_counts, dtype=np.float64)
+    tf = sparse.diags(1 / np.maximum(term_counts.sum(axis=1).A1, 1)) @ term_counts
+    avg_words = term_counts.sum() / term_counts.shape[0]
+    idf = np.log(1 + avg_words / np.maximum(term_counts.sum(axis=0).A1, 1))
+    return tf @ sparse.diags(idf)
+
+
+class OnlineTopicModel:
+    """
+    Centroid state of a fitted view, updatable one batch at a time.
+    """
+
+    def __init__(self, topic_ids, centroids, counts, term_counts, vocabulary,
+                 baseline_distance, n_fitted, n_online=0, online_distance_sum=0.0):
+        self.topic_ids = np.asarray(topic_ids)
+        self.centroids = _normalize(centroids)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.term_counts = sparse.csr_matrix(term_counts, dtype=np.float64)
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        self.baseline_distance = float(baseline_distance)
+        self.n_fitted = int(n_fitted)
+        self.n_online = int(n_online)
+        self.online_distance_sum = float(online_distance_sum)
+        self._term_index = None
+
+    # -------------------------
+    # Construction / persistence
+    # -------------------------
+    @classmethod
+    def from_fit(cls, embeddings, topics, texts, doc_terms=None):
+        topics = np.asarray(topics)
+        topic_ids, codes = np.unique(topics, return_inverse=True)
+        embeddings = _normalize(embeddings)
+        indicator = topic_indicator(codes, len(topic_ids))
+        counts = np.bincount(codes, minlength=len(topic_ids))
+        centroids = _normalize(indicator @ embeddings)
+        baseline = float(np.mean(1 - np.sum(embeddings * centroids[codes], axis=1)))
+
+        if doc_terms is None:
+            doc_terms = preprocess.build_doc_terms(texts)
+        return cls(topic_ids, centroids, counts, indicator @ doc_terms.matrix,
+                   doc_terms.vocabulary, baseline, len(topics))
+
+    @property
+    def term_index(self):
+        if self._term_index is None:
+            self._term_index = {w: i for i, w in enumerate(self.vocabulary)}
+        return self._term_index
+
+    def save(self, path):
+        tc = self.term_counts.tocsr()
+        np.savez(
+            path,
+            topic_ids=self.topic_ids, centroids=self.centroids, counts=self.counts,
+            tc_data=tc.data, tc_indices=tc.indices, tc_indptr=tc.indptr, tc_shape=tc.shape,
+            vocabulary=self.vocabulary.astype(str),
+            stats=np.array([self.baseline_distance, self.n_fitted, self.n_online, self.online_distance_sum]),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as d:
+            term_counts = sparse.csr_matrix((d["tc_data"], d["tc_indices"], d["tc_indptr"]), shape=tuple(d["tc_shape"]))
+            baseline, n_fitted, n_online, distance_sum = d["stats"]
+            return cls(d["topic_ids"], d["centroids"], d["counts"], term_counts,
+                       d["vocabulary"].tolist(), baseline, n_fitted, n_online, distance_sum)
+
+    # -------------------------
+    # Assignment / updates
+    # -------------------------
+    def assign(self, embeddings, batch_size=BATCH_SIZE):
+        """
+        Nearest centroid (cosine) of every row. Returns ``(topics, distances)``.
+        """
+        embeddings = np.asarray(embeddings)
+        codes = np.empty(len(embeddings), dtype=np.int64)
+        distances = np.empty(len(embeddings), dtype=np.float32)
+        for start in range(0, len(embeddings), batch_size):
+            sims = _normalize(embeddings[start:start + batch_size]) @ self.centroids.T
+            best = sims.argmax(axis=1)
+            codes[start:start + len(best)] = best
+            distances[start:start + len(best)] = 1 - sims[np.arange(len(best)), best]
+        return self.topic_ids[codes], distances
+
+    def partial_fit(self, embeddings, texts):
+        """
+        Assign a batch of new rows, then update centroids and term counts.
+        """
+        topics, distances = self.assign(embeddings)
+        codes = np.searchsorted(self.topic_ids, topics)
+        indicator = topic_indicator(codes, len(self.topic_ids))
+
+        batch_counts = np.bincount(codes, minlength=len(self.topic_ids))
+        self.counts += batch_counts
+        # c_k <- c_k + sum_batch(x - c_k) / n_k, the MiniBatchKMeans update with per-center rate 1/n_k
+        batch_sums = indicator @ _normalize(embeddings)
+        touched = batch_counts > 0
+        step = (batch_sums[touched] - batch_counts[touched, None] * self.centroids[touched]) / self.counts[touched, None]
+        self.centroids[touched] = _normalize(self.centroids[touched] + step)
+
+        self.term_counts = self.term_counts + indicator @ preprocess.transform(texts, self.term_index)
+        self.n_online += len(topics)
+        self.online_distance_sum += float(distances.sum())
+        return topics
+
+    def labels(self, n_words=N_LABEL_WORDS):
+        return labels_from_matrix(c_tf_idf(self.term_counts), self.vocabulary, self.topic_ids, n_words)
+
+    # -------------------------
+    # Drift
+    # -------------------------
+    def drift(self):
+        """
+        Mean distance of the online rows to their centroid, relative to the fitted rows.
+        """
+        if self.n_online == 0 or self.baseline_distance == 0:
+            return 1.0
+        return (self.online_distance_sum / self.n_online) / self.baseline_distance
+
+    def online_fraction(self):
+        return self.n_online / max(self.n_fitted + self.n_online, 1)
+
+    def needs_refit(self, threshold=DRIFT_THRESHOLD, max_online_fraction=MAX_ONLINE_FRACTION):
+        return self.drift() > threshold or self.online_fraction() > max_online_fraction
+
+
+def neighbour_coords(coords, embeddings, new_embeddings, k=10, batch_size=BATCH_SIZE):
+    """
+    2D datamap position of new rows: mean position of their k nearest fitted rows.
+    """
+    embeddings = _normalize(embeddings)
+    out = np.empty((len(new_embeddings), coords.shape[1]), dtype=np.float32)
+    k = min(k, len(embeddings))
+    for start in range(0, len(new_embeddings), batch_size):
+        sims = _normalize(new_embeddings[start:start + batch_size]) @ embeddings.T
+        nearest = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        out[start:start + len(nearest)] = coords[nearest].mean(axis=1)
+    return out
+
+
+# -------------------------
+# Sentences view update
+# -------------------------
+def _latest_dir(view, root=artifacts.ARTIFACTS_DIR):
+    return Path(root) / view / (Path(root) / view / "LATEST").read_text().strip()
+
+
+def update_sentences(new_reviews_path, refit=True, threshold=DRIFT_THRESHOLD, root=artifacts.ARTIFACTS_DIR):
+    """
+    Append new reviews to sentences.tsv, embed only them, assign them online
+    and publish a new sentences artifact build. Returns a small report.
+    """
+    built = artifacts.load_artifacts("sentences", root)
+    if built is None:
+        raise RuntimeError("No up-to-date sentences artifacts: run `python -m utils.artifacts sentences` first.")
+    latest = _latest_dir("sentences", root)
+    old_df = ingest.load_table("sentences")
+    old_texts = old_df["text"].tolist()
+
+    state_path = latest / "online.npz"
+    store = get_store(modeling.SENTENCES_EMBEDDINGS_PATH)
+    n_raw = len(store)
+    old_embeddings = store[old_df.index.to_numpy()]
+    if state_path.exists():
+        state = OnlineTopicModel.load(state_path)
+    else:
+        state = OnlineTopicModel.from_fit(old_embeddings, built.topics, old_texts,
+                                          preprocess.load_doc_terms("sentences"))
+
+    new_df = pd.read_csv(new_reviews_path, sep='\t')
+    if not {"sentiment", "text"}.issubset(new_df.columns):
+        raise ValueError(f"{new_reviews_path} must have 'sentiment' and 'text' columns")
+    # reviews already in the table would be dropped again by the ingestion
+    new_df = new_df[["sentiment", "text"]].astype(str).drop_duplicates()
+    known = pd.MultiIndex.from_arrays([old_df["sentiment"].astype(str), old_df["text"].astype(str)])
+    new_df = new_df[~pd.MultiIndex.from_frame(new_df).isin(known)]
+    if new_df.empty:
+        return {"n_new": 0, "drift": state.drift(), "online_fraction": state.online_fraction(), "refit": False}
+    with open(modeling.SENTENCES_PATH, "rb+") as f:
+        f.seek(-1, 2)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+    new_df[["sentiment", "text"]].to_csv(modeling.SENTENCES_PATH, sep='\t', mode='a', header=False, index=False)
+
+    data_path, read_kwargs, column, out_path = encode.TARGETS["sentences"]
+    encode.embed_file(data_path, read_kwargs, column, out_path, encode.encoder_for(out_path))
+    new_embeddings = get_store(modeling.SENTENCES_EMBEDDINGS_PATH)[n_raw:]
+    new_texts = new_df["text"].astype(str).tolist()
+
+    new_topics = state.partial_fit(new_embeddings, new_texts)
+    report = {"n_new": len(new_topics), "drift": state.drift(), "online_fraction": state.online_fraction()}
+
+    if refit and state.needs_refit(threshold):
+        rebuilt = artifacts.build_view("sentences")
+        out_dir = artifacts.save_artifacts("sentences", rebuilt, root)
+        report.update(refit=True, artifacts=str(out_dir))
+        return report
+
+    labels = state.labels()
+    topics = np.concatenate([built.topics, new_topics])
+    coords = np.vstack([built.coords, neighbour_coords(built.coords, old_embeddings, new_embeddings)])
+    out_dir = artifacts.save_artifacts("sentences", artifacts.ViewArtifacts(topics, labels, coords), root)
+    state.save(out_dir / "online.npz")
+    report.update(refit=False, artifacts=str(out_dir))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assign new reviews to the fitted sentence topics.")
+    parser.add_argument("new_reviews", help="TSV file with 'sentiment' and 'text' columns")
+    parser.add_argument("--threshold", type=float, default=DRIFT_THRESHOLD, help="drift ratio triggering a full refit")
+    parser.add_argument("--no-refit", action="store_true", help="never refit, only assign")
+    args = parser.parse_args(argv)
+
+    report = update_sentences(args.new_reviews, refit=not args.no_refit, threshold=args.threshold)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
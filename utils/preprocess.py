@@ -0,0 +1,213 @@
+"""
+Text normalization and a cached document-term matrix.
+
+Every fit used to build its own ``CountVectorizer(stop_words=STOPWORDS,
+strip_accents='ascii')`` and re-tokenize the whole corpus. Here each
+document is normalized and tokenized once:
+
+    - lowercase, then accents folded to ASCII through a precompiled
+      translation table (full NFKD only for characters outside it)
+    - tokens of 2+ word characters, as CountVectorizer's default pattern
+    - stopwords (utils.STOPWORDS, normalized the same way) removed
+
+The resulting sparse counts and their fixed, sorted vocabulary are cached
+per view in ``public/.doc_terms/`` (keyed by the digest of the ingested
+table, see utils.ingest), and shared by the BERTopic fits (through
+``DocTermVectorizer``), the sweeps, the topic tree and the online updates.
+"""
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from . import ingest
+from .utils import STOPWORDS
+
+DOC_TERMS_DIR = Path(os.environ.get("TOPIC_DOC_TERMS_DIR", "public/.doc_terms"))
+PREPROCESS_VERSION = 1
+
+# text column tokenized for each view
+TEXT_COLUMNS = {"keywords": "item", "sentences": "text"}
+
+
+def _fold_char(c):
+    return unicodedata.normalize("NFKD", c).encode("ascii", "ignore").decode("ascii")
+
+
+# Latin-1, Latin Extended-A/B and typographic punctuation folded in one str.translate
+_FOLD_TABLE = str.maketrans({
+    chr(code): _fold_char(chr(code)) or " "
+    for code in [*range(0x80, 0x250), *range(0x2000, 0x2070)]
+    if _fold_char(chr(code)) != chr(code)
+})
+# CountVectorizer's default token pattern, on ASCII text
+_TOKEN = re.compile(r"[a-z0-9_]{2,}")
+
+
+def normalize(text):
+    """
+    Lowercase ASCII-folded ``text`` (same folding as ``strip_accents='ascii'``).
+    """
+    text = text.lower().translate(_FOLD_TABLE)
+    if not text.isascii():
+        text = _fold_char(text)
+    return text
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text))
+
+
+STOPWORDS_NORMALIZED = frozenset(normalize(w) for w in STOPWORDS)
+
+
+def _stopwords_digest():
+    return hashlib.sha256("\n".join(sorted(STOPWORDS_NORMALIZED)).encode()).hexdigest()[:12]
+
+
+def transform(texts, term_index):
+    """
+    Counts of the ``term_index`` terms in each text (other tokens are dropped).
+    """
+    indptr, indices = [0], []
+    for text in texts:
+        indices.extend(i for i in map(term_index.get, tokenize(text)) if i is not None)
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+        shape=(len(indptr) - 1, len(term_index)),
+    )
+    matrix.sum_duplicates()
+    return matrix
+
+
+@dataclass
+class DocTerms:
+    matrix: sparse.csr_matrix   # (n_docs, n_terms) counts
+    vocabulary: np.ndarray      # sorted terms, as CountVectorizer.get_feature_names_out()
+
+    @property
+    def term_index(self):
+        return {w: i for i, w in enumerate(self.vocabulary)}
+
+    def subset(self, rows):
+        """
+        Rows of a subset of the documents, with the terms they never use removed.
+        """
+        matrix = self.matrix[rows]
+        used = np.flatnonzero(matrix.getnnz(axis=0))
+        return DocTerms(matrix[:, used].tocsr(), self.vocabulary[used])
+
+
+def build_doc_terms(texts):
+    """
+    Tokenize ``texts`` once; the vocabulary is every non-stopword token, sorted.
+    """
+    tokens = [tokenize(text) for text in texts]
+    vocabulary = sorted(set().union(*tokens) - STOPWORDS_NORMALIZED)
+    term_index = {w: i for i, w in enumerate(vocabulary)}
+    indptr = np.cumsum([0] + [len(t) for t in tokens])
+    codes = np.fromiter(
+        (term_index.get(w, -1) for doc in tokens for w in doc), dtype=np.int64, count=int(indptr[-1])
+    )
+    rows = np.repeat(np.arange(len(tokens)), np.diff(indptr))
+    keep = codes >= 0
+    matrix = sparse.csr_matrix(
+        (np.ones(int(keep.sum()), dtype=np.int32), (rows[keep], codes[keep])),
+        shape=(len(tokens), len(vocabulary)),
+    )
+    return DocTerms(matrix, np.asarray(vocabulary, dtype=object))
+
+
+# -------------------------
+# Cache
+# -------------------------
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_key(view):
+    metadata = ingest.table_metadata(view)
+    return f"{view}-v{PREPROCESS_VERSION}-{metadata['digest'][:16]}-{_stopwords_digest()}"
+
+
+def load_doc_terms(view, root=DOC_TERMS_DIR):
+    """
+    Document-term matrix of the ingested ``view`` table (rows in table order),
+    from memory, from disk, or built and saved on first use.
+    """
+    key = _cache_key(view)
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+        path = Path(root) / f"{key}.npz"
+        if path.exists():
+            with np.load(path, allow_pickle=False) as d:
+                matrix = sparse.csr_matrix((d["data"], d["indices"], d["indptr"]), shape=tuple(d["shape"]))
+                doc_terms = DocTerms(matrix, d["vocabulary"].astype(object))
+        else:
+            texts = ingest.load_table(view, [TEXT_COLUMNS[view]])[TEXT_COLUMNS[view]]
+            doc_terms = build_doc_terms(texts.tolist())
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                for stale in path.parent.glob(f"{view}-*.npz"):
+                    stale.unlink(missing_ok=True)
+                m = doc_terms.matrix
+                tmp = path.with_suffix(".tmp.npz")
+                np.savez(tmp, data=m.data, indices=m.indices, indptr=m.indptr, shape=m.shape,
+                         vocabulary=doc_terms.vocabulary.astype(str))
+                os.replace(tmp, path)
+            except OSError:
+                pass
+        _cache[key] = doc_terms
+        return doc_terms
+
+
+# -------------------------
+# BERTopic
+# -------------------------
+def document_ids(n_docs):
+    """
+    Placeholder documents for BERTopic: each document is its row number.
+    """
+    return [str(i) for i in range(n_docs)]
+
+
+class DocTermVectorizer:
+    """
+    Drop-in for BERTopic's ``vectorizer_model`` over a precomputed DocTerms.
+
+    BERTopic joins the documents of each topic and vectorizes the joined
+    strings. Fitted with ``document_ids`` as documents, each joined string
+    is a list of row numbers, so "vectorizing" it sums those rows of the
+    cached matrix: no tokenization happens during the fit.
+    """
+
+    def __init__(self, doc_terms):
+        self.doc_terms = doc_terms
+
+    def fit(self, documents, y=None):
+        return self
+
+    def transform(self, documents):
+        matrix = self.doc_terms.matrix
+        rows = [np.array(doc.split(), dtype=np.int64) for doc in documents]
+        indicator = sparse.csr_matrix(
+            (np.ones(sum(len(r) for r in rows)), np.concatenate(rows) if rows else [],
+             np.cumsum([0] + [len(r) for r in rows])),
+            shape=(len(rows), matrix.shape[0]),
+        )
+        return (indicator @ matrix).tocsr()
+
+    def fit_transform(self, documents, y=None):
+        return self.fit(documents).transform(documents)
+
+    def get_feature_names_out(self):
+        return self.doc_terms.vocabulary
+
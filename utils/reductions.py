@@ -0,0 +1,67 @@
+"""
+Dimensionality reductions computed once per dataset.
+
+BERTopic reduces the embeddings with UMAP before clustering, and
+``visualize_document_datamap`` runs a second UMAP down to 2D. Both
+reductions are computed here once, cached next to the data in
+``public/.reductions/`` (keyed by a digest of the embedding rows), and
+passed to the fit (as precomputed embeddings behind BERTopic's
+``BaseDimensionalityReduction``) and to the datamap (``reduced_embeddings``).
+"""
+import hashlib
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+REDUCTIONS_DIR = Path(os.environ.get("TOPIC_REDUCTIONS_DIR", "public/.reductions"))
+
+# BERTopic's default umap_model, used before clustering
+CLUSTER_UMAP_PARAMS = dict(n_neighbors=15, n_components=5, min_dist=0.0, metric="cosine", low_memory=False)
+# Same settings BERTopic uses for the 2D layout of visualize_document_datamap
+# (bertopic/plotting/_datamap.py)
+DATAMAP_UMAP_PARAMS = dict(n_neighbors=15, n_components=2, min_dist=0.15, metric="cosine")
+
+
+@dataclass
+class Reductions:
+    cluster: np.ndarray   # clustering space (n, 5)
+    layout: np.ndarray    # datamap coordinates (n, 2)
+
+
+def embeddings_digest(embeddings):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    # the UMAP settings are part of the key: changing them invalidates the cache
+    h = hashlib.sha256(f"{embeddings.shape}:{sorted(CLUSTER_UMAP_PARAMS.items())}:"
+                       f"{sorted(DATAMAP_UMAP_PARAMS.items())}".encode())
+    h.update(embeddings.tobytes())
+    return h.hexdigest()[:16]
+
+
+def compute_reductions(embeddings):
+    from umap import UMAP
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    cluster = UMAP(**CLUSTER_UMAP_PARAMS).fit_transform(embeddings)
+    layout = UMAP(**DATAMAP_UMAP_PARAMS).fit_transform(embeddings)
+    return Reductions(cluster.astype(np.float32), layout.astype(np.float32))
+
+
+def load_reductions(view, embeddings, root=REDUCTIONS_DIR):
+    """
+    Cached reductions of ``embeddings`` (computed and saved on first use).
+    """
+    path = Path(root) / f"{view}-{embeddings_digest(embeddings)}.npz"
+    if path.exists():
+        with np.load(path) as data:
+            return Reductions(data["cluster"], data["layout"])
+    reductions = compute_reductions(embeddings)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, cluster=reductions.cluster, layout=reductions.layout)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return reductions
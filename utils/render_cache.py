@@ -0,0 +1,162 @@
+"""
+Cache for the rendered datamap HTML.
+
+The interactive datamap is a large self-contained HTML string that only
+depends on the topic assignments, labels, 2D layout, hover texts and
+display options. It is cached in memory (LRU, bounded by total size) and on
+disk, so Streamlit reruns and new sessions serve the cached copy instead of
+rendering it again.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from . import metrics
+
+RENDER_CACHE_DIR = Path(os.environ.get("TOPIC_RENDER_CACHE_DIR", ".cache/datamaps"))
+MAX_MEMORY_BYTES = 256 * 1024 * 1024
+MAX_DISK_BYTES = 1024 * 1024 * 1024
+
+
+def _update(h, part):
+    if part is None:
+        h.update(b"\x00")
+    elif isinstance(part, np.ndarray):
+        part = np.ascontiguousarray(part)
+        h.update(f"nd:{part.dtype.str}:{part.shape}".encode())
+        h.update(part.tobytes())
+    elif isinstance(part, (list, tuple)):
+        h.update(f"seq:{len(part)}".encode())
+        for item in part:
+            _update(h, item)
+    elif isinstance(part, dict):
+        h.update(json.dumps(part, sort_keys=True, default=str, ensure_ascii=False).encode())
+    else:
+        h.update(f"{type(part).__name__}:{part}".encode())
+    h.update(b"\x1f")
+
+
+def render_key(*parts):
+    """
+    Stable digest of everything the rendered HTML depends on.
+    Accepts strings, numbers, numpy arrays, lists/tuples and JSON-able dicts.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+
+class RenderCache:
+    """
+    Two-level cache: in-memory LRU bounded by ``max_bytes``, backed by one
+    HTML file per key in ``cache_dir`` (pruned oldest-first above ``max_disk_bytes``).
+    """
+
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, max_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES):
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.html"
+
+    def _remember(self, key, html):
+        size = len(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = html
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                return html
+        if self.cache_dir is None:
+            return None
+        try:
+            html = self._path(key).read_text(encoding="utf-8")
+        except OSError:
+            return None
+        self._remember(key, html)
+        return html
+
+    def put(self, key, html):
+        self._remember(key, html)
+        if self.cache_dir is None:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._path(key).with_suffix(".tmp")
+            tmp.write_text(html, encoding="utf-8")
+            os.replace(tmp, self._path(key))
+            self._prune_disk()
+        except OSError:
+            # read-only deployments still get the in-memory cache
+            pass
+
+    def _prune_disk(self):
+        files = sorted(self.cache_dir.glob("*.html"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in files)
+        for path in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+    def get_or_render(self, key, render):
+        """
+        Return the cached HTML for ``key``, calling ``render()`` at most once per
+        key even when several sessions ask for it at the same time.
+        """
+        html = self.get(key)
+        if html is not None:
+            metrics.count("render_cache.hit")
+            return html
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                html = self.get(key)
+                if html is None:
+                    metrics.count("render_cache.miss")
+                    html = str(render())
+                    self.put(key, html)
+                else:
+                    metrics.count("render_cache.hit")
+        finally:
+            # also when render() raises, so failed keys do not accumulate
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return html
+
+
+_default_cache = None
+
+
+def get_render_cache():
+    """
+    Process-wide cache shared by every Streamlit session.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RenderCache()
+    return _default_cache
@@ -0,0 +1,338 @@
+"""
+Local async HTTP service over the topic views.
+
+Serves the same data as the Streamlit pages (ingested tables, embedding
+stores, prebuilt artifacts or a fit) to downstream jobs:
+
+    GET  /views/<view>/topics                 topics with their label and size
+    GET  /views/<view>/topics/<topic>?limit=  one topic and its documents closest to the centroid
+    GET  /views/<view>/documents/<row>        topic of a document (row = embedding row)
+    POST /views/<view>/search                 {"text": ... | "row": ..., "k": 10}
+    POST /views/<view>/assign                 {"texts": [...]}
+    GET  /metrics                             Prometheus text (utils.metrics)
+
+Texts are embedded with the encoder recorded for the view's embeddings
+(utils.encode) and assigned to the nearest topic centroid (utils.online);
+a view whose embeddings have no usable encoder (e.g. the prebuilt
+keyword matrix) only answers topic, document and row-search queries. Concurrent
+search and assign requests are micro-batched: requests arriving within
+``--max-wait-ms`` of each other (up to ``--max-batch`` texts) are encoded
+and scored in one vectorized call, run off the event loop.
+
+    python -m utils.service --port 8601
+    python -m utils.loadtest --url http://localhost:8601 --endpoint assign
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from . import artifacts, encode, metrics, modeling, preprocess
+from .datasets import EMBEDDINGS_PATHS, load_dataset
+from .online import OnlineTopicModel
+from .similarity import SimilarityIndex
+
+DEFAULT_PORT = 8601
+MAX_BATCH = 64
+MAX_WAIT_MS = 5
+MAX_K = 100
+MAX_TEXTS = 1000
+
+# text column of each view (see utils.ingest)
+TEXT_COLUMNS = preprocess.TEXT_COLUMNS
+
+
+# -------------------------
+# Loaded views
+# -------------------------
+class ServiceView:
+    """
+    Documents, topics, labels, centroids, similarity index and encoder of one view.
+    """
+
+    def __init__(self, name, rows, docs, embeddings, built, encoder, doc_terms=None):
+        self.name = name
+        self.rows = np.asarray(rows)                # embedding rows of the documents
+        self.positions = {int(r): i for i, r in enumerate(self.rows)}
+        self.docs = docs
+        self.topics = np.asarray(built.topics)
+        self.labels = built.labels
+        self.version = built.version
+        self.state = OnlineTopicModel.from_fit(embeddings, self.topics, docs, doc_terms)
+        self.index = SimilarityIndex(embeddings)
+        self.encoder = encoder
+
+    def label(self, topic):
+        return "Unlabelled" if topic == -1 else self.labels.get(int(topic), f"Topic {topic}")
+
+    def document(self, position, score=None):
+        out = {"row": int(self.rows[position]), "text": self.docs[position],
+               "topic": int(self.topics[position]), "label": self.label(self.topics[position])}
+        if score is not None:
+            out["score"] = round(float(score), 4)
+        return out
+
+    def topic_table(self):
+        topic_ids, counts = np.unique(self.topics, return_counts=True)
+        return [{"topic": int(t), "label": self.label(t), "size": int(n)} for t, n in zip(topic_ids, counts)]
+
+    def topic_documents(self, topic, limit):
+        members = np.flatnonzero(self.topics == topic)
+        if len(members) == 0:
+            return None
+        centroid = self.state.centroids[np.searchsorted(self.state.topic_ids, topic)]
+        sims = self.index.vectors_of(members) @ centroid
+        order = np.argsort(-sims)[:limit]
+        return [self.document(members[i], sims[i]) for i in order]
+
+    # batched calls (one per micro-batch)
+    def assign(self, texts):
+        topics, distances = self.state.assign(self.encoder.encode(texts))
+        return [{"topic": int(t), "label": self.label(t), "distance": round(float(d), 4)}
+                for t, d in zip(topics, distances)]
+
+    def search(self, queries):
+        """
+        ``queries`` are ``(text, k)`` pairs, searched with the largest k.
+        """
+        texts, ks = zip(*queries)
+        idx, scores = self.index.search(self.encoder.encode(texts), max(ks))
+        return [[self.document(i, s) for i, s in zip(row_idx[:k], row_scores[:k]) if i >= 0]
+                for row_idx, row_scores, k in zip(idx, scores, ks)]
+
+
+def load_view(name):
+    """
+    Service view of ``name``: prebuilt artifacts if up to date, else a fit
+    (as the pages do).
+    """
+    dataset = load_dataset(name)
+    table = dataset.table
+    if name == "keywords":
+        table = table[table["count"] >= modeling.MIN_FREQ]
+        doc_terms = artifacts.keywords_doc_terms()
+    else:
+        doc_terms = preprocess.load_doc_terms(name)
+    docs = table[TEXT_COLUMNS[name]].tolist()
+    embeddings = dataset.embeddings[table.index.to_numpy()]
+    built = artifacts.load_artifacts(name)
+    if built is None or len(built.topics) != len(docs):
+        built = artifacts.build_view(name)
+    try:
+        encoder = encode.encoder_for(EMBEDDINGS_PATHS[name])
+    except (OSError, ValueError):
+        encoder = None
+    return ServiceView(name, table.index.to_numpy(), docs, embeddings, built, encoder, doc_terms)
+
+
+# -------------------------
+# Micro-batching
+# -------------------------
+class MicroBatcher:
+    """
+    Groups concurrent calls into one ``fn(items)`` call (a list of results,
+    one per item) run in ``executor``: a batch is sent once it holds
+    ``max_batch`` items or ``max_wait`` seconds after its first request.
+    """
+
+    def __init__(self, name, fn, executor, max_batch=MAX_BATCH, max_wait=MAX_WAIT_MS / 1000):
+        self.name = name
+        self.fn = fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []   # (items, future)
+        self._n_items = 0
+        self._timer = None
+
+    async def submit(self, items):
+        """
+        Results of ``items``, computed with whatever else arrives meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((items, future))
+        self._n_items += len(items)
+        if self._n_items >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._n_items = self._pending, [], 0
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        items = [item for request, _ in batch for item in request]
+        metrics.count(f"service.{self.name}.batches")
+        metrics.count(f"service.{self.name}.items", len(items))
+        start = time.perf_counter()
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        metrics.observe(f"service.{self.name}.batch", time.perf_counter() - start)
+        offset = 0
+        for request, future in batch:
+            if not future.done():
+                future.set_result(results[offset:offset + len(request)])
+            offset += len(request)
+
+
+# -------------------------
+# HTTP
+# -------------------------
+def make_app(views, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+    import tornado.web
+
+    # one worker: batches run one after the other, each using the BLAS threads
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="topic-service")
+    batchers = {}
+    for name, view in views.items():
+        batchers[name, "assign"] = MicroBatcher(f"{name}.assign", view.assign, executor, max_batch, max_wait_ms / 1000)
+        batchers[name, "search"] = MicroBatcher(f"{name}.search", view.search, executor, max_batch, max_wait_ms / 1000)
+
+    class BaseHandler(tornado.web.RequestHandler):
+        def view(self, name, encode=False):
+            if name not in views:
+                raise tornado.web.HTTPError(404, reason=f"unknown view {name!r}")
+            if encode and views[name].encoder is None:
+                raise tornado.web.HTTPError(503, reason=f"no encoder recorded for the {name} embeddings")
+            return views[name]
+
+        def body(self):
+            try:
+                body = json.loads(self.request.body or b"{}")
+            except ValueError:
+                raise tornado.web.HTTPError(400, reason="invalid JSON body")
+            if not isinstance(body, dict):
+                raise tornado.web.HTTPError(400, reason="expected a JSON object")
+            return body
+
+        def integer(self, value, name, low=1, high=None):
+            """
+            ``value`` (JSON number or query string) as an integer >= ``low``,
+            capped at ``high``; a 400 otherwise.
+            """
+            if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+                value = int(value)
+            if isinstance(value, bool) or not isinstance(value, int) or value < low:
+                raise tornado.web.HTTPError(400, reason=f"'{name}' must be an integer >= {low}")
+            return value if high is None else min(value, high)
+
+        def write_json(self, payload):
+            self.set_header("Content-Type", "application/json; charset=utf-8")
+            self.finish(json.dumps(payload, ensure_ascii=False))
+
+        def write_error(self, status_code, **kwargs):
+            self.write_json({"error": self._reason})
+
+    class TopicsHandler(BaseHandler):
+        def get(self, name):
+            view = self.view(name)
+            self.write_json({"view": name, "version": view.version, "topics": view.topic_table()})
+
+    class TopicHandler(BaseHandler):
+        def get(self, name, topic):
+            view = self.view(name)
+            limit = self.integer(self.get_argument("limit", "10"), "limit", high=MAX_K)
+            documents = view.topic_documents(int(topic), limit)
+            if documents is None:
+                raise tornado.web.HTTPError(404, reason=f"unknown topic {topic}")
+            size = int(np.sum(view.topics == int(topic)))
+            self.write_json({"topic": int(topic), "label": view.label(int(topic)), "size": size,
+                             "documents": documents})
+
+    class DocumentHandler(BaseHandler):
+        def get(self, name, row):
+            view = self.view(name)
+            position = view.positions.get(int(row))
+            if position is None:
+                raise tornado.web.HTTPError(404, reason=f"unknown row {row}")
+            self.write_json(view.document(position))
+
+    class SearchHandler(BaseHandler):
+        async def post(self, name):
+            view = self.view(name)
+            body = self.body()
+            k = self.integer(body.get("k", 10), "k", high=MAX_K)
+            if "row" in body:
+                position = view.positions.get(self.integer(body["row"], "row", low=0))
+                if position is None:
+                    raise tornado.web.HTTPError(404, reason=f"unknown row {body['row']}")
+                idx, scores = view.index.most_similar(position, k)
+                self.write_json({"results": [view.document(i, s) for i, s in zip(idx, scores)]})
+                return
+            if not isinstance(body.get("text"), str):
+                raise tornado.web.HTTPError(400, reason="expected 'text' (string) or 'row'")
+            self.view(name, encode=True)
+            (results,) = await batchers[name, "search"].submit([(body["text"], k)])
+            self.write_json({"results": results})
+
+    class AssignHandler(BaseHandler):
+        async def post(self, name):
+            self.view(name, encode=True)
+            texts = self.body().get("texts")
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise tornado.web.HTTPError(400, reason="expected 'texts' (list of strings)")
+            if len(texts) > MAX_TEXTS:
+                raise tornado.web.HTTPError(413, reason=f"at most {MAX_TEXTS} texts per request")
+            self.write_json({"results": await batchers[name, "assign"].submit(texts) if texts else []})
+
+    class MetricsHandler(tornado.web.RequestHandler):
+        def get(self):
+            self.set_header("Content-Type", "text/plain; version=0.0.4")
+            self.finish(metrics.prometheus_text())
+
+    return tornado.web.Application([
+        (r"/views/(\w+)/topics", TopicsHandler),
+        (r"/views/(\w+)/topics/(-?\d+)", TopicHandler),
+        (r"/views/(\w+)/documents/(\d+)", DocumentHandler),
+        (r"/views/(\w+)/search", SearchHandler),
+        (r"/views/(\w+)/assign", AssignHandler),
+        (r"/metrics", MetricsHandler),
+    ])
+
+
+async def serve(views, host="127.0.0.1", port=DEFAULT_PORT, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+    app = make_app(views, max_batch, max_wait_ms)
+    app.listen(port, address=host)
+    print(f"Serving {', '.join(views)} on http://{host}:{port}")
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve topics, search and assignment over HTTP.")
+    parser.add_argument("views", nargs="*", help=f"views among {', '.join(artifacts.VIEWS)} (default: all)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="texts per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS,
+                        help="how long a micro-batch waits for more requests")
+    args = parser.parse_args(argv)
+    unknown = set(args.views) - set(artifacts.VIEWS)
+    if unknown:
+        parser.error(f"unknown views: {', '.join(sorted(unknown))}")
+
+    views = {}
+    for name in args.views or artifacts.VIEWS:
+        start = time.perf_counter()
+        views[name] = load_view(name)
+        print(f"[{name}] {len(views[name].docs)} documents loaded in {time.perf_counter() - start:.1f}s "
+              f"({views[name].version}{'' if views[name].encoder else ', no encoder: text queries disabled'})")
+    asyncio.run(serve(views, args.host, args.port, args.max_batch, args.max_wait_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Top-k cosine similarity index over keyword / review embeddings.
+
+Embeddings are normalized once, so a query is a matrix product followed by
+an ``argpartition`` (no full sort, no per-query ``cosine_similarity`` over
+the whole matrix). For large corpora an optional IVF coarse quantizer
+(spherical k-means, pure NumPy) restricts each query to the ``n_probe``
+closest lists.
+
+    python -m utils.similarity keywords chambre
+    python -m utils.similarity sentences --bench 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+# Above this many vectors an IVF quantizer is built automatically
+IVF_MIN_SIZE = 50_000
+N_PROBE = 8
+BLOCK_SIZE = 65536
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _top_k(scores, k):
+    """
+    Indices and values of the k largest scores of every row, best first.
+    """
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=10, sample_size=None, seed=42):
+    """
+    K-means on the unit sphere (assignment by dot product), trained on a sample.
+    Returns normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = sample_size or min(len(vectors), 64 * n_clusters)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)] if sample_size < len(vectors) else vectors
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.concatenate([
+            (sample[s:s + BLOCK_SIZE] @ centroids.T).argmax(axis=1)
+            for s in range(0, len(sample), BLOCK_SIZE)
+        ])
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        empty = np.bincount(assign, minlength=n_clusters) == 0
+        # re-seed empty lists on random sample points
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class SimilarityIndex:
+    """
+    Exact (flat) or IVF cosine top-k search over a fixed set of vectors.
+    """
+
+    def __init__(self, embeddings, n_lists=None, seed=42):
+        vectors = _normalize(embeddings)
+        if n_lists is None and len(vectors) >= IVF_MIN_SIZE:
+            n_lists = int(np.sqrt(len(vectors)))
+        self.n_lists = n_lists
+        self.centroids = None
+        if n_lists:
+            self.centroids = spherical_kmeans(vectors, n_lists, seed=seed)
+            assign = np.concatenate([
+                (vectors[s:s + BLOCK_SIZE] @ self.centroids.T).argmax(axis=1)
+                for s in range(0, len(vectors), BLOCK_SIZE)
+            ])
+            # store each list contiguously: ids[offsets[l]:offsets[l + 1]] are the rows of list l
+            self.ids = np.argsort(assign, kind="stable")
+            self.positions = np.empty_like(self.ids)
+            self.positions[self.ids] = np.arange(len(self.ids))
+            vectors = vectors[self.ids]
+            self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k=10, n_probe=N_PROBE):
+        """
+        Top-k rows for every query. Returns ``(indices, scores)`` of shape
+        (n_queries, k), best first; indices refer to the original embeddings.
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        if self.centroids is None:
+            return self._search_flat(queries, k)
+        return self._search_ivf(queries, k, n_probe)
+
+    def _search_flat(self, queries, k):
+        best_idx, best_scores = None, None
+        for start in range(0, len(self.vectors), BLOCK_SIZE):
+            idx, scores = _top_k(queries @ self.vectors[start:start + BLOCK_SIZE].T, k)
+            idx = idx + start
+            if best_idx is None:
+                best_idx, best_scores = idx, scores
+            else:
+                merged_idx = np.concatenate([best_idx, idx], axis=1)
+                order, best_scores = _top_k(np.concatenate([best_scores, scores], axis=1), k)
+                best_idx = np.take_along_axis(merged_idx, order, axis=1)
+        return best_idx, best_scores
+
+    def _search_ivf(self, queries, k, n_probe):
+        n_probe = min(n_probe, self.n_lists)
+        probes, _ = _top_k(queries @ self.centroids.T, n_probe)
+        out_idx = np.full((len(queries), k), -1, dtype=np.int64)
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for q, lists in enumerate(probes):
+            rows = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if len(rows) == 0:
+                continue
+            idx, scores = _top_k(queries[q:q + 1] @ self.vectors[rows].T, k)
+            out_idx[q, :idx.shape[1]] = self.ids[rows[idx[0]]]
+            out_scores[q, :idx.shape[1]] = scores[0]
+        return out_idx, out_scores
+
+    def vectors_of(self, rows):
+        """
+        Normalized vectors of indexed rows (indices of the original embeddings).
+        """
+        rows = np.asarray(rows)
+        return self.vectors[rows if self.centroids is None else self.positions[rows]]
+
+    def most_similar(self, row, k=10, n_probe=N_PROBE):
+        """
+        Top-k neighbours of an indexed row, excluding the row itself (fewer
+        than k if the probed IVF lists hold fewer rows).
+        """
+        position = row if self.centroids is None else self.positions[row]
+        idx, scores = self.search(self.vectors[position], k + 1, n_probe)
+        # IVF pads missing results with -1 / -inf
+        keep = (idx[0] != row) & (idx[0] >= 0)
+        return idx[0][keep][:k], scores[0][keep][:k]
+
+
+def main(argv=None):
+    from . import ingest, modeling
+    from .embeddings import get_store
+
+    parser = argparse.ArgumentParser(description="Query or benchmark the similarity index.")
+    parser.add_argument("view", choices=["keywords", "sentences"])
+    parser.add_argument("query", nargs="?", help="keyword (keywords view) or row number (sentences view)")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--bench", type=int, metavar="N", help="time single queries on N synthetic vectors")
+    args = parser.parse_args(argv)
+
+    if args.view == "keywords":
+        table = ingest.load_table("keywords", ["item"])
+        items = table["item"].tolist()
+        embeddings = get_store(modeling.KEYWORDS_EMBEDDINGS_PATH)[table.index.to_numpy()]
+    else:
+        table = ingest.load_table("sentences", ["text"])
+        items = table["text"].tolist()
+        embeddings = get_store(modeling.SENTENCES_EMBEDDINGS_PATH)[table.index.to_numpy()]
+
+    if args.bench:
+        rng = np.random.default_rng(0)
+        base = embeddings[rng.integers(0, len(embeddings), args.bench)]
+        synthetic = base + 0.05 * rng.standard_normal(base.shape).astype(np.float32)
+        start = time.perf_counter()
+        index = SimilarityIndex(synthetic)
+        print(f"built {index.n_lists or 'flat'} lists over {len(index)} vectors in {time.perf_counter() - start:.1f} s")
+        queries = synthetic[rng.integers(0, len(synthetic), 200)]
+        latencies = []
+        for q in queries:
+            start = time.perf_counter()
+            index.search(q, args.k)
+            latencies.append(time.perf_counter() - start)
+        print(f"p50 {np.percentile(latencies, 50) * 1e3:.2f} ms, p99 {np.percentile(latencies, 99) * 1e3:.2f} ms")
+        return
+
+    index = SimilarityIndex(embeddings)
+    row = items.index(args.query) if args.view == "keywords" else int(args.query)
+    for i, score in zip(*index.most_similar(row, args.k)):
+        print(f"{score:.4f}  {items[i]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Parallel evaluation grid over the number of topics and the frequency filter.
+
+Every (K, min_freq) configuration is clustered with KMeans in a process
+pool, on the cached clustering-space UMAP reduction (see utils.reductions),
+and scored with:
+
+    silhouette        higher is better (computed on a sample above 10k rows)
+    davies_bouldin    lower is better
+    coherence         keywords: mean pairwise cosine of each topic's top keywords
+                      reviews:  NPMI of each topic's top c-TF-IDF words
+
+Results, topic assignments, labels and datamap layouts are persisted so the
+app can switch between configurations without fitting anything:
+
+    python -m utils.sweep keywords --k 5 10 20 30 40 50 --min-freq 1 2 5 10
+    python -m utils.sweep sentences --k 10 20 30 40 50
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from . import artifacts, ingest, modeling, preprocess, topic_summary
+from .embeddings import get_store
+from .online import c_tf_idf, topic_indicator
+from .reductions import load_reductions
+
+SWEEP_DIR = artifacts.ARTIFACTS_DIR / "sweeps"
+DEFAULT_K_GRID = (5, 10, 15, 20, 25, 30, 40, 50)
+DEFAULT_MIN_FREQ_GRID = (1, 2, 5, 10, 20)
+N_COHERENCE_WORDS = 10
+SILHOUETTE_SAMPLE = 10_000
+
+
+# -------------------------
+# Coherence
+# -------------------------
+def embedding_coherence(embeddings, topics, weights, n_words=N_COHERENCE_WORDS):
+    """
+    Mean pairwise cosine similarity between the ``n_words`` heaviest members of each topic.
+    """
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    scores = []
+    for t in np.unique(topics):
+        members = np.flatnonzero(topics == t)
+        top = members[np.argsort(-np.asarray(weights)[members], kind="stable")[:n_words]]
+        if len(top) < 2:
+            continue
+        sims = embeddings[top] @ embeddings[top].T
+        scores.append((sims.sum() - len(top)) / (len(top) * (len(top) - 1)))
+    return float(np.mean(scores)) if scores else 0.0
+
+
+def npmi_coherence(doc_terms, top_words):
+    """
+    Mean NPMI over the word pairs of each topic, from document co-occurrence
+    in a (n_docs, n_terms) matrix. ``top_words`` is a list of term index arrays.
+    """
+    presence = (doc_terms > 0).astype(np.float64).tocsc()
+    n_docs = presence.shape[0]
+    scores = []
+    for words in top_words:
+        if len(words) < 2:
+            continue
+        sub = presence[:, words]
+        joint = (sub.T @ sub).toarray() / n_docs
+        p = np.diag(joint)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pmi = np.log(joint / np.outer(p, p))
+            npmi = pmi / -np.log(joint)
+        npmi[joint == 0] = -1.0
+        npmi[np.isclose(joint, 1.0)] = 1.0
+        upper = np.triu_indices(len(words), 1)
+        scores.append(np.nanmean(npmi[upper]))
+    return float(np.mean(scores)) if scores else 0.0
+
+
+# -------------------------
+# Worker side
+# -------------------------
+_datasets = None
+
+
+def _init_worker(datasets):
+    global _datasets
+    _datasets = datasets
+
+
+def _fit_config(view, n_topics, min_freq):
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import davies_bouldin_score, silhouette_score
+
+    data = _datasets[min_freq]
+    cluster = data["cluster"]
+    topics = KMeans(n_clusters=n_topics, random_state=42).fit_predict(cluster)
+    silhouette = silhouette_score(
+        cluster, topics, sample_size=min(len(cluster), SILHOUETTE_SAMPLE), random_state=42
+    )
+    davies_bouldin = davies_bouldin_score(cluster, topics)
+
+    if view == "keywords":
+        labels = topic_summary.keyword_labels(data["keywords"], data["freqs"], topics)
+        coherence = embedding_coherence(data["embeddings"], topics, data["freqs"])
+    else:
+        topic_ids, codes = topic_summary.topic_codes(topics)
+        scores = c_tf_idf(topic_indicator(codes, len(topic_ids)) @ data["doc_terms"])
+        labels = topic_summary.labels_from_matrix(scores, data["vocabulary"], topic_ids)
+        top_words = [
+            np.array([data["term_index"][w] for w, _ in row])
+            for row in topic_summary.top_terms(scores, data["vocabulary"], N_COHERENCE_WORDS)
+        ]
+        coherence = npmi_coherence(data["doc_terms"], top_words)
+
+    return {
+        "n_topics": n_topics,
+        "min_freq": min_freq,
+        "silhouette": float(silhouette),
+        "davies_bouldin": float(davies_bouldin),
+        "coherence": coherence,
+        "labels": {str(k): v for k, v in labels.items()},
+    }, topics.astype(np.int32)
+
+
+# -------------------------
+# Driver
+# -------------------------
+def _config_key(n_topics, min_freq):
+    return f"k{n_topics}_f{min_freq}"
+
+
+def _prepare_keywords(min_freq_grid):
+    keywords_df = ingest.load_table("keywords", ["item", "count"])
+    store = get_store(modeling.KEYWORDS_EMBEDDINGS_PATH)
+    datasets = {}
+    for min_freq in min_freq_grid:
+        df_filtered = keywords_df[keywords_df['count'] >= min_freq]
+        embeddings = store[df_filtered.index.to_numpy()]
+        reduced = load_reductions("keywords", embeddings)
+        datasets[min_freq] = {
+            "cluster": reduced.cluster,
+            "layout": reduced.layout,
+            "embeddings": embeddings,
+            "keywords": df_filtered['item'].tolist(),
+            "freqs": df_filtered['count'].to_numpy(),
+        }
+    return datasets
+
+
+def _prepare_sentences():
+    sentences_df = ingest.load_table("sentences", [])
+    embeddings = get_store(modeling.SENTENCES_EMBEDDINGS_PATH)[sentences_df.index.to_numpy()]
+    reduced = load_reductions("sentences", embeddings)
+    doc_terms = preprocess.load_doc_terms("sentences")
+    # min_freq does not apply to reviews: a single dataset under key 1
+    return {1: {
+        "cluster": reduced.cluster,
+        "layout": reduced.layout,
+        "doc_terms": doc_terms.matrix,
+        "vocabulary": doc_terms.vocabulary,
+        "term_index": doc_terms.term_index,
+    }}
+
+
+def run_sweep(view, k_grid=DEFAULT_K_GRID, min_freq_grid=DEFAULT_MIN_FREQ_GRID, max_workers=None, root=SWEEP_DIR):
+    """
+    Fit every configuration of the grid in a process pool and persist the results.
+    """
+    if view == "keywords":
+        datasets = _prepare_keywords(min_freq_grid)
+    elif view == "sentences":
+        datasets = _prepare_sentences()
+        min_freq_grid = (1,)
+    else:
+        raise ValueError(f"Unknown view: {view!r}")
+
+    configs = [
+        (n_topics, min_freq) for min_freq in min_freq_grid for n_topics in k_grid
+        if n_topics < len(datasets[min_freq]["cluster"])
+    ]
+    runs, assignments = [], {}
+    # spawn, not fork: the UMAP reductions above leave numba/OpenMP threads in
+    # this process, and a forked pool then never shuts down
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(datasets,)) as pool:
+        futures = [pool.submit(_fit_config, view, n_topics, min_freq) for n_topics, min_freq in configs]
+        for future in futures:
+            run, topics = future.result()
+            key = _config_key(run["n_topics"], run["min_freq"])
+            run["key"] = key
+            runs.append(run)
+            assignments[key] = topics
+    for min_freq, data in datasets.items():
+        assignments[f"layout_f{min_freq}"] = data["layout"]
+
+    out_dir = Path(root) / view
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.savez(out_dir / "assignments.npz", **assignments)
+    sources = artifacts.source_fingerprints(view)
+    with open(out_dir / "results.json", "w", encoding="utf-8") as f:
+        json.dump({"view": view, "sources": sources, "runs": runs}, f, ensure_ascii=False, indent=2)
+    return runs
+
+
+# -------------------------
+# App side
+# -------------------------
+class SweepResults:
+    """
+    Persisted sweep of one view: metrics table and per-configuration assignments.
+    """
+
+    def __init__(self, runs, assignments, digest="in-memory"):
+        self.runs = runs
+        self._assignments = assignments
+        self.digest = digest    # content digest of the persisted files (see load_sweep)
+        self._by_key = {run["key"]: run for run in runs}
+
+    def table(self):
+        return pd.DataFrame(
+            [{k: v for k, v in run.items() if k not in ("labels", "key")} for run in self.runs]
+        ).sort_values(["min_freq", "n_topics"]).reset_index(drop=True)
+
+    def n_topics_values(self, min_freq=None):
+        """
+        Swept numbers of topics (for ``min_freq`` only, if given: the grid
+        skips K values above the number of rows left by the filter).
+        """
+        return sorted({run["n_topics"] for run in self.runs if min_freq in (None, run["min_freq"])})
+
+    def min_freq_values(self):
+        return sorted({run["min_freq"] for run in self.runs})
+
+    def get(self, n_topics, min_freq=1):
+        """
+        Assignments, labels and layout of a configuration (None if it was not swept).
+        """
+        run = self._by_key.get(_config_key(n_topics, min_freq))
+        if run is None:
+            return None
+        return artifacts.ViewArtifacts(
+            topics=self._assignments[run["key"]],
+            labels={int(k): v for k, v in run["labels"].items()},
+            coords=self._assignments[f"layout_f{min_freq}"],
+            # render caches key on the version: it must change with the sweep's content
+            version=f"sweep-{self.digest[:12]}-{run['key']}",
+        )
+
+
+def load_sweep(view, root=SWEEP_DIR):
+    """
+    Persisted sweep of ``view``, or None if missing or built from other data files.
+    """
+    out_dir = Path(root) / view
+    try:
+        with open(out_dir / "results.json", encoding="utf-8") as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not artifacts.sources_match(results, view):
+        return None
+    with np.load(out_dir / "assignments.npz") as data:
+        assignments = {name: data[name] for name in data.files}
+    digest = hashlib.sha256(
+        "".join(artifacts.file_digest(out_dir / name) for name in ("results.json", "assignments.npz")).encode()
+    ).hexdigest()
+    return SweepResults(results["runs"], assignments, digest)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit and score a grid of topic configurations.")
+    parser.add_argument("view", choices=artifacts.VIEWS)
+    parser.add_argument("--k", type=int, nargs="+", default=list(DEFAULT_K_GRID), help="numbers of topics")
+    parser.add_argument("--min-freq", type=int, nargs="+", default=list(DEFAULT_MIN_FREQ_GRID),
+                        help="keyword frequency thresholds (keywords view only)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    run_sweep(args.view, args.k, args.min_freq, max_workers=args.workers)
+    print(load_sweep(args.view).table().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
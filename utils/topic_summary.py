@@ -0,0 +1,115 @@
+"""
+Vectorized per-topic summaries.
+
+Topic-word weights are held in a sparse (n_topics, n_words) matrix built in
+one pass from integer topic / word codes, and sentiment counts come from a
+single ``np.bincount`` over combined (topic, sentiment) codes, so the cost
+stays linear in the corpus size without any per-word Python loop.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .utils import STOPWORDS
+
+N_LABEL_WORDS = 3
+
+
+def topic_codes(topics):
+    """
+    Sorted distinct topic ids and the position of each document's topic among them.
+    """
+    topic_ids, codes = np.unique(np.asarray(topics), return_inverse=True)
+    return topic_ids, codes
+
+
+def topic_term_matrix(codes, n_topics, term_codes, n_terms, weights=None):
+    """
+    Sparse (n_topics, n_terms) matrix summing ``weights`` (default 1) per (topic, term) pair.
+    """
+    if weights is None:
+        weights = np.ones(len(term_codes), dtype=np.float64)
+    matrix = sparse.coo_matrix(
+        (np.asarray(weights, dtype=np.float64), (np.asarray(codes), np.asarray(term_codes))),
+        shape=(n_topics, n_terms),
+    ).tocsr()
+    matrix.sort_indices()
+    return matrix
+
+
+def stopword_mask(vocabulary, stopwords=STOPWORDS):
+    """
+    Boolean mask of the vocabulary entries that are stopwords.
+    """
+    return np.isin(np.asarray(vocabulary, dtype=object), np.array(list(stopwords), dtype=object))
+
+
+def top_terms(matrix, vocabulary, n=N_LABEL_WORDS, exclude=None):
+    """
+    ``(word, score)`` pairs of the ``n`` best terms of every row, best first.
+    Ties keep vocabulary order; terms flagged in ``exclude`` are skipped.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    matrix.sort_indices()
+    vocabulary = np.asarray(vocabulary, dtype=object)
+    rows = []
+    for i in range(matrix.shape[0]):
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        indices, data = matrix.indices[start:end], matrix.data[start:end]
+        if exclude is not None:
+            keep = ~exclude[indices]
+            indices, data = indices[keep], data[keep]
+        best = np.argsort(-data, kind="stable")[:n]
+        rows.append(list(zip(vocabulary[indices[best]].tolist(), data[best].tolist())))
+    return rows
+
+
+def labels_from_matrix(matrix, vocabulary, topic_ids, n=N_LABEL_WORDS, exclude=None):
+    """
+    ``{topic id: 'w1 w2 w3'}`` from the best terms of each row.
+    """
+    return {
+        int(t): ' '.join(w for w, _ in words)
+        for t, words in zip(topic_ids, top_terms(matrix, vocabulary, n, exclude))
+    }
+
+
+def keyword_topic_words(keywords, freqs, topics):
+    """
+    Keyword frequencies per topic: ``(topic_ids, matrix, vocabulary)``.
+    """
+    topic_ids, codes = topic_codes(topics)
+    term_codes, vocabulary = pd.factorize(pd.Series(keywords, dtype=object))
+    matrix = topic_term_matrix(codes, len(topic_ids), term_codes, len(vocabulary), freqs)
+    return topic_ids, matrix, np.asarray(vocabulary, dtype=object)
+
+
+def keyword_labels(keywords, freqs, topics, n=N_LABEL_WORDS):
+    """
+    Keyword view labels: the ``n`` most frequent keywords of each topic.
+    """
+    topic_ids, matrix, vocabulary = keyword_topic_words(keywords, freqs, topics)
+    return labels_from_matrix(matrix, vocabulary, topic_ids, n)
+
+
+def ctfidf_labels(topic_model, n=N_LABEL_WORDS):
+    """
+    Review view labels: the ``n`` best non-stopword c-TF-IDF terms of each topic,
+    read directly from the fitted model's sparse c-TF-IDF matrix.
+    """
+    vocabulary = topic_model.vectorizer_model.get_feature_names_out()
+    topic_ids = np.array(sorted(topic_model.get_topics()))
+    return labels_from_matrix(topic_model.c_tf_idf_, vocabulary, topic_ids, n, exclude=stopword_mask(vocabulary))
+
+
+def sentiment_counts(topics, sentiments):
+    """
+    Number of documents per (topic, sentiment), as a topic x sentiment DataFrame.
+    """
+    topic_ids, codes = topic_codes(topics)
+    sentiment_codes, sentiment_values = pd.factorize(pd.Series(sentiments, dtype=object), sort=True)
+    counts = np.bincount(
+        codes * len(sentiment_values) + sentiment_codes,
+        minlength=len(topic_ids) * len(sentiment_values),
+    ).reshape(len(topic_ids), len(sentiment_values))
+    return pd.DataFrame(counts, index=pd.Index(topic_ids, name="topic"), columns=list(sentiment_values))